@@ -3,6 +3,7 @@
 
 import base64
 import json
+import multiprocessing
 import os
 import sys
 import threading
@@ -22,6 +23,7 @@ from data_structure.host_info import VoyagerConnectionStatus, HostInfo
 from event_emitter import ee
 from event_names import BotEvent
 from log_writer import LogWriter
+from utils.event_probe import probe_event_name
 from utils.localization import get_translated_text as _, select_locale
 from voyager_client import VoyagerClient
 from commands.voyager_command import VoyagerCommand
@@ -102,9 +104,16 @@ class VoyagerConnectionManager:
             # Empty message string, nothing to do
             return
 
-        message = json.loads(message_string)
         self.log_writer.write_line(message_string)
 
+        # Drop events nobody cares about (e.g. 'Polling') before paying for json decoding.
+        probed_event_name = probe_event_name(message_string)
+        if probed_event_name and not self.voyager_client.is_interested_in(probed_event_name):
+            self.voyager_client.drop_message(probed_event_name)
+            return
+
+        message = json.loads(message_string)
+
         if 'jsonrpc' in message:
             # some command finished, try to see if we have anything else.
             self.ongoing_command = None
@@ -197,6 +206,8 @@ class VoyagerConnectionManager:
 
 
 if __name__ == "__main__":
+    # Worker processes of image analysis re-run this module, in a frozen (pyinstaller) build too
+    multiprocessing.freeze_support()
     config_builder = ConfigBuilder(config_filename='config.yml')
 
     if validate_result := config_builder.validate():
@@ -37,6 +37,7 @@ class CursesManager:
         # status information used to update info
         self.last_error = LogMessageInfo()
         self.received_message_counter = 0
+        self.dropped_message_counter = 0
         self.host_info = HostInfo()
         self.log_queue = deque(maxlen=10)
         self.battery_percentage = 100
@@ -149,7 +150,8 @@ class CursesManager:
         line_pos += 1
 
         # Message Counter
-        counter_str = f'{self.received_message_counter} messages have been processed...'
+        counter_str = f'{self.received_message_counter} messages have been processed ' \
+                      f'({self.dropped_message_counter} skipped as uninteresting)...'
         self.stdscr.addstr(line_pos, 0, f'| {counter_str:116.116} |', self.normal_style)
         line_pos += 1
 
@@ -158,8 +160,9 @@ class CursesManager:
 
         self.stdscr.refresh()
 
-    def update_message_counter(self, counter_number: int = 0):
+    def update_message_counter(self, counter_number: int = 0, dropped_counter_number: int = 0):
         self.received_message_counter = counter_number
+        self.dropped_message_counter = dropped_counter_number
         self._update_whole_scr()
 
     def update_lass_error(self, error_info: LogMessageInfo = None):
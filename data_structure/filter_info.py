@@ -1,43 +1,59 @@
+from functools import lru_cache
+from typing import Dict, List
+
+from data_structure.slotted_dataclass import slotted_dataclass
+
+# Normalized filter name => names it's known as, extended by sequence_stats_config.filter_aliases
+FILTER_ALIASES = {
+    'Ha': ['H', 'Ha', 'H-Alpha'],
+    'SII': ['S', 'S2', 'SII', 'S-II'],
+    'OIII': ['O', 'O3', 'OIII', 'O-III'],
+    'L': ['L', 'Lum', 'Luminance'],
+    'R': ['R', 'Red'],
+    'G': ['G', 'Green'],
+    'B': ['B', 'Blue']
+}  # type: Dict[str, List[str]]
+
+# Upper cased alias => normalized filter name
+filter_mapping = {alias.upper(): filter_key for filter_key, aliases in FILTER_ALIASES.items()
+                  for alias in aliases}  # type: Dict[str, str]
+
+
+def register_filter_aliases(filter_aliases: Dict[str, List[str]]) -> None:
+    """
+    Adds aliases of filters, like {'Ha': ['Halpha', 'H-a']}. A filter which isn't known yet is added with its aliases.
+    """
+    for filter_key, aliases in filter_aliases.items():
+        known_aliases = FILTER_ALIASES.setdefault(filter_key, list())
+        for alias in [filter_key] + list(aliases):
+            alias = str(alias)
+            if alias not in known_aliases:
+                known_aliases.append(alias)
+            filter_mapping[alias.upper()] = filter_key
+    normalize_filter_name.cache_clear()
+
+
+@lru_cache(maxsize=256)
+def normalize_filter_name(value: str) -> str:
+    # Keep original filter name if no mapping can be found
+    return filter_mapping.get(value.upper(), 'UNKNOWN-' + value)
+
+
+@slotted_dataclass
 class ExposureInfo:
-    def __init__(self, filter_name: str = '', exposure_time: int = 0, hfd: float = 0, star_index: float = 0,
-                 timestamp: float = 0, sequence_target: str = '', seeing: float = 0):
-        self._filter_name = None
-        self.filter_name = filter_name
-        # exposure time in seconds
-        self.exposure_time = exposure_time
-        self.hfd = hfd
-        self.star_index = star_index
-        self.timestamp = timestamp
-        self.sequence_target = sequence_target
-        self.seeing = seeing
-
-    @property
-    def filter_name(self) -> str:
-        return self._filter_name
-
-    @filter_name.setter
-    def filter_name(self, value: str = 'L'):
-        filter_alias = {
-            'Ha': ['H', 'Ha', 'H-Alpha'],
-            'SII': ['S', 'S2', 'SII', 'S-II'],
-            'OIII': ['O', 'O3', 'OIII', 'O-III'],
-            'L': ['L', 'Lum', 'Luminance'],
-            'R': ['R', 'Red'],
-            'G': ['G', 'Green'],
-            'B': ['B', 'Blue']
-        }
-
-        filter_mapping = dict()
-        for filter_key in filter_alias:
-            for alias in filter_alias[filter_key]:
-                filter_mapping[alias.upper()] = filter_key
-
-        if value.upper() in filter_mapping:
-            self._filter_name = filter_mapping[value.upper()]
-        else:
-            # Keep original filter name if no mapping can be found
-            self._filter_name = 'UNKNOWN-' + value
-
-    @filter_name.deleter
-    def filter_name(self):
-        del self._filter_name
+    filter_name: str = ''
+    # exposure time in seconds
+    exposure_time: int = 0
+    hfd: float = 0
+    star_index: float = 0
+    timestamp: float = 0
+    sequence_target: str = ''
+    seeing: float = 0
+    # Measured by the bot from the fits file, see utils/image_analysis.py
+    fwhm: float = 0
+    eccentricity: float = 0
+    # File name without extension, which identifies the frame across voyager events and analysis results
+    file_identifier: str = ''
+
+    def __post_init__(self):
+        self.filter_name = normalize_filter_name(self.filter_name)
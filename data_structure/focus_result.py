@@ -1,11 +1,12 @@
-from dataclasses import dataclass
+from data_structure.slotted_dataclass import slotted_dataclass
 
 
-@dataclass
+@slotted_dataclass
 class FocusResult:
     filter_name: str = ''
     filter_color: str = '#ddd'
     hfd: float = 0
     timestamp: float = 0
     temperature: float = 0
-    recommended_index = 0
+    position: int = 0
+    recommended_index: float = 0
@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+
+from data_structure.special_battery_percentage import MemoryUsage
+
+MEMORY_USAGE_DTYPE = np.dtype([
+    ('timestamp', 'f8'),  # timestamp in seconds since epoch
+    ('voyager_vms', 'f4'),  # all memory values are in mega bytes
+    ('voyager_rss', 'f4'),
+    ('bot_vms', 'f4'),
+    ('bot_rss', 'f4'),
+    ('oom_observed', '?'),
+])
+
+
+class MemoryUsageRingBuffer:
+    """A fixed size ring buffer of memory usage records, backed by a structured numpy array."""
+
+    def __init__(self, capacity: int = 8640):
+        self.records = np.zeros(capacity, dtype=MEMORY_USAGE_DTYPE)
+        self.capacity = capacity
+        self.size = 0
+        self.next_index = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, record: tuple) -> None:
+        self.records[self.next_index] = record
+        self.next_index = (self.next_index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def snapshot(self) -> np.ndarray:
+        """
+        :return: A copy of all records, oldest first.
+        """
+        if self.size < self.capacity:
+            return self.records[:self.size].copy()
+        return np.concatenate((self.records[self.next_index:], self.records[:self.next_index]))
+
+
+class MemoryHistory:
+    """
+    Memory usage history with two tiers: recent samples at full resolution, and a downsampled tier for multi-day
+    history. Each downsampled record keeps the peak usages of 'downsample_factor' consecutive samples.
+    """
+
+    def __init__(self, capacity: int = 8640, downsample_factor: int = 30, long_term_capacity: int = 4032):
+        # Default: 1 data point for 10 sec duration => 1 day of recent usage, then 1 data point for 5 min => 2 weeks.
+        self.recent = MemoryUsageRingBuffer(capacity=capacity)
+        self.long_term = MemoryUsageRingBuffer(capacity=long_term_capacity)
+        self.downsample_factor = downsample_factor
+        self.pending = np.zeros(downsample_factor, dtype=MEMORY_USAGE_DTYPE)
+        self.pending_count = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.recent)
+
+    def append(self, memory_usage: MemoryUsage) -> None:
+        record = (memory_usage.timestamp, memory_usage.voyager_vms, memory_usage.voyager_rss,
+                  memory_usage.bot_vms, memory_usage.bot_rss, memory_usage.oom_observed)
+        with self.lock:
+            self.recent.append(record)
+            self.pending[self.pending_count] = record
+            self.pending_count += 1
+            if self.pending_count == self.downsample_factor:
+                self.long_term.append(self.downsample(self.pending))
+                self.pending_count = 0
+
+    @staticmethod
+    def downsample(records: np.ndarray) -> tuple:
+        return (records['timestamp'][0],
+                records['voyager_vms'].max(), records['voyager_rss'].max(),
+                records['bot_vms'].max(), records['bot_rss'].max(),
+                records['oom_observed'].any())
+
+    def series(self) -> np.ndarray:
+        """
+        :return: A structured array of memory usages, oldest first. Downsampled records are only used for the period
+        which is not covered by recent samples anymore.
+        """
+        with self.lock:
+            recent = self.recent.snapshot()
+            long_term = self.long_term.snapshot()
+        if len(recent) == 0:
+            return long_term
+        older = long_term[long_term['timestamp'] < recent['timestamp'][0]]
+        if len(older) == 0:
+            return recent
+        return np.concatenate((older, recent))
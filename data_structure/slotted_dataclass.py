@@ -0,0 +1,18 @@
+import dataclasses
+
+
+def slotted_dataclass(cls):
+    """
+    Same as @dataclass(slots=True) of python 3.10, for older versions too. Instances have no __dict__, which keeps
+    records held for a whole session compact.
+    """
+    cls = dataclasses.dataclass(cls)
+    field_names = tuple(field.name for field in dataclasses.fields(cls))
+    class_dict = dict(cls.__dict__)
+    class_dict['__slots__'] = field_names
+    for field_name in field_names:
+        # Defaults are already in __init__, while class attributes of the same names would conflict with the slots
+        class_dict.pop(field_name, None)
+    class_dict.pop('__dict__', None)
+    class_dict.pop('__weakref__', None)
+    return type(cls)(cls.__name__, cls.__bases__, class_dict)
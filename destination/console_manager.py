@@ -1,4 +1,7 @@
 #!/bin/env python3
+import queue
+import threading
+from time import sleep
 
 from curse_manager import CursesManager
 from data_structure.host_info import HostInfo
@@ -6,42 +9,82 @@ from data_structure.log_message_info import LogMessageInfo
 from data_structure.system_status_info import SystemStatusInfo
 from event_emitter import ee
 from event_names import BotEvent
+from state_bus import state_bus
 
 
 class ConsoleManager:
     def __init__(self, config=None, curses_manager: CursesManager = None):
         self.config = config
         self.curses_manager = curses_manager
+        self.thread = None
+        # Versions of state bus slots which have been drawn already
+        self.message_counter_version = 0
+        self.system_status_version = 0
+        # Curses isn't thread safe, so updates from event threads are queued and drawn by the poll thread only
+        self.pending_updates = queue.SimpleQueue()
+
         ee.on(BotEvent.UPDATE_BATTERY_PERCENTAGE.name, self.update_battery_percentage)
-        ee.on(BotEvent.UPDATE_MESSAGE_COUNTER.name, self.update_message_counter)
         ee.on(BotEvent.UPDATE_HOST_INFO.name, self.update_host_info)
-        ee.on(BotEvent.UPDATE_SYSTEM_STATUS.name, self.update_system_status_info)
         ee.on(BotEvent.APPEND_LOG.name, self.append_log)
 
     # public methods
-    def update_message_counter(self, counter_number: int = 0):
+    def run(self):
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.run_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run_loop(self):
+        while True:
+            self.apply_pending_updates()
+            self.pull_state_updates()
+            sleep(0.25)
+
+    def apply_pending_updates(self):
+        while True:
+            try:
+                update, kwargs = self.pending_updates.get_nowait()
+            except queue.Empty:
+                return
+            update(**kwargs)
+
+    def pull_state_updates(self):
+        self.message_counter_version, message_counter = state_bus.latest(BotEvent.UPDATE_MESSAGE_COUNTER.name,
+                                                                         self.message_counter_version)
+        if message_counter:
+            self.update_message_counter(**message_counter)
+
+        self.system_status_version, system_status_info = state_bus.latest(BotEvent.UPDATE_SYSTEM_STATUS.name,
+                                                                          self.system_status_version)
+        if system_status_info:
+            self.update_system_status_info(system_status_info=system_status_info)
+
+    def update_message_counter(self, counter_number: int = 0, dropped_counter_number: int = 0):
         if not self.curses_manager:
             return
-        self.curses_manager.update_message_counter(counter_number=counter_number)
+        self.curses_manager.update_message_counter(counter_number=counter_number,
+                                                   dropped_counter_number=dropped_counter_number)
 
     def update_host_info(self, host_info: HostInfo):
         if not self.curses_manager:
             return
-        self.curses_manager.update_host_info(host_info=host_info)
+        self.pending_updates.put((self.curses_manager.update_host_info, {'host_info': host_info}))
 
     def update_battery_percentage(self, battery_percentage: int = 0, update: bool = True):
         if not self.curses_manager:
             return
-        self.curses_manager.update_battery_percentage(battery_percentage=battery_percentage, update=update)
+        self.pending_updates.put((self.curses_manager.update_battery_percentage,
+                                  {'battery_percentage': battery_percentage, 'update': update}))
 
     def append_log(self, log: LogMessageInfo = None):
         if not self.curses_manager:
             return
-        self.curses_manager.append_log(new_message=log)
+        self.pending_updates.put((self.curses_manager.append_log, {'new_message': log}))
 
-    def update_system_status_info(self, job_status: SystemStatusInfo = None):
+    def update_system_status_info(self, system_status_info: SystemStatusInfo = None):
         if not self.curses_manager:
             return
-        self.curses_manager.update_system_status_info(system_status_info=job_status)
+        self.curses_manager.update_system_status_info(system_status_info=system_status_info)
 
     # private methods
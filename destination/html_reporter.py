@@ -1,11 +1,15 @@
 #!/bin/env python3
 # -*- coding: utf-8 -*-
 
-import base64
 import codecs
 import io
-import shutil
+import json
+import os
+import threading
+import time
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
 from typing import Tuple, Dict
 
@@ -14,19 +18,35 @@ from PIL import Image
 from event_emitter import ee
 from event_names import BotEvent
 
+THUMBNAIL_WIDTH = 300
+SESSION_NAME_FORMAT = '%Y_%m_%d_%H_%M_%S'
+
 
 class HTMLReporter:
     def __init__(self, config=None):
-        path = config.report_folder
+        # Every run of the bot gets its own session folder, previous sessions are kept and listed in the index page.
+        self.report_folder = config.report_folder
+        self.session_name = datetime.now().strftime(SESSION_NAME_FORMAT)
+        path = os.path.join(self.report_folder, self.session_name)
         self.path = path
-        shutil.rmtree(path, ignore_errors=True)
         Path(path + '/images').mkdir(parents=True, exist_ok=True)
+        self.write_session_index()
 
         self.html_file = codecs.open(path + '/index.html', 'w', encoding='utf-8')
+        # One json object per line, so it can be appended to and read while the session is still running
         self.json_file = codecs.open(path + '/data.json', 'w', encoding='utf-8')
+        self.write_lock = threading.Lock()
         self.write_header()
         self.image_count = 0
         self.event_sequence = 0
+
+        # Images and thumbnails are written by workers, rows only reference the files so the page stays small.
+        self.image_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='html_reporter')
+        self.flush_interval_sec = 5
+        self.flush_thread = threading.Thread(target=self.flush_loop)
+        self.flush_thread.daemon = True
+        self.flush_thread.start()
+
         ee.on(BotEvent.SEND_TEXT_MESSAGE.name, self.send_text_message)
         ee.on(BotEvent.SEND_IMAGE_MESSAGE.name, self.send_image_message)
         ee.on(BotEvent.EDIT_IMAGE_MESSAGE.name, self.edit_image_message)
@@ -63,67 +83,149 @@ class HTMLReporter:
                             ''')
 
     def write_footer(self):
-        self.html_file.write('''</tbody></table></body></html>''')
-        url = 'file://' + str(Path(self.html_file.name).absolute())
-        self.html_file.flush()
-        self.html_file.close()
+        self.image_executor.shutdown(wait=True)
+        with self.write_lock:
+            self.html_file.write('''</tbody></table></body></html>''')
+            url = 'file://' + str(Path(self.html_file.name).absolute())
+            self.html_file.flush()
+            self.html_file.close()
+            self.json_file.close()
 
         webbrowser.open(url, new=2)
 
+    def flush_loop(self):
+        # Rows are flushed periodically rather than per row, so a crash loses a few seconds at most.
+        while not self.html_file.closed:
+            time.sleep(self.flush_interval_sec)
+            with self.write_lock:
+                if not self.html_file.closed:
+                    self.html_file.flush()
+                    self.json_file.flush()
+
+    def write_session_index(self):
+        """
+        Rewrite the index page of the report folder, which links to every session. Only folder names are listed,
+        sessions are not opened until their page is visited.
+        """
+        session_names = sorted((entry.name for entry in os.scandir(self.report_folder)
+                                if entry.is_dir() and os.path.exists(os.path.join(entry.path, 'data.json'))),
+                               reverse=True)
+        if self.session_name not in session_names:
+            session_names.insert(0, self.session_name)
+        rows = list()
+        for session_name in session_names:
+            try:
+                started = datetime.strptime(session_name, SESSION_NAME_FORMAT).strftime('%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                started = ''
+            rows.append(f'<tr><td><a href="{session_name}/index.html">{session_name}</a></td><td>{started}</td>'
+                        f'<td><a href="{session_name}/data.json">data.json</a></td></tr>')
+
+        index_filename = os.path.join(self.report_folder, 'index.html')
+        with codecs.open(index_filename + '.tmp', 'w', encoding='utf-8') as index_file:
+            index_file.write('''<!DOCTYPE html>
+                            <html lang="en">
+                            <head>
+                              <meta charset="utf-8">
+                              <title>Sessions</title>
+                            </head>
+                            <body>
+                              <style>
+                              td{
+                              border:1px solid
+                              }
+                              </style>
+                              <table>
+                                <thead>
+                                    <th>Session</th>
+                                    <th>Started</th>
+                                    <th>Events</th>
+                                </thead>
+                                <tbody>
+                            ''')
+            index_file.write('\n'.join(rows))
+            index_file.write('''</tbody></table></body></html>''')
+        os.replace(index_filename + '.tmp', index_filename)
+
+    def write_row(self, row_type: str, details: str, data: Dict = None):
+        """
+        Append one event to both the html table and the data.json event stream.
+        :param data: Structured fields of the event, for data.json.
+        """
+        now = datetime.now()
+        with self.write_lock:
+            if self.html_file.closed:
+                return
+            self.html_file.write(f'<tr><td>{self.event_sequence}</td><td>{row_type}</td><td>{details}</td>'
+                                 f'<td>{now.strftime("%Y-%m-%d %H:%M:%S")}</td></tr>\n')
+            event = {'sequence': self.event_sequence, 'type': row_type, 'timestamp': now.timestamp()}
+            if data:
+                event.update(data)
+            self.json_file.write(json.dumps(event, ensure_ascii=False) + '\n')
+            self.event_sequence += 1
+
+    def save_image(self, image_data: bytes) -> int:
+        """
+        Write the image and its thumbnail in the background.
+        :return: Index of the image, it's saved as images/image_{index}.jpg and images/thumbnail_{index}.jpg
+        """
+        with self.write_lock:
+            image_index = self.image_count
+            self.image_count += 1
+        self.image_executor.submit(self.write_image_files, image_data, image_index)
+        return image_index
+
+    def write_image_files(self, image_data: bytes, image_index: int):
+        try:
+            with open(f'{self.path}/images/image_{image_index}.jpg', 'wb') as f:
+                f.write(image_data)
+
+            img = Image.open(io.BytesIO(image_data))
+            hsize = int(float(img.size[1]) * THUMBNAIL_WIDTH / float(img.size[0]))
+            # Let the JPEG decoder downscale while decoding, instead of decoding the full resolution image
+            img.draft('RGB', (THUMBNAIL_WIDTH, hsize))
+            img.thumbnail((THUMBNAIL_WIDTH, hsize))
+            img.convert('RGB').save(f'{self.path}/images/thumbnail_{image_index}.jpg', format='JPEG')
+        except Exception as exception:
+            print(f'Failed to write image {image_index} of html report: {exception}')
+
+    @staticmethod
+    def image_link(image_index: int) -> str:
+        return f'''<a href="images/image_{image_index}.jpg">
+            <img src="images/thumbnail_{image_index}.jpg" width="{THUMBNAIL_WIDTH}" loading="lazy" />
+            </a>'''
+
     def send_text_message(self, message: str = '', silent: bool = False) -> Tuple[str, Dict]:
-        self.html_file.write(f'<tr><td>{self.event_sequence}</td><td>Text Message</td><td>{message}</td></tr>\n')
-        self.event_sequence += 1
+        self.write_row('Text Message', message, data={'message': message})
 
     def edit_image_message(self, chat_id: str, message_id: str,
                            image_data: bytes, filename: str = '') -> Tuple[str, Dict]:
-        f = open(f'{self.path}/images/image_{self.image_count}.jpg', 'wb')
-
-        f.write(image_data)
-        f.close()
-
-        stream = io.BytesIO(image_data)
-        img = Image.open(stream)
-        basewidth = 300
-        wpercent = (basewidth / float(img.size[0]))
-        hsize = int((float(img.size[1]) * float(wpercent)))
-
-        img.thumbnail((basewidth, hsize))
-
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        base64_encoded_thumbnails = base64.b64encode(img_byte_arr).decode('ascii')
-        self.html_file.write(
-            f'''<tr><td>{self.event_sequence}</td><td>Edit Image</td>
-            <td>
+        image_index = self.save_image(image_data)
+        self.write_row('Edit Image', f'''
             A previously posted image [{message_id}] was updated, new image is:
             <br>
-            <a href="images/image_{self.image_count}.jpg">
-            <img src="data:image/jpeg;base64, {base64_encoded_thumbnails}" />
-            </a></td></tr>\n''')
-        self.event_sequence += 1
-        self.image_count += 1
+            {self.image_link(image_index)}''',
+                       data={'message_id': message_id, 'filename': filename,
+                             'image': f'images/image_{image_index}.jpg',
+                             'thumbnail': f'images/thumbnail_{image_index}.jpg'})
 
         return 'OK', {'chat_id': '19052485', 'message_id': '19091585'}
 
     def pin_message(self, chat_id: str, message_id: str) -> Tuple[str, Dict]:
         message = f'Pinning messages for room [{chat_id}], message id: [{message_id}]'
-        self.html_file.write(f'<tr><td>{self.event_sequence}</td><td>Pin Message</td><td>{message}</td></tr>\n')
-        self.event_sequence += 1
+        self.write_row('Pin Message', message, data={'chat_id': chat_id, 'message_id': message_id})
 
         return 'OK', dict()
 
     def unpin_message(self, chat_id: str, message_id: str) -> Tuple[str, Dict]:
         message = f'Unpinning messages for room [{chat_id}], message id: [{message_id}]'
-        self.html_file.write(f'<tr><td>{self.event_sequence}</td><td>Unpin Message</td><td>{chat_id}</td></tr>\n')
-        self.event_sequence += 1
+        self.write_row('Unpin Message', chat_id, data={'chat_id': chat_id, 'message_id': message_id})
 
         return 'OK', dict()
 
     def unpin_all_messages(self, chat_id: str = 'Test') -> Tuple[str, Dict]:
         message = f'Unpinning all messages for room [{chat_id}]'
-        self.html_file.write(f'<tr><td>{self.event_sequence}</td><td>Unpin all Messages</td><td>N/A</td></tr>\n')
-        self.event_sequence += 1
+        self.write_row('Unpin all Messages', 'N/A', data={'chat_id': chat_id})
 
         return 'OK', dict()
 
@@ -133,28 +235,10 @@ class HTMLReporter:
 
     def send_image_message(self, image_data: bytes, filename: str = '', caption: str = '',
                            as_document: bool = True) -> Tuple[str, Dict]:
-        f = open(f'{self.path}/images/image_{self.image_count}.jpg', 'wb')
-        f.write(image_data)
-        f.close()
-
-        stream = io.BytesIO(image_data)
-        img = Image.open(stream)
-        basewidth = 300
-        wpercent = (basewidth / float(img.size[0]))
-        hsize = int((float(img.size[1]) * float(wpercent)))
-
-        img.thumbnail((basewidth, hsize))
-
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG')
-        img_byte_arr = img_byte_arr.getvalue()
-        base64_encoded_thumbnails = base64.b64encode(img_byte_arr).decode('ascii')
-        self.html_file.write(
-            f'''<tr><td>{self.event_sequence}</td><td>Send Image</td>
-            <td><a href="images/image_{self.image_count}.jpg">
-            <img src="data:image/jpeg;base64, {base64_encoded_thumbnails}" />
-            </a></td></tr>\n''')
-        self.image_count += 1
-        self.event_sequence += 1
+        image_index = self.save_image(image_data)
+        self.write_row('Send Image', self.image_link(image_index),
+                       data={'caption': caption, 'filename': filename,
+                             'image': f'images/image_{image_index}.jpg',
+                             'thumbnail': f'images/thumbnail_{image_index}.jpg'})
 
         return 'OK', {'chat_id': '19052485', 'message_id': '19091585'}
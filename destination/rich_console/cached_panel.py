@@ -0,0 +1,54 @@
+from typing import Hashable, List
+
+from rich.console import Console, ConsoleOptions, RenderResult, RenderableType
+from rich.segment import Segment
+
+
+class CachedPanel:
+    """
+    Base class of panels which only rebuild their content when something behind it changed. Rendered lines are kept
+    and replayed until the panel is marked dirty, the size of its region changes, or its time key changes.
+    """
+
+    def __init__(self):
+        self.dirty = True
+        self.cache_key = None
+        self.cached_time_key = None
+        self.cached_lines = []  # type: List[List[Segment]]
+
+    def mark_dirty(self):
+        self.dirty = True
+
+    def time_key(self) -> Hashable:
+        """
+        :return: A value that changes whenever the panel needs to be redrawn because of time passing, e.g. a clock.
+        """
+        return None
+
+    def is_stale(self) -> bool:
+        """
+        :return: Whether the next render would produce different content from the cached one.
+        """
+        return self.dirty or self.time_key() != self.cached_time_key
+
+    def render(self, width: int, height: int) -> RenderableType:
+        raise NotImplementedError
+
+    def __rich_console__(
+            self, console: Console, options: ConsoleOptions
+    ) -> RenderResult:
+        width = options.max_width
+        height = options.height or options.size.height
+        time_key = self.time_key()
+        cache_key = (width, height, time_key)
+        if self.dirty or cache_key != self.cache_key:
+            # Clear the flag before rendering, so an update which arrives while rendering is not lost.
+            self.dirty = False
+            self.cache_key = cache_key
+            self.cached_time_key = time_key
+            self.cached_lines = console.render_lines(self.render(width=width, height=height), options)
+
+        new_line = Segment.line()
+        for line in self.cached_lines:
+            yield from line
+            yield new_line
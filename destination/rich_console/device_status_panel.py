@@ -1,38 +1,37 @@
 from rich import box
 from rich.align import Align
-from rich.console import RenderResult, ConsoleOptions, Console
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 
 from data_structure.system_status_info import DitherStatusEnum, GuideStatusEnum, MountStatusEnum, CcdStatusEnum, \
-    SpecialDeviceReadingEnum
+    SpecialDeviceReadingEnum, DeviceConnectedInfo, DeviceStatusInfo
+from destination.rich_console.cached_panel import CachedPanel
 from destination.rich_console.styles import RichTextStylesEnum
 from utils.localization import get_translated_text as _
 
 
-class DeviceStatusPanel:
+class DeviceStatusPanel(CachedPanel):
     """Display header with clock."""
 
     def __init__(self, config: object, layout: Layout):
-        self.system_status_info = None  # type: SystemStatusInfo
+        super().__init__()
+        # Only these parts of the system status are shown, others like the mount position change all the time
+        self.device_connection_info = DeviceConnectedInfo()
+        self.device_status_info = DeviceStatusInfo()
         self.layout = layout
         self.config = config
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
-        width = options.max_width
-        height = options.height or options.size.height
-        yield self.generate_grid(width=width, height=height)
+    def render(self, width: int, height: int):
+        return self.generate_grid(width=width, height=height)
 
     def generate_grid(self, width: int, height: int):
         status_table = Table.grid(padding=(0, 1))
         status_table.add_column(justify='left')
 
-        device_connection_info = self.system_status_info.device_connection_info
-        device_status_info = self.system_status_info.device_status_info
+        device_connection_info = self.device_connection_info
+        device_status_info = self.device_status_info
         # CCD
         status_table.add_row('[bold]' + _('Main Camera') + '[/bold]')
         if device_connection_info.camera_connected:
@@ -1,13 +1,14 @@
-from rich.console import Console, ConsoleOptions, RenderResult
 from rich.table import Table
 
 from data_structure.host_info import HostInfo, VoyagerConnectionStatus
 from data_structure.special_battery_percentage import SpecialBatteryPercentageEnum, MemoryUsage
+from destination.rich_console.cached_panel import CachedPanel
 from utils.localization import get_translated_text as _
 
 
-class FooterPanel:
+class FooterPanel(CachedPanel):
     def __init__(self, config: object, host_info: HostInfo = HostInfo()):
+        super().__init__()
         self.host_info = host_info
         self.battery_percentage = SpecialBatteryPercentageEnum.NOT_MONITORED.value
         self.memory_usage = None  # type: MemoryUsage
@@ -34,9 +35,7 @@ class FooterPanel:
 
         return battery_row
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
+    def render(self, width: int, height: int):
         footer_table = Table.grid(expand=True)
         footer_table.add_column(justify='center', min_width=2)
         footer_table.add_column(justify='left', style='bold gold3', ratio=1)
@@ -45,4 +44,4 @@ class FooterPanel:
 
         footer_table.add_row('', self.host_info_row(), _('2021-2022. Liuyi and Kun in California.'), self.battery_row())
 
-        yield footer_table
+        return footer_table
@@ -1,11 +1,12 @@
 import math
 from datetime import datetime, timezone
+from time import time
+from typing import Dict, List
 
 import ephem
 import pytz
 from astropy.coordinates import Angle
 from rich.align import Align
-from rich.console import RenderResult, Console, ConsoleOptions
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.style import StyleType
@@ -15,17 +16,70 @@ from rich.text import Text
 from data_structure.forecast_color_mapping import get_temperature_color, get_humidity_color, get_cloud_cover_color, \
     get_wind_speed_color, get_sky_condition_bg_color, get_roof_condition_bg_color, get_alert_bg_color
 from data_structure.system_status_info import MountInfo
+from destination.rich_console.cached_panel import CachedPanel
 from destination.rich_console.styles import RichTextStylesEnum
+from utils.forecast.base_forecast import BaseHttpForecast
 from utils.forecast.clear_dark_sky_forecast import ClearDarkSkyForecast
 from utils.forecast.open_weather_forecast import OpenWeatherForecast
 from utils.forecast.sun_and_moon import SunAndMoon
 from utils.localization import get_translated_text as _
 from utils.sky_data_utils import get_weather_conditions, get_roof_condition, SkyCondition, CloudCondition, \
-    WindCondition, RainCondition, DayCondition, AlertCondition
-
-
-class ForecastPanel:
+    WindCondition, RainCondition, DayCondition, AlertCondition, weather_conditions_watcher, roof_condition_watcher
+
+
+class ForecastGrid:
+    """
+    Cells of a forecast table, built once per forecast update. Each row starts with a label, followed by
+    'fixed_columns' summary cells and then one 2-character cell per forecast hour; the first row holds the hours.
+    Tables are laid out once per number of visible hours, and highlighting the current hour patches the cells in place.
+    """
+
+    def __init__(self, updated_time: datetime, rows: List[list], fixed_columns: int = 0):
+        self.updated_time = updated_time
+        self.rows = rows
+        self.fixed_columns = fixed_columns
+        self.hour_to_index = dict()  # type: Dict[int, int]
+        self.tables = dict()  # type: Dict[int, Table]
+        self.highlight_index = None
+        self.hour_styles = [cell.style for cell in rows[0][1 + fixed_columns:]]
+
+    def hour_count(self) -> int:
+        return len(self.hour_styles)
+
+    def table(self, length: int) -> Table:
+        if length not in self.tables:
+            table = Table.grid(padding=(0, 0), expand=False)
+            table.add_column(style='bold')
+            for i in range(self.fixed_columns):
+                table.add_column(justify='right')
+            for i in range(length):
+                table.add_column(width=2, max_width=2)
+            for row in self.rows:
+                table.add_row(*row[:1 + self.fixed_columns + length])
+            self.tables[length] = table
+        return self.tables[length]
+
+    def highlight(self, index: int):
+        """
+        Make the hour at 'index' blink and mark it in all other rows, and remove the mark from the previous one.
+        """
+        if index == self.highlight_index or index >= len(self.hour_styles):
+            return
+        if self.highlight_index is not None:
+            self.mark_hour(self.highlight_index, style_suffix='', place_holder_string='  ')
+        self.mark_hour(index, style_suffix=' blink', place_holder_string='●')
+        self.highlight_index = index
+
+    def mark_hour(self, index: int, style_suffix: str, place_holder_string: str):
+        column = 1 + self.fixed_columns + index
+        self.rows[0][column].style = self.hour_styles[index] + style_suffix
+        for row in self.rows[1:]:
+            row[column].plain = place_holder_string
+
+
+class ForecastPanel(CachedPanel):
     def __init__(self, config: object, layout: Layout, style: StyleType = "") -> None:
+        super().__init__()
         self.config = config
         self.layout = layout
         self.style = style
@@ -33,18 +87,22 @@ class ForecastPanel:
 
         self.enabled_services = list()
         self.enabled_tables = list()
+        self.forecast_grids = dict()  # type: Dict[int, ForecastGrid]
+        self.time_zone = pytz.timezone(config.timezone)
         self.mount_info = MountInfo()  # type: MountInfo
+        # Mount (alt, az) in degrees, rounded to the precision the moon separation is shown with
+        self.mount_alt_az = (0.0, 0.0)
 
         if hasattr(config.observing_condition_config, 'forecast_service'):
             if 'ClearDarkSky' in config.observing_condition_config.forecast_service:
                 clear_dark_sky_forecast = ClearDarkSkyForecast(config=config)
-                clear_dark_sky_forecast.maybe_update_forecast()
+                clear_dark_sky_forecast.start()
                 self.enabled_services.append(clear_dark_sky_forecast)
                 self.enabled_tables.append(self.clear_sky_table)
 
             if 'OpenWeather' in config.observing_condition_config.forecast_service:
                 open_weather_forecast = OpenWeatherForecast(config=config)
-                open_weather_forecast.maybe_update_forecast()
+                open_weather_forecast.start()
                 self.enabled_services.append(open_weather_forecast)
                 self.enabled_tables.append(self.open_weather_table)
 
@@ -62,151 +120,151 @@ class ForecastPanel:
                     self.roof_condition_file = config.observing_condition_config.roof_condition_file
                 else:
                     self.roof_condition_file = ''
+                # Redraw as soon as the condition files change
+                if self.sky_condition_file:
+                    sky_condition_watcher = weather_conditions_watcher(self.sky_condition_file)
+                    sky_condition_watcher.subscribe(lambda sky_conditions: self.mark_dirty())
+                    sky_condition_watcher.start()
+                if self.roof_condition_file:
+                    roof_watcher = roof_condition_watcher(self.roof_condition_file)
+                    roof_watcher.subscribe(lambda roof_condition: self.mark_dirty())
+                    roof_watcher.start()
 
         self.current_service_idx = 0
         self.current_service = self.enabled_services[self.current_service_idx]
         self.timestamp_since_changing_table = datetime.now()
 
-    def clear_sky_table(self, height: int = 8, width: int = 20) -> Table:
-        forecast_table = Table.grid(padding=(0, 0), expand=False)
-        forecast_table.add_column(style='bold')
+    def cached_grid(self, build_grid) -> ForecastGrid:
+        """
+        Get the grid of the current service, rebuild it with 'build_grid' only if the service has new forecast data.
+        """
+        grid = self.forecast_grids.get(self.current_service_idx)
+        if grid is None or grid.updated_time != self.current_service.last_updated_time:
+            grid = build_grid(self.current_service)
+            self.forecast_grids[self.current_service_idx] = grid
+        return grid
+
+    def build_clear_sky_grid(self, service: ClearDarkSkyForecast) -> ForecastGrid:
+        # Read the update time before the data, so a forecast swapped in meanwhile causes another rebuild
+        updated_time = service.last_updated_time
+        forecast_list = service.forecast
+        hour_list = [_('Hour')]
+        seeing_list = [_('Seeing')]
+        cloud_cover_list = [_('Cloud')]
+        transparency_list = [_('Transp ')]
+        wind_list = [_('Wind S')]
+        temperature_list = [_('Temp')]
+
+        for i, forecast in enumerate(forecast_list):
+            style_string = 'grey62'
+            if i % 2 == 0:
+                style_string = 'bright_white'
+            hour_list.append(Text(f'{forecast.local_hour:02}', style=style_string))
+            seeing_list.append(Text('  ', style=f'red on {forecast.seeing.value}'))
+            cloud_cover_list.append(Text('  ', style=f'red on {forecast.cloud_cover_percentage.value}'))
+            transparency_list.append(Text('  ', style=f'red on {forecast.transparency.value}'))
+            wind_list.append(Text('  ', style=f'red on {forecast.wind_speed.value}'))
+            temperature_list.append(Text('  ', style=f'red on {forecast.temperature.value}'))
+
+        grid = ForecastGrid(updated_time=updated_time,
+                            rows=[hour_list, seeing_list, cloud_cover_list, transparency_list, wind_list,
+                                  temperature_list],
+                            fixed_columns=0)
+        # Only the first day of the forecast can be highlighted as the current hour
+        for i in range(min(len(forecast_list), 23)):
+            grid.hour_to_index[forecast_list[i].local_hour] = i
+        return grid
 
+    def clear_sky_table(self, height: int = 8, width: int = 20) -> Table:
         if not self.current_service:
+            forecast_table = Table.grid(padding=(0, 0), expand=False)
             forecast_table.add_row(Text(_('Unable to execute ClearDarkSky forecast service'),
                                         style=RichTextStylesEnum.CRITICAL.value))
-        else:
-            length = min(len(self.current_service.forecast), int(math.floor((width - 2 - 2 - 7) / 2)))
-
-            for i in range(length - 1):
-                forecast_table.add_column(width=2, max_width=2)
-
-            hour_list = [_('Hour')]
-            seeing_list = [_('Seeing')]
-            cloud_cover_list = [_('Cloud')]
-            transparency_list = [_('Transp ')]
-            wind_list = [_('Wind S')]
-            temperature_list = [_('Temp')]
-
-            # find the right index to blink:
-            right_index_to_blink = 0
-            time_zone = pytz.timezone(self.config.timezone)
-            now = datetime.now(tz=time_zone)
-            for i in range(min(length, 23)):
-                forecast = self.current_service.forecast[i]
-                if now.hour == forecast.local_hour:
-                    right_index_to_blink = i
+            return forecast_table
 
-            for i in range(length):
-                forecast = self.current_service.forecast[i]
-                style_string = 'grey62'
-                place_holder_string = '  '
-                if i % 2 == 0:
-                    style_string = 'bright_white'
-                if i == right_index_to_blink:
-                    style_string += ' blink'
-                    place_holder_string = '●'
-                hour_list.append(Text(f'{forecast.local_hour:02}', style=style_string))
-                seeing_list.append(Text(place_holder_string, style=f'red on {forecast.seeing.value}'))
-                cloud_cover_list.append(
-                    Text(place_holder_string, style=f'red on {forecast.cloud_cover_percentage.value}'))
-                transparency_list.append(Text(place_holder_string, style=f'red on {forecast.transparency.value}'))
-                wind_list.append(Text(place_holder_string, style=f'red on {forecast.wind_speed.value}'))
-                temperature_list.append(Text(place_holder_string, style=f'red on {forecast.temperature.value}'))
-
-            forecast_table.add_row(*hour_list)
-            forecast_table.add_row(*seeing_list)
-            forecast_table.add_row(*cloud_cover_list)
-            forecast_table.add_row(*transparency_list)
-            forecast_table.add_row(*wind_list)
-            forecast_table.add_row(*temperature_list)
-
-        return forecast_table
+        grid = self.cached_grid(self.build_clear_sky_grid)
+        grid.highlight(grid.hour_to_index.get(datetime.now(tz=self.time_zone).hour, 0))
+        length = min(grid.hour_count(), int(math.floor((width - 2 - 2 - 7) / 2)))
+        return grid.table(length=length)
 
-    def open_weather_table(self, height: int = 8, width: int = 20) -> Table:
-        forecast_table = Table.grid(padding=(0, 0), expand=False)
-        forecast_table.add_column(style='bold')
-
-        if not self.current_service:
-            forecast_table.add_row(Text(_('Unable to execute OpenWeather forecast service'),
-                                        style=RichTextStylesEnum.CRITICAL.value))
-        else:
-            length = min(len(self.current_service.forecast), 12)
+    def build_open_weather_grid(self, service: OpenWeatherForecast) -> ForecastGrid:
+        updated_time = service.last_updated_time
+        forecast_list = service.forecast
+        length = min(len(forecast_list), 12)
 
-            if length > 0:
-                # Column to explicitly show current condition
-                forecast_table.add_column(justify='right')
-            for i in range(1, length):
-                forecast_table.add_column(width=2, max_width=2)  # Fit -99 ~ 100
+        hour_list = [_('Hour')]
+        temperature_list = [_('Temp.')]
+        dew_list = [_('Dew Point ')]
+        humidity_list = [_('Humidity')]
+        cloud_cover_list = [_('Cloud')]
+        wind_speed_list = [_('Wind')]
+        # weather_list = ['Weather ']
 
-            hour_list = [_('Hour')]
-            temperature_list = [_('Temp.')]
-            dew_list = [_('Dew Point ')]
-            humidity_list = [_('Humidity')]
-            cloud_cover_list = [_('Cloud')]
-            wind_speed_list = [_('Wind')]
-            # weather_list = ['Weather ']
+        if length > 0:
+            forecast = forecast_list[0]
+            # Explicitly show current condition
 
-            if length > 0:
-                forecast = self.current_service.forecast[0]
-                # Explicitly show current condition
+            hour_list.append(Text(_('Now '), style='white on black'))
 
-                hour_list.append(Text(_('Now '), style='white on black'))
+            color_string = get_temperature_color(forecast.temperature)
+            temperature_list.append(Text(f'{forecast.temperature}°C', style=f'black on {color_string}'))
 
-                color_string = get_temperature_color(forecast.temperature)
-                temperature_list.append(Text(f'{forecast.temperature}°C', style=f'black on {color_string}'))
+            color_string = get_temperature_color(forecast.dew_point)
+            dew_list.append(Text(f'{forecast.dew_point}°C', style=f'black on {color_string}'))
 
-                color_string = get_temperature_color(forecast.dew_point)
-                dew_list.append(Text(f'{forecast.dew_point}°C', style=f'black on {color_string}'))
+            color_string = get_humidity_color(forecast.humidity)
+            humidity_list.append(Text(f'{forecast.humidity}%', style=f'black on {color_string}'))
 
-                color_string = get_humidity_color(forecast.humidity)
-                humidity_list.append(Text(f'{forecast.humidity}%', style=f'black on {color_string}'))
+            color_string = get_cloud_cover_color(forecast.cloud_cover_percentage)
+            cloud_cover_list.append(Text(f'{forecast.cloud_cover_percentage}%', style=f'black on {color_string}'))
 
-                color_string = get_cloud_cover_color(forecast.cloud_cover_percentage)
-                cloud_cover_list.append(Text(f'{forecast.cloud_cover_percentage}%', style=f'black on {color_string}'))
+            # weather_list.append(Text(str(forecast.weather_id), style=style_string))
 
-                # weather_list.append(Text(str(forecast.weather_id), style=style_string))
+            color_string = get_wind_speed_color(forecast.wind_speed)
+            wind_speed_list.append(Text(f'{forecast.wind_speed}m/s', style=f'black on {color_string}'))
 
-                color_string = get_wind_speed_color(forecast.wind_speed)
-                wind_speed_list.append(Text(f'{forecast.wind_speed}m/s', style=f'black on {color_string}'))
+        for i in range(length):
+            forecast = forecast_list[i]
+            style_string = 'grey62'
+            if i % 2 == 0:
+                style_string = 'bright_white'
+            dt_object = datetime.utcfromtimestamp(forecast.dt)
+            dt_object = dt_object.replace(tzinfo=timezone.utc).astimezone(tz=self.time_zone)
 
-            time_zone = pytz.timezone(self.config.timezone)
-            for i in range(length):
-                forecast = self.current_service.forecast[i]
-                style_string = 'grey62'
-                if i % 2 == 0:
-                    style_string = 'bright_white'
-                dt_object = datetime.utcfromtimestamp(forecast.dt)
-                dt_object = dt_object.replace(tzinfo=timezone.utc).astimezone(tz=time_zone)
+            hour = (dt_object.hour + i) % 24
+            hour_list.append(Text(f'{hour:02}', style=style_string))
 
-                hour = (dt_object.hour + i) % 24
-                hour_list.append(Text(f'{hour:02}', style=style_string))
+            color_string = get_temperature_color(forecast.temperature)
+            temperature_list.append(Text('  ', style=f'{color_string} on {color_string}'))
 
-                color_string = get_temperature_color(forecast.temperature)
-                temperature_list.append(Text('  ', style=f'{color_string} on {color_string}'))
+            color_string = get_temperature_color(forecast.dew_point)
+            dew_list.append(Text('  ', style=f'{color_string} on {color_string}'))
 
-                color_string = get_temperature_color(forecast.dew_point)
-                dew_list.append(Text('  ', style=f'{color_string} on {color_string}'))
+            color_string = get_humidity_color(forecast.humidity)
+            humidity_list.append(Text('  ', style=f'{color_string} on {color_string}'))
 
-                color_string = get_humidity_color(forecast.humidity)
-                humidity_list.append(Text('  ', style=f'{color_string} on {color_string}'))
+            color_string = get_cloud_cover_color(forecast.cloud_cover_percentage)
+            cloud_cover_list.append(Text('  ', style=f'{color_string} on {color_string}'))
 
-                color_string = get_cloud_cover_color(forecast.cloud_cover_percentage)
-                cloud_cover_list.append(Text('  ', style=f'{color_string} on {color_string}'))
+            # weather_list.append(Text(str(forecast.weather_id), style=style_string))
 
-                # weather_list.append(Text(str(forecast.weather_id), style=style_string))
+            color_string = get_wind_speed_color(forecast.wind_speed)
+            wind_speed_list.append(Text('  ', style=f'{color_string} on {color_string}'))
 
-                color_string = get_wind_speed_color(forecast.wind_speed)
-                wind_speed_list.append(Text('  ', style=f'{color_string} on {color_string}'))
+        return ForecastGrid(updated_time=updated_time,
+                            rows=[hour_list, temperature_list, dew_list, humidity_list, cloud_cover_list,
+                                  wind_speed_list],
+                            fixed_columns=1 if length > 0 else 0)
 
-            forecast_table.add_row(*hour_list)
-            forecast_table.add_row(*temperature_list)
-            forecast_table.add_row(*dew_list)
-            forecast_table.add_row(*humidity_list)
-            forecast_table.add_row(*cloud_cover_list)
-            # forecast_table.add_row(*weather_list)
-            forecast_table.add_row(*wind_speed_list)
+    def open_weather_table(self, height: int = 8, width: int = 20) -> Table:
+        if not self.current_service:
+            forecast_table = Table.grid(padding=(0, 0), expand=False)
+            forecast_table.add_row(Text(_('Unable to execute OpenWeather forecast service'),
+                                        style=RichTextStylesEnum.CRITICAL.value))
+            return forecast_table
 
-        return forecast_table
+        grid = self.cached_grid(self.build_open_weather_grid)
+        return grid.table(length=min(grid.hour_count(), 12))
 
     def sun_moon_table(self, height: int = 8, width: int = 20) -> Table:
         table = Table.grid(padding=(0, 2), expand=False)
@@ -244,10 +302,7 @@ class ForecastPanel:
                           _('S: {}').format(readable_time(observation.sunset_localtime)),
                           _('R: {}').format(readable_time(observation.sunrise_localtime)))
             # Moon
-            mount_alt_angle = Angle(self.mount_info.alt).dms
-            mount_alt_degree = mount_alt_angle.d + mount_alt_angle.m / 60 + mount_alt_angle.s / 3600
-            mount_az_angle = Angle(self.mount_info.az).dms
-            mount_az_degree = mount_az_angle.d + mount_az_angle.m / 60 + mount_az_angle.s / 3600
+            mount_alt_degree, mount_az_degree = self.mount_alt_az
             separation = ephem.separation(
                 (observation.moon_azimuth / 180 * math.pi, observation.moon_altitude / 180 * math.pi),
                 (mount_az_degree / 180 * math.pi, mount_alt_degree / 180 * math.pi))
@@ -262,7 +317,7 @@ class ForecastPanel:
 
         return table
 
-    def forecast_table(self, height: int = 8, width: int = 20) -> Table:
+    def maybe_switch_service(self):
         now = datetime.now()
         if (now - self.timestamp_since_changing_table).total_seconds() > 8:
             self.current_service_idx += 1
@@ -271,23 +326,41 @@ class ForecastPanel:
             self.timestamp_since_changing_table = now
 
             self.current_service = self.enabled_services[self.current_service_idx]
-            self.current_service.maybe_update_forecast()
+            if not isinstance(self.current_service, BaseHttpForecast):
+                # Http forecasts are updated in background
+                self.current_service.maybe_update_forecast()
+
+    def time_key(self):
+        # Redraw when switching to another service, when the service got new data, and once a minute to pick up the
+        # current hour.
+        self.maybe_switch_service()
+        return self.current_service_idx, self.current_service.last_updated_time, int(time() // 60)
+
+    def update_mount_info(self, mount_info: MountInfo):
+        self.mount_info = mount_info
+        mount_alt_angle = Angle(mount_info.alt).dms
+        mount_az_angle = Angle(mount_info.az).dms
+        mount_alt_az = (round(float(mount_alt_angle.d + mount_alt_angle.m / 60 + mount_alt_angle.s / 3600), 1),
+                        round(float(mount_az_angle.d + mount_az_angle.m / 60 + mount_az_angle.s / 3600), 1))
+        if self.mount_alt_az == mount_alt_az:
+            return
+        self.mount_alt_az = mount_alt_az
+        # Only the sun and moon table shows the moon separation, other tables don't need to be redrawn. Switching to
+        # it redraws anyway.
+        if self.enabled_tables[self.current_service_idx] == self.sun_moon_table:
+            self.mark_dirty()
 
+    def forecast_table(self, height: int = 8, width: int = 20) -> Table:
         current_table = self.enabled_tables[self.current_service_idx](height=height, width=width)
         return current_table
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
-        width = options.max_width
-        height = options.height or options.size.height
-        layout = self.layout
+    def render(self, width: int, height: int):
         title = f'{self.current_service.service_name}'
         if self.current_service and hasattr(self.current_service, 'title'):
             title = f'{self.current_service.service_name} for {self.current_service.title}'
 
         table = self.forecast_table(width=width, height=height)
-        yield Panel(
+        return Panel(
             Align.left(table, vertical="top"),
             style=self.style,
             title=title,
@@ -1,7 +1,6 @@
 from collections import deque
 
 from rich.align import Align
-from rich.console import Console, ConsoleOptions, RenderResult
 from rich.layout import Layout
 from rich.panel import Panel
 from rich.style import StyleType
@@ -9,12 +8,14 @@ from rich.table import Table
 from rich.text import Text
 
 from data_structure.log_message_info import LogMessageInfo
+from destination.rich_console.cached_panel import CachedPanel
 from destination.rich_console.styles import RichTextStylesEnum
 from utils.localization import get_translated_text as _
 
 
-class LogPanel:
+class LogPanel(CachedPanel):
     def __init__(self, config: object, layout: Layout, style: StyleType = "") -> None:
+        super().__init__()
         self.config = config
         self.layout = layout
         self.style = style
@@ -24,6 +25,7 @@ class LogPanel:
     def append_log(self, log: LogMessageInfo):
         log.message = log.message.replace('\r\n', '\n').replace('\n\n', '\n')
         self.recent_logs.append(log)
+        self.mark_dirty()
 
     def visible_log_entry_list(self, height: int):
         result = []
@@ -57,14 +59,8 @@ class LogPanel:
                 log_table.add_row(type_text, entry.message)
         return log_table
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
-        width = options.max_width
-        height = options.height or options.size.height
-        layout = self.layout
-
-        yield Panel(
+    def render(self, width: int, height: int):
+        return Panel(
             Align.left(self.visible_log_table(height=height), vertical="top"),
             style=self.style,
             title=_('Important logs ({width}x{height})').format(width=width, height=height),
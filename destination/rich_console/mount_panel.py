@@ -1,18 +1,19 @@
-import datetime
 from datetime import datetime, timedelta
+from time import time
 
 from rich import box
 from rich.align import Align
-from rich.console import Console, ConsoleOptions, RenderResult
 from rich.panel import Panel
 from rich.table import Table
 
 from data_structure.system_status_info import MountInfo
+from destination.rich_console.cached_panel import CachedPanel
 from utils.localization import get_translated_text as _
 
 
-class MountPanel:
+class MountPanel(CachedPanel):
     def __init__(self, config: object) -> None:
+        super().__init__()
         self.config = config
         self.mount_info_ = MountInfo()  # type: MountInfo
         self.flip_updated_time = datetime.now()
@@ -35,8 +36,14 @@ class MountPanel:
             self.flip_duration = timedelta(hours=sign * t.hour, minutes=sign * t.minute, seconds=sign * t.second)
             self.flip_updated_time = datetime.now()
 
+        if self.mount_info_ != value:
+            self.mark_dirty()
         self.mount_info_ = value
 
+    def time_key(self):
+        # The flip countdown ticks every second
+        return int(time())
+
     def time_top_flip(self):
         elapsed_time = datetime.now() - self.flip_updated_time
         updated_duration = self.flip_duration + elapsed_time  # type: timedelta
@@ -64,13 +71,8 @@ class MountPanel:
 
         return mount_table
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
-        width = options.max_width
-        height = options.height or options.size.height
-
-        yield Panel(
+    def render(self, width: int, height: int):
+        return Panel(
             Align.center(self.mount_table(height=height), vertical="top"),
             box=box.ROUNDED,
             padding=(1, 1),
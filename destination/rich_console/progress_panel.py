@@ -1,17 +1,18 @@
 from rich import box
 from rich.align import Align
-from rich.console import RenderResult, Console, ConsoleOptions
 from rich.panel import Panel
 from rich.progress_bar import ProgressBar
 from rich.table import Table
 from rich.text import Text
 
 from data_structure.shot_running_info import ShotRunningStatus, ShotRunningInfo
+from destination.rich_console.cached_panel import CachedPanel
 from utils.localization import get_translated_text as _
 
 
-class ProgressPanel:
+class ProgressPanel(CachedPanel):
     def __init__(self):
+        super().__init__()
         self.sequence_name = ''
         self.image_progress = ProgressBar(total=100)
         self.sequence_progress = ProgressBar(total=100)
@@ -19,9 +20,7 @@ class ProgressPanel:
         self.sequence_progress.update(0)
         self.shot_running_info = None
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
+    def render(self, width: int, height: int):
         progress_table = Table.grid(padding=(0, 1))
         progress_table.add_column(justify='left', style='bold gold3')
         if self.shot_running_info:
@@ -41,12 +40,13 @@ class ProgressPanel:
             progress_table.add_row(_('Sequence: {}').format(self.sequence_name))
             progress_table.add_row(self.sequence_progress)
 
-        yield Panel(Align.center(progress_table, vertical='top'),
-                    box=box.ROUNDED,
-                    padding=(1, 2, 0, 2),
-                    title='[bold blue]' + _('Progress'),
-                    border_style='bright_blue', )
+        return Panel(Align.center(progress_table, vertical='top'),
+                     box=box.ROUNDED,
+                     padding=(1, 2, 0, 2),
+                     title='[bold blue]' + _('Progress'),
+                     border_style='bright_blue', )
 
     def update_shot_running_info(self, shot_running_info: ShotRunningInfo):
         self.shot_running_info = shot_running_info
         self.image_progress.update(shot_running_info.elapsed_percentage)
+        self.mark_dirty()
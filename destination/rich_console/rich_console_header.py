@@ -1,28 +1,32 @@
 from datetime import datetime
+from time import time
 
 import pytz
-from rich.console import RenderResult, Console, ConsoleOptions
 from rich.panel import Panel
 from rich.table import Table
 from rich.text import Text
 
+from destination.rich_console.cached_panel import CachedPanel
 from destination.rich_console.styles import RichTextStylesEnum
 from utils.localization import get_translated_text as _
 from version import bot_version_string
 
 
-class RichConsoleHeader:
+class RichConsoleHeader(CachedPanel):
     """Display header with clock."""
 
     def __init__(self, config: object):
+        super().__init__()
         self.toast_string = ''
         self.config = config
         self.timezone = pytz.timezone(config.timezone)
 
-    def __rich_console__(
-            self, console: Console, options: ConsoleOptions
-    ) -> RenderResult:
-        yield Panel(self.generate_grid(), style="white on blue")
+    def time_key(self):
+        # The clock ticks every second
+        return int(time())
+
+    def render(self, width: int, height: int):
+        return Panel(self.generate_grid(), style="white on blue")
 
     def generate_grid(self):
         grid = Table.grid(expand=True)
@@ -40,6 +44,8 @@ class RichConsoleHeader:
 
     def show_action_toast(self, toast_string: str):
         self.toast_string = toast_string
+        self.mark_dirty()
 
     def hide_action_toast(self):
         self.toast_string = None
+        self.mark_dirty()
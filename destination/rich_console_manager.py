@@ -1,6 +1,5 @@
 #!/bin/env python3
 import threading
-from collections import deque
 from time import sleep
 
 from rich.layout import Layout
@@ -10,6 +9,7 @@ from console import main_console
 from data_structure.host_info import HostInfo
 from data_structure.imaging_metrics import ImagingMetrics
 from data_structure.log_message_info import LogMessageInfo
+from data_structure.memory_history import MemoryHistory
 from data_structure.shot_running_info import ShotRunningInfo
 from data_structure.special_battery_percentage import SpecialBatteryPercentageEnum, MemoryUsage
 from data_structure.system_status_info import SystemStatusInfo, MountInfo
@@ -22,6 +22,7 @@ from destination.rich_console.progress_panel import ProgressPanel
 from destination.rich_console.rich_console_header import RichConsoleHeader
 from event_emitter import ee
 from event_names import BotEvent
+from state_bus import state_bus
 
 
 class RichConsoleManager:
@@ -39,10 +40,11 @@ class RichConsoleManager:
         self.forecast_panel = None
 
         self.footer_panel = None
+        # Version of the system status snapshot which is currently displayed
+        self.system_status_version = 0
 
         self.setup()
-        # Register events
-        ee.on(BotEvent.UPDATE_SYSTEM_STATUS.name, self.update_status_panels)
+        # Register events. System status is pulled from the state bus in the refresh loop instead.
         ee.on(BotEvent.APPEND_LOG.name, self.update_log_panel)
         ee.on(BotEvent.UPDATE_SHOT_STATUS.name, self.update_shot_status_panel)
         ee.on(BotEvent.UPDATE_HOST_INFO.name, self.update_footer_panel)
@@ -61,12 +63,13 @@ class RichConsoleManager:
         self.forecast_panel = ForecastPanel(layout=self.layout['logs'], config=self.config)
         self.layout['forecast'].update(self.forecast_panel)
         self.layout['header'].update(self.header)
+        self.layout['mount_info'].update(self.mount_panel)
+        self.layout['device_status'].update(self.device_status_panel)
         self.update_status_panels()
-        self.update_mount_info_panel()
 
         self.layout['logs'].update(self.log_panel)
-
         self.layout['imaging'].update(self.progress_panel)
+        self.layout['footer'].update(self.footer_panel)
 
     def run(self):
         if self.thread:
@@ -75,11 +78,29 @@ class RichConsoleManager:
         self.thread.daemon = True
         self.thread.start()
 
+    def panels(self):
+        return [self.header, self.mount_panel, self.forecast_panel, self.progress_panel, self.log_panel,
+                self.device_status_panel, self.footer_panel]
+
     def run_loop(self):
-        with Live(self.layout, refresh_per_second=4, screen=True, redirect_stderr=False):
+        # Only repaint when a panel has new content or the terminal got resized. Panels which did not change replay
+        # their cached lines, so an idle console only redraws once a second for the clock.
+        with Live(self.layout, auto_refresh=False, screen=True, redirect_stderr=False) as live:
+            live.refresh()
+            console_size = live.console.size
             while True:
+                self.pull_state_updates()
+                if console_size != live.console.size or any(panel.is_stale() for panel in self.panels()):
+                    console_size = live.console.size
+                    live.refresh()
                 sleep(0.25)
 
+    def pull_state_updates(self):
+        self.system_status_version, system_status_info = state_bus.latest(BotEvent.UPDATE_SYSTEM_STATUS.name,
+                                                                          self.system_status_version)
+        if system_status_info:
+            self.update_status_panels(system_status_info=system_status_info)
+
     def make_layout(self):
         """Define the layout."""
         layout = Layout(name='root')
@@ -104,17 +125,22 @@ class RichConsoleManager:
         self.layout = layout
 
     def update_mount_info_panel(self, mount_info: MountInfo = MountInfo()):
-        # Update mount information sub-panel
+        # Update mount information sub-panel, panels mark themselves dirty if the mount info has changed
         self.mount_panel.mount_info = mount_info
-        self.forecast_panel.mount_info = mount_info
-        self.layout['mount_info'].update(self.mount_panel)
+        self.forecast_panel.update_mount_info(mount_info)
 
     def update_metrics_panel(self, imaging_metircs: ImagingMetrics = ImagingMetrics()):
         return
 
     def update_device_status_panel(self, system_status_info: SystemStatusInfo = SystemStatusInfo()):
-        self.device_status_panel.system_status_info = system_status_info
-        self.layout['device_status'].update(self.device_status_panel)
+        # Only compare what the panel shows, elapsed time and mount position change with every ControlData
+        device_connection_info = system_status_info.device_connection_info
+        device_status_info = system_status_info.device_status_info
+        if self.device_status_panel.device_connection_info != device_connection_info or \
+                self.device_status_panel.device_status_info != device_status_info:
+            self.device_status_panel.device_connection_info = device_connection_info
+            self.device_status_panel.device_status_info = device_status_info
+            self.device_status_panel.mark_dirty()
 
     def update_status_panels(self, system_status_info: SystemStatusInfo = SystemStatusInfo()):
         """Update 3 panels related to status of the system"""
@@ -131,20 +157,20 @@ class RichConsoleManager:
         # Progress Panel which shows the progress of the imaging session
         self.progress_panel.sequence_target = system_status_info.sequence_name
         if system_status_info.sequence_total_time_in_sec > 0:
-            self.progress_panel.sequence_progress.update(
-                system_status_info.sequence_elapsed_time_in_sec * 100.0 / system_status_info.sequence_total_time_in_sec)
-        self.layout['imaging'].update(self.progress_panel)
+            sequence_percentage = system_status_info.sequence_elapsed_time_in_sec * 100.0 / \
+                                  system_status_info.sequence_total_time_in_sec
+            if self.progress_panel.sequence_progress.completed != sequence_percentage:
+                self.progress_panel.sequence_progress.update(sequence_percentage)
+                self.progress_panel.mark_dirty()
 
     def update_log_panel(self, log: LogMessageInfo = LogMessageInfo()):
         if not log:
             return
 
         self.log_panel.append_log(log)
-        self.layout['logs'].update(self.log_panel)
         if log.type == 'TITLE' or log.type == 'SUBTITLE':
             try:
                 self.header.show_action_toast(log.message)
-                self.layout['header'].update(self.header)
             except Exception as exception:
                 main_console.print(exception)
 
@@ -152,11 +178,10 @@ class RichConsoleManager:
         if not shot_running_info:
             return
         self.progress_panel.update_shot_running_info(shot_running_info=shot_running_info)
-        self.layout['imaging'].update(self.progress_panel)
 
     def update_footer_panel(self, host_info: HostInfo = None,
                             battery_percentage: int = SpecialBatteryPercentageEnum.NOT_MONITORED.value,
-                            update: bool = False, memory_history: deque = None,
+                            update: bool = False, memory_history: MemoryHistory = None,
                             memory_usage: MemoryUsage = None):
         if host_info:
             self.footer_panel.host_info = host_info
@@ -165,4 +190,4 @@ class RichConsoleManager:
         if memory_usage:
             self.footer_panel.memory_usage = memory_usage
 
-        self.layout['footer'].update(self.footer_panel)
+        self.footer_panel.mark_dirty()
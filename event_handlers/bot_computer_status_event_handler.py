@@ -1,16 +1,17 @@
 import datetime
-import os
 import threading
-from collections import deque
+import time
 from time import sleep
 from typing import Dict
 
 import psutil
 
+from data_structure.memory_history import MemoryHistory
 from data_structure.special_battery_percentage import SpecialBatteryPercentageEnum, MemoryUsage
 from event_emitter import ee
 from event_handlers.voyager_event_handler import VoyagerEventHandler
 from event_names import BotEvent
+from utils.process_memory_sampler import ProcessMemorySampler
 
 
 class BotComputerStatusEventHandler(VoyagerEventHandler):
@@ -23,11 +24,16 @@ class BotComputerStatusEventHandler(VoyagerEventHandler):
         super().__init__(config=config)
         self.thread = None
 
-        self.last_battery_warning_timestamp = datetime.datetime.now()
         self.battery_check_enabled = True
         self.last_battery_status = None
-
-        self.memory_usage_history = deque(maxlen=8640)  # 1 data point for 10 sec duration => 1 day usage.
+        self.last_battery_check_time = None  # monotonic timestamp of last battery polling
+        self.battery_check_interval_sec = 60
+        if hasattr(config, 'battery_check_interval_sec'):
+            self.battery_check_interval_sec = config.battery_check_interval_sec
+        self.not_monitored_reported = False
+
+        self.memory_sampler = ProcessMemorySampler(process_name='Voyager2.exe')
+        self.memory_usage_history = MemoryHistory()  # 1 data point for 10 sec duration => 1 day usage, then downsampled
         self.start_gathering()
 
     def interested_event_names(self):
@@ -35,11 +41,13 @@ class BotComputerStatusEventHandler(VoyagerEventHandler):
 
     def handle_event(self, event_name: str, message: Dict):
         if not self.config.monitor_local_computer:
-            ee.emit(BotEvent.UPDATE_BATTERY_PERCENTAGE.name,
-                    battery_percentage=SpecialBatteryPercentageEnum.NOT_MONITORED, update=False)
+            if not self.not_monitored_reported:
+                ee.emit(BotEvent.UPDATE_BATTERY_PERCENTAGE.name,
+                        battery_percentage=SpecialBatteryPercentageEnum.NOT_MONITORED, update=False)
+                self.not_monitored_reported = True
             return
 
-        self.check_battery_status()
+        self.maybe_check_battery_status()
 
         # Check log content and see if there's an OOM exception
         if event_name == 'LogEvent':
@@ -58,33 +66,14 @@ class BotComputerStatusEventHandler(VoyagerEventHandler):
         while True:
             self.maybe_add_memory_datapoint()
             try:
-                if datetime.datetime.now() - self.last_battery_warning_timestamp > datetime.timedelta(minutes=1):
-                    self.check_battery_status()
-                    self.last_battery_warning_timestamp = datetime.datetime.now()
+                self.maybe_check_battery_status()
             except Exception as exception:
                 pass
             sleep(10)
 
     def maybe_add_memory_datapoint(self, oom_observed: bool = False):
-        # Iterate over the list
-        voyager_vms_usage = 0
-        voyager_rss_usage = 0
-        bot_vms_usage = 0
-        bot_rss_usage = 0
-        bot_pid = os.getpid()
-
-        for proc in psutil.process_iter():
-            try:
-                # Fetch process details as dict
-                pinfo = proc.as_dict(attrs=['pid', 'name', 'username'])
-                if pinfo['name'] == 'Voyager2.exe':
-                    voyager_vms_usage = proc.memory_info().vms / (1024 * 1024)
-                    voyager_rss_usage = proc.memory_info().rss / (1024 * 1024)
-                if pinfo['pid'] == bot_pid:
-                    bot_vms_usage = proc.memory_info().vms / (1024 * 1024)
-                    bot_rss_usage = proc.memory_info().rss / (1024 * 1024)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
+        voyager_vms_usage, voyager_rss_usage = self.memory_sampler.sample_target()
+        bot_vms_usage, bot_rss_usage = self.memory_sampler.sample_self()
 
         timestamp = datetime.datetime.now().timestamp()
         memory_usage = MemoryUsage(timestamp=timestamp, voyager_vms=voyager_vms_usage, voyager_rss=voyager_rss_usage,
@@ -95,6 +84,15 @@ class BotComputerStatusEventHandler(VoyagerEventHandler):
         ee.emit(BotEvent.UPDATE_MEMORY_USAGE.name,
                 memory_history=self.memory_usage_history, memory_usage=memory_usage)
 
+    def maybe_check_battery_status(self):
+        """Polls battery status, at most once per 'battery_check_interval_sec'."""
+        now = time.monotonic()
+        if self.last_battery_check_time is not None and \
+                now - self.last_battery_check_time < self.battery_check_interval_sec:
+            return
+        self.last_battery_check_time = now
+        self.check_battery_status()
+
     def check_battery_status(self):
         battery = psutil.sensors_battery()
         if battery and self.last_battery_status and \
@@ -1,12 +1,16 @@
 import base64
+import ntpath
 import os
-from collections import deque
+import threading
+import time
+from collections import OrderedDict
 from typing import Dict
 
-from data_structure.filter_info import ExposureInfo
+from data_structure.filter_info import ExposureInfo, register_filter_aliases
 from data_structure.focus_result import FocusResult
 from data_structure.image_types import ImageTypeEnum, FitTypeEnum
 from data_structure.log_message_info import LogMessageInfo
+from data_structure.memory_history import MemoryHistory
 from data_structure.special_battery_percentage import MemoryUsage
 from data_structure.system_status_info import GuideStatusEnum, DitherStatusEnum
 from event_emitter import ee
@@ -14,6 +18,7 @@ from event_handlers.voyager_event_handler import VoyagerEventHandler
 from event_names import BotEvent
 from sequence_stat import StatPlotter, SequenceStat
 from utils.database.sequence_database_manager import SequenceDatabaseManager
+from utils.focus_model import FocusModel
 from utils.localization import get_translated_text as _
 
 
@@ -31,6 +36,8 @@ class GiantEventHandler(VoyagerEventHandler):
 
         self.running_seq = ''
         self.running_dragscript = ''
+        # Target name voyager reported for the last frame of the running sequence
+        self.voyager_sequence_target = ''
 
         self.shot_running = False  # whether the camera is exposing, inferred from 'ShotRunning' event
 
@@ -42,7 +49,43 @@ class GiantEventHandler(VoyagerEventHandler):
 
         self.filter_name_list = [i for i in range(10)]  # initial with 10 unnamed filters
         self.image_type_set = set()
-        self.memory_history = deque()
+        self.memory_history = MemoryHistory()
+
+        if hasattr(config.sequence_stats_config, 'filter_aliases') and config.sequence_stats_config.filter_aliases:
+            register_filter_aliases(config.sequence_stats_config.filter_aliases)
+
+        self.focus_model = None
+        if hasattr(config, 'focus_model_file') and config.focus_model_file:
+            self.focus_model = FocusModel(model_filename=config.focus_model_file)
+
+        # Where fits files reported by voyager can be read by the bot, when they run on different computers
+        self.voyager_fits_prefix = ''
+        self.local_fits_prefix = ''
+        if hasattr(config, 'voyager_fits_path_prefix') and config.voyager_fits_path_prefix:
+            self.voyager_fits_prefix = config.voyager_fits_path_prefix
+            self.local_fits_prefix = config.local_fits_path_prefix or ''
+
+        # Previews rendered by the bot from fits files, for when voyager's own jpg is turned off
+        self.fits_preview_renderer = None
+        if hasattr(config, 'fits_preview_config') and config.fits_preview_config.enabled:
+            # Imported here, so opencv is only needed when previews are enabled
+            from utils.fits_preview import FitsPreviewRenderer
+            preview_config = config.fits_preview_config
+            self.fits_preview_renderer = FitsPreviewRenderer(zoom_factor=getattr(preview_config, 'zoom_factor', 0.25),
+                                                             quality=getattr(preview_config, 'jpg_quality', 90),
+                                                             worker_count=getattr(preview_config, 'worker_count', 2))
+
+        # Star measurements by the bot, for frames voyager doesn't measure and for FWHM and eccentricity
+        self.image_analyzer = None
+        if hasattr(config, 'image_analysis_config') and config.image_analysis_config.enabled:
+            from utils.image_analysis import ImageAnalyzer
+            self.image_analyzer = ImageAnalyzer(worker_count=getattr(config.image_analysis_config, 'worker_count', 2))
+        # Exposures and analysis results of recent frames by file identifier, whichever comes first waits for the other
+        self.recent_exposures = OrderedDict()  # type: OrderedDict[str, ExposureInfo]
+        # Guards recent exposures and the sequence stats, which previews and analysis results update from worker
+        # threads while the event thread adds guide errors and the stats get plotted
+        self.exposure_lock = threading.Lock()
+        self.report_lock = threading.Lock()
 
         ee.on(BotEvent.UPDATE_MEMORY_USAGE.name, self.update_memory_usage)
 
@@ -109,7 +152,8 @@ class GiantEventHandler(VoyagerEventHandler):
                         _('DragScript {ds_name} finished.').format(ds_name=self.running_dragscript))
             elif self.running_dragscript == '':
                 # a DS has changed from empty to non-empty. Probably a new DS has started.
-                self.sequence_map = {}
+                with self.exposure_lock:
+                    self.sequence_map = {}
                 ee.emit(BotEvent.UNPIN_ALL_MESSAGE.name)
                 ee.emit(BotEvent.SEND_TEXT_MESSAGE.name,
                         _('DragScript {ds_name} started.').format(ds_name=running_dragscript))
@@ -137,6 +181,7 @@ class GiantEventHandler(VoyagerEventHandler):
                 ee.emit(BotEvent.SEND_TEXT_MESSAGE.name, message)
                 self.report_stats_for_current_sequence()
             self.running_seq = running_seq
+            self.voyager_sequence_target = ''
 
     def handle_focus_result(self, message: Dict):
         is_empty = message['IsEmpty']
@@ -160,7 +205,7 @@ class GiantEventHandler(VoyagerEventHandler):
         timestamp = message['Timestamp']
 
         focus_result = FocusResult(filter_name=str(filter_index), filter_color=filter_color, hfd=hfd,
-                                   timestamp=timestamp, temperature=focus_temp)
+                                   timestamp=timestamp, temperature=focus_temp, position=position)
         self.add_focus_result(focus_result)
 
         filter_name = self.filter_name_list[filter_index]
@@ -169,6 +214,17 @@ class GiantEventHandler(VoyagerEventHandler):
             'AutoFocusing for filter {filter_name} succeeded with position {position}, HFD: {hfd:.2f}').format(
             filter_name=filter_name, position=position,
             hfd=hfd)
+
+        if self.focus_model:
+            # Predict before learning from this result, so the residual tells how good the model would have been
+            predicted_position = self.focus_model.predict(filter_index, focus_temp)
+            self.focus_model.add_result(filter_index, focus_temp, position)
+            if predicted_position is not None:
+                telegram_message += '\n' + _(
+                    'Temperature model predicted {predicted_position:.0f} at {temperature:.1f}°C, '
+                    'residual: {residual:+.0f}').format(
+                    predicted_position=predicted_position, temperature=focus_temp,
+                    residual=position - predicted_position)
         ee.emit(BotEvent.SEND_TEXT_MESSAGE.name, telegram_message)
 
     def handle_jpg_ready(self, message: Dict):
@@ -179,6 +235,7 @@ class GiantEventHandler(VoyagerEventHandler):
         star_index = message['StarIndex']
         sequence_target = message['SequenceTarget']
         timestamp = message['TimeInfo']
+        self.voyager_sequence_target = sequence_target
 
         telegram_message = _(
             'Exposure of {sequence_target} for {expo}sec using '
@@ -197,7 +254,8 @@ class GiantEventHandler(VoyagerEventHandler):
         if should_send_image:
             # new stat code
             exposure = ExposureInfo(filter_name=filter_name, exposure_time=expo, hfd=hfd, star_index=star_index,
-                                    timestamp=timestamp, sequence_target=sequence_target, seeing=seeing())
+                                    timestamp=timestamp, sequence_target=sequence_target, seeing=seeing(),
+                                    file_identifier=file_identifier)
             self.add_exposure_stats(exposure=exposure, sequence_name=self.running_seq)
             # with PINNING and UNPINNING implemented, we can safely report stats for all images
             self.report_stats_for_current_sequence()
@@ -218,39 +276,119 @@ class GiantEventHandler(VoyagerEventHandler):
         fit_type = message['VoyType']
 
         image_identifier = self.get_image_identifier(file_name)
-        self.current_sequence_stat()
+        with self.exposure_lock:
+            self.current_sequence_stat()
         self.sequence_database_manager.add_fit_file(file_name)
         if image_type == ImageTypeEnum.LIGHT.value and fit_type != FitTypeEnum.SYNC.value:
-            self.image_type_set.add(image_identifier)
+            if self.image_analyzer:
+                self.image_analyzer.submit(self.local_fits_path(file_name), self.handle_frame_quality)
+            if self.fits_preview_renderer:
+                self.fits_preview_renderer.submit(self.local_fits_path(file_name), self.handle_fits_preview)
+            else:
+                self.image_type_set.add(image_identifier)
+
+    def handle_fits_preview(self, file_path: str, image_data: bytes, fits_image):
+        """Called from a preview worker thread, when the preview of a light frame is ready."""
+        sequence_target = self.frame_sequence_target()
+        telegram_message = _('Exposure of {sequence_target} for {expo}sec using {filter_name} filter.').format(
+            sequence_target=sequence_target, expo=fits_image.exposure_time, filter_name=fits_image.filter_name)
+        ee.emit(BotEvent.SEND_IMAGE_MESSAGE.name, image_data=image_data,
+                filename=self.get_image_identifier(file_path) + '.jpg', caption=telegram_message)
+
+        exposure = ExposureInfo(filter_name=fits_image.filter_name, exposure_time=fits_image.exposure_time,
+                                timestamp=time.time(), sequence_target=sequence_target, seeing=seeing(),
+                                file_identifier=self.get_image_identifier(file_path))
+        self.add_exposure_stats(exposure=exposure, sequence_name=self.running_seq)
+        self.report_stats_for_current_sequence()
+
+    def handle_frame_quality(self, frame_quality):
+        """
+        Called from the image analyzer when a light frame is measured. The measurements are merged into the exposure
+        of the same frame, or become a new exposure if voyager doesn't report the frame (e.g. jpg is turned off).
+        Stats are not reported from here, the next report will include them.
+        """
+        self.sequence_database_manager.add_frame_quality(frame_quality)
+        file_identifier = self.get_image_identifier(frame_quality.file_path)
+        with self.exposure_lock:
+            exposure = self.recent_exposures.get(file_identifier)
+            if exposure is None:
+                exposure = ExposureInfo(filter_name=frame_quality.filter_name,
+                                        exposure_time=frame_quality.exposure_time, timestamp=time.time(),
+                                        sequence_target=self.frame_sequence_target(),
+                                        file_identifier=file_identifier)
+                self.remember_exposure(exposure)
+                self.current_sequence_stat().add_exposure(exposure)
+            # Voyager's own measurements are kept when there are some
+            exposure.hfd = exposure.hfd or frame_quality.hfd
+            exposure.star_index = exposure.star_index or frame_quality.star_count
+            exposure.fwhm = frame_quality.fwhm
+            exposure.eccentricity = frame_quality.eccentricity
 
     # Helper methods
 
     def current_sequence_stat(self) -> SequenceStat:
+        """Stats of the running sequence, callers hold exposure_lock."""
         name = self.running_seq or 'default'
-        default_sequence_stat = SequenceStat(name=name)
-        existing_exposure_info = self.sequence_database_manager.get_accumulated_exposure(object_name=name)
-        default_sequence_stat.merge_existing_exposure_info(existing_exposure_info)
-        self.sequence_map.setdefault(name, default_sequence_stat)
+        if name not in self.sequence_map:
+            # History of the target is only read once, totals of new exposures are kept by the stats from here
+            sequence_stat = SequenceStat(name=name)
+            existing_exposure_info = self.sequence_database_manager.get_accumulated_exposure(object_name=name)
+            sequence_stat.merge_existing_exposure_info(existing_exposure_info)
+            self.sequence_map[name] = sequence_stat
         return self.sequence_map[name]
 
+    def frame_sequence_target(self) -> str:
+        """
+        Target name of frames the bot learns about from fits files. It's the same as the one of exposures reported by
+        voyager, since OBJECT of the fits header may be spelled differently (e.g. 'M 42' vs 'M42'), which would make
+        the same target two bars of the exposure stats.
+        """
+        return self.voyager_sequence_target or self.running_seq
+
     def add_exposure_stats(self, exposure: ExposureInfo, sequence_name: str):
-        self.current_sequence_stat().add_exposure(exposure)
+        with self.exposure_lock:
+            existing_exposure = self.recent_exposures.get(exposure.file_identifier)
+            if existing_exposure is None:
+                self.remember_exposure(exposure)
+                self.current_sequence_stat().add_exposure(exposure)
+                return
+            # The frame was already added by its analysis result, take voyager's measurements over
+            existing_exposure.hfd = exposure.hfd or existing_exposure.hfd
+            existing_exposure.star_index = exposure.star_index or existing_exposure.star_index
+            existing_exposure.seeing = exposure.seeing
+
+    def remember_exposure(self, exposure: ExposureInfo):
+        if not exposure.file_identifier:
+            return
+        self.recent_exposures[exposure.file_identifier] = exposure
+        while len(self.recent_exposures) > 100:
+            self.recent_exposures.popitem(last=False)
 
     def add_guide_error_stat(self, error_x: float, error_y: float):
-        self.current_sequence_stat().add_guide_error((error_x, error_y))
+        with self.exposure_lock:
+            self.current_sequence_stat().add_guide_error((error_x, error_y))
 
     def add_focus_result(self, focus_result: FocusResult):
-        self.current_sequence_stat().add_focus_result(focus_result)
+        with self.exposure_lock:
+            self.current_sequence_stat().add_focus_result(focus_result)
 
-    def update_memory_usage(self, memory_history: deque, memory_usage: MemoryUsage):
+    def update_memory_usage(self, memory_history: MemoryHistory, memory_usage: MemoryUsage):
         self.memory_history = memory_history
 
+    def local_fits_path(self, voyager_path: str) -> str:
+        """Where a fits file reported by voyager can be read by the bot, when they run on different computers."""
+        if not self.voyager_fits_prefix or not voyager_path.startswith(self.voyager_fits_prefix):
+            return voyager_path
+        relative_path = voyager_path[len(self.voyager_fits_prefix):].lstrip('\\/')
+        return os.path.join(self.local_fits_prefix, *relative_path.replace('\\', '/').split('/'))
+
     @staticmethod
     def get_image_identifier(raw_path: str = '') -> str:
         if not raw_path:
             return ''
 
-        raw_file_name = os.path.basename(raw_path)
+        # Voyager reports windows paths while analyzed frames have local paths, ntpath splits on both separators
+        raw_file_name = ntpath.basename(raw_path)
         if '.' in raw_file_name:
             return raw_file_name[:raw_file_name.rindex('.')]
 
@@ -259,8 +397,11 @@ class GiantEventHandler(VoyagerEventHandler):
     # Reporting methods
 
     def report_stats_for_current_sequence(self):
-        sequence_stat = self.current_sequence_stat()
-
-        sequence_stat_image = self.stat_plotter.plot(sequence_stat=sequence_stat, memory_history=self.memory_history)
+        # Previews report from their worker threads, matplotlib can only draw one figure at a time. Stats can't change
+        # while they are plotted, analysis results are added from the analyzer's threads.
+        with self.report_lock, self.exposure_lock:
+            sequence_stat = self.current_sequence_stat()
+            sequence_stat_image = self.stat_plotter.plot(sequence_stat=sequence_stat,
+                                                         memory_history=self.memory_history)
         ee.emit(BotEvent.UPDATE_SEQUENCE_STAT_IMAGE.name, sequence_stat_image=sequence_stat_image,
                 sequence_name=self.running_seq, sequence_stat_message='This is a test message')
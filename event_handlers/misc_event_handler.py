@@ -10,16 +10,14 @@ from utils.localization import get_translated_text as _
 class MiscellaneousEventHandler(VoyagerEventHandler):
     def __init__(self, config):
         super().__init__(config=config)
-        self.message_counter = 0
 
-    def interested_in_all_events(self):
-        return True
+    def interested_event_name(self):
+        # Message counting is done by VoyagerClient, so there's no need to look at every single event here.
+        return 'Version'
 
     def handle_event(self, event_name: str, message: Dict):
-        self.message_counter += 1
         if event_name == 'Version':
             self.handle_version(message)
-        ee.emit(BotEvent.UPDATE_MESSAGE_COUNTER.name, counter_number=self.message_counter)
 
     def handle_version(self, message: Dict):
         host_info = HostInfo(host_name=message['Host'],
@@ -1,19 +1,48 @@
-import re
+from functools import partial, lru_cache
 from typing import Dict
 
-from dateutil.parser import parse
-
 from data_structure.system_status_info import SystemStatusInfo, MountInfo, DeviceConnectedInfo, DeviceStatusInfo, \
     FocuserStatus, RotatorStatus, MountStatusEnum, CcdStatus, DitherStatusEnum, GuideStatusEnum, CcdStatusEnum, \
     VoyagerStatusEnum
-from event_emitter import ee
 from event_handlers.voyager_event_handler import VoyagerEventHandler
 from event_names import BotEvent
+from state_bus import state_bus
+
+
+MOUNT_INFO_FIELDS = ('MNTRA', 'MNTDEC', 'MNTRAJ2000', 'MNTDECJ2000', 'MNTAZ', 'MNTALT', 'MNTPIER', 'MNTTFLIP')
+DEVICE_CONNECTION_FIELDS = ('SETUPCONN', 'CCDCONN', 'MNTCONN', 'AFCONN', 'GUIDECONN', 'PLACONN', 'ROTCONN')
+DEVICE_STATUS_FIELDS = ('GUIDESTAT', 'DITHSTAT', 'VOYSTAT', 'CCDSTAT', 'CCDTEMP', 'CCDPOW', 'MNTTRACK', 'MNTSLEW',
+                        'MNTPARK', 'AFTEMP', 'AFPOS', 'ROTSKYPA', 'ROTPA', 'ROTISROT')
+
+
+@lru_cache(maxsize=256)
+def hms_to_seconds(hms_string: str) -> int:
+    """
+    Converts a 'HH:MM:SS' string from ControlData into seconds. Any character other than digits and colons is ignored,
+    since Voyager sometimes decorates these values.
+    Results are memoized on the raw string, as these values change at most once per second.
+    """
+    cleaned_string = ''.join(c for c in hms_string if c.isdigit() or c == ':')
+    seconds = 0
+    for part in cleaned_string.split(':')[:3]:
+        seconds = seconds * 60 + (int(part) if part else 0)
+    return seconds
+
+
+def strip_spaces(angle_string: str) -> str:
+    return angle_string.replace(' ', '')
 
 
 class SystemStatusEventHandler(VoyagerEventHandler):
     def __init__(self, config):
         super().__init__(config=config)
+        # Raw ControlData fields and the objects built from them. Objects are rebuilt only when the fields change.
+        self.mount_info_key = None
+        self.mount_info = MountInfo()
+        self.device_connection_key = None
+        self.device_connection_info = DeviceConnectedInfo()
+        self.device_status_key = None
+        self.device_status_info = DeviceStatusInfo()
 
     def interested_event_name(self):
         return 'ControlData'
@@ -23,6 +52,12 @@ class SystemStatusEventHandler(VoyagerEventHandler):
             self.handle_control_data_event(message)
 
     def handle_control_data_event(self, message: Dict):
+        # ControlData arrives every second, while status panels only repaint at their own pace. Leave the latest
+        # message in the bus and only build the status objects when a consumer actually pulls them.
+        state_bus.publish(BotEvent.UPDATE_SYSTEM_STATUS.name,
+                          factory=partial(self.build_system_status_info, message))
+
+    def build_system_status_info(self, message: Dict) -> SystemStatusInfo:
         running_seq = message['RUNSEQ']
         running_dragscript = message['RUNDS']
 
@@ -32,34 +67,42 @@ class SystemStatusEventHandler(VoyagerEventHandler):
         sequence_total_time_in_sec = 0
         sequence_elapsed_time_in_sec = 0
         if message['SEQSTART'] and message['SEQREMAIN'] and message['SEQEND']:
-            sequence_start_string = re.sub(r'[^0-9:]', '', message['SEQSTART'])
-            sequence_start_time = parse(sequence_start_string).time()
-            sequence_remaining_string = re.sub(r'[^0-9:]', '', message['SEQREMAIN'])
-            sequence_remaining_time = parse(sequence_remaining_string).time()
-            sequence_end_string = re.sub(r'[^0-9:]', '', message['SEQEND'])
-            sequence_end_time = parse(sequence_end_string).time()
-            sequence_start_time_in_sec = sequence_start_time.hour * 60 * 60 + \
-                                         sequence_start_time.minute * 60 + \
-                                         sequence_start_time.second
-            sequence_remaining_time_in_sec = sequence_remaining_time.hour * 60 * 60 + \
-                                             sequence_remaining_time.minute * 60 + \
-                                             sequence_remaining_time.second
-            sequence_end_time_in_sec = sequence_end_time.hour * 60 * 60 + \
-                                       sequence_end_time.minute * 60 + \
-                                       sequence_end_time.second
+            sequence_start_time_in_sec = hms_to_seconds(message['SEQSTART'])
+            sequence_remaining_time_in_sec = hms_to_seconds(message['SEQREMAIN'])
+            sequence_end_time_in_sec = hms_to_seconds(message['SEQEND'])
             sequence_total_time_in_sec = sequence_end_time_in_sec - sequence_start_time_in_sec
             if sequence_end_time_in_sec < sequence_start_time_in_sec:
                 sequence_total_time_in_sec += 86400
             sequence_elapsed_time_in_sec = sequence_total_time_in_sec - sequence_remaining_time_in_sec
 
-        mount_info = MountInfo(
-            ra=message['MNTRA'], dec=message['MNTDEC'].replace(' ', ''),
-            ra_j2000=message['MNTRAJ2000'], dec_j2000=message['MNTDECJ2000'].replace(' ', ''),
-            az=message['MNTAZ'].replace(' ', '') or '0°00\'00"', alt=message['MNTALT'].replace(' ', '') or '0°00\'00"',
+        return SystemStatusInfo(drag_script_name=running_dragscript, sequence_name=running_seq,
+                                sequence_elapsed_time_in_sec=sequence_elapsed_time_in_sec,
+                                sequence_total_time_in_sec=sequence_total_time_in_sec,
+                                mount_info=self.maybe_update_mount_info(message),
+                                device_connection_info=self.maybe_update_device_connection_info(message),
+                                device_status_info=self.maybe_update_device_status_info(message))
+
+    def maybe_update_mount_info(self, message: Dict) -> MountInfo:
+        key = tuple(message[field] for field in MOUNT_INFO_FIELDS)
+        if key == self.mount_info_key:
+            return self.mount_info
+
+        self.mount_info_key = key
+        self.mount_info = MountInfo(
+            ra=message['MNTRA'], dec=strip_spaces(message['MNTDEC']),
+            ra_j2000=message['MNTRAJ2000'], dec_j2000=strip_spaces(message['MNTDECJ2000']),
+            az=strip_spaces(message['MNTAZ']) or '0°00\'00"', alt=strip_spaces(message['MNTALT']) or '0°00\'00"',
             pier=message['MNTPIER'][4:], time_to_flip=message['MNTTFLIP']
         )
+        return self.mount_info
+
+    def maybe_update_device_connection_info(self, message: Dict) -> DeviceConnectedInfo:
+        key = tuple(message[field] for field in DEVICE_CONNECTION_FIELDS)
+        if key == self.device_connection_key:
+            return self.device_connection_info
 
-        device_connection_info = DeviceConnectedInfo(
+        self.device_connection_key = key
+        self.device_connection_info = DeviceConnectedInfo(
             setup_connected=message['SETUPCONN'],
             camera_connected=message['CCDCONN'],
             mount_connected=message['MNTCONN'],
@@ -68,7 +111,14 @@ class SystemStatusEventHandler(VoyagerEventHandler):
             planetarium_connected=message['PLACONN'],
             rotator_connected=message['ROTCONN']
         )
+        return self.device_connection_info
 
+    def maybe_update_device_status_info(self, message: Dict) -> DeviceStatusInfo:
+        key = tuple(message[field] for field in DEVICE_STATUS_FIELDS)
+        if key == self.device_status_key:
+            return self.device_status_info
+
+        self.device_status_key = key
         is_tracking = message['MNTTRACK']
         is_slewing = message['MNTSLEW']
         is_parked = message['MNTPARK']
@@ -88,17 +138,44 @@ class SystemStatusEventHandler(VoyagerEventHandler):
         rotator_status = RotatorStatus(sky_pa=message['ROTSKYPA'], rotator_pa=message['ROTPA'],
                                        is_rotating=message['ROTISROT'])
 
-        device_status_info = DeviceStatusInfo(
+        self.device_status_info = DeviceStatusInfo(
             guide_status=GuideStatusEnum(message['GUIDESTAT']), dither_status=DitherStatusEnum(message['DITHSTAT']),
             voyager_status=VoyagerStatusEnum(message['VOYSTAT']), ccd_status=ccd_status,
             mount_status=mount_status, focuser_status=focuser_status,
             rotator_status=rotator_status
         )
-
-        ee.emit(BotEvent.UPDATE_SYSTEM_STATUS.name,
-                system_status_info=SystemStatusInfo(
-                    drag_script_name=running_dragscript, sequence_name=running_seq,
-                    sequence_elapsed_time_in_sec=sequence_elapsed_time_in_sec,
-                    sequence_total_time_in_sec=sequence_total_time_in_sec,
-                    mount_info=mount_info, device_connection_info=device_connection_info,
-                    device_status_info=device_status_info))
+        return self.device_status_info
+
+
+if __name__ == '__main__':
+    # Micro benchmark: python -m event_handlers.system_status_event_handler
+    import re
+    import timeit
+
+    from dateutil.parser import parse
+
+    control_data = {
+        'Event': 'ControlData', 'Timestamp': 1637695689.48418, 'Host': 'DESKTOP-USODEM7', 'Inst': 1,
+        'VOYSTAT': 2, 'SETUPCONN': True, 'CCDCONN': True, 'CCDTEMP': -10, 'CCDPOW': 35, 'CCDSETP': -10,
+        'CCDCOOL': True, 'CCDSTAT': 5, 'MNTCONN': True, 'MNTPARK': False, 'MNTRA': '05:35:17',
+        'MNTDEC': '-05° 23\' 28"', 'MNTRAJ2000': '05:34:01', 'MNTDECJ2000': '-05° 24\' 01"', 'MNTAZ': '170° 12\' 15"',
+        'MNTALT': '45° 01\' 02"', 'MNTPIER': 'pierEast', 'MNTTFLIP': '-01:10:05', 'MNTSFLIP': 0, 'MNTTRACK': True,
+        'MNTSLEW': False, 'AFCONN': True, 'AFTEMP': 4.5, 'AFPOS': 12345, 'SEQTOT': 0, 'SEQPARZ': 0,
+        'GUIDECONN': True, 'GUIDESTAT': 2, 'DITHSTAT': 0, 'GUIDEX': 0.12, 'GUIDEY': -0.08, 'PLACONN': True,
+        'PSCONN': False, 'SEQNAME': 'M42', 'SEQSTART': '18:59:11', 'SEQREMAIN': '00:47:33', 'SEQEND': '20:04:07',
+        'RUNSEQ': 'M42', 'RUNDS': 'Night', 'ROTCONN': False, 'ROTPA': 0, 'ROTSKYPA': 0, 'ROTISROT': False,
+    }
+
+    def legacy_seconds(hms_string: str) -> int:
+        parsed_time = parse(re.sub(r'[^0-9:]', '', hms_string)).time()
+        return parsed_time.hour * 60 * 60 + parsed_time.minute * 60 + parsed_time.second
+
+    number = 10000
+    for label, statement in [
+        ('regex + dateutil', lambda: [legacy_seconds(control_data[k]) for k in ('SEQSTART', 'SEQREMAIN', 'SEQEND')]),
+        ('hms_to_seconds', lambda: [hms_to_seconds(control_data[k]) for k in ('SEQSTART', 'SEQREMAIN', 'SEQEND')]),
+        ('build_system_status_info', partial(SystemStatusEventHandler(config=None).build_system_status_info,
+                                             control_data)),
+    ]:
+        elapsed = timeit.timeit(statement, number=number)
+        print(f'{label:>26}: {elapsed * 1e6 / number:8.2f} us per ControlData')
@@ -0,0 +1,74 @@
+import time
+from typing import Dict
+
+from data_structure.special_battery_percentage import MemoryUsage
+from data_structure.system_status_info import GuideStatusEnum, SpecialDeviceReadingEnum
+from event_emitter import ee
+from event_handlers.voyager_event_handler import VoyagerEventHandler
+from event_names import BotEvent
+from utils.database.time_series_store import TimeSeriesStore
+
+
+class TelemetryEventHandler(VoyagerEventHandler):
+    """Records numeric telemetry (guiding, temperatures, focus, weather, memory) into the time series store."""
+
+    def __init__(self, config):
+        super().__init__(config=config)
+        raw_retention_days = 7
+        if hasattr(config, 'telemetry_raw_retention_days'):
+            raw_retention_days = config.telemetry_raw_retention_days
+        self.store = TimeSeriesStore(database_filename=config.telemetry_database,
+                                     raw_retention_days=raw_retention_days)
+        self.store.start()
+
+        ee.on(BotEvent.UPDATE_MEMORY_USAGE.name, self.record_memory_usage)
+
+    def interested_event_names(self):
+        return ['ControlData', 'WeatherAndSafetyMonitorData', 'AutoFocusResult', 'NewJPGReady']
+
+    def handle_event(self, event_name: str, message: Dict):
+        timestamp = message.get('Timestamp') or time.time()
+        if event_name == 'ControlData':
+            self.record_control_data(message, timestamp)
+        elif event_name == 'WeatherAndSafetyMonitorData':
+            self.record_weather_data(message, timestamp)
+        elif event_name == 'AutoFocusResult':
+            if message.get('IsEmpty') == 'true' or not message.get('Done'):
+                return
+            self.store.record('focus.hfd', message['HFD'], timestamp)
+            self.store.record('focus.position', message['Position'], timestamp)
+            self.record_device_reading('focus.temperature', message['FocusTemp'], timestamp)
+        elif event_name == 'NewJPGReady':
+            self.store.record('image.hfd', message['HFD'], timestamp)
+            self.store.record('image.star_index', message['StarIndex'], timestamp)
+
+    def record_control_data(self, message: Dict, timestamp: float):
+        # Only record readings of connected devices, and guiding errors while guiding
+        if message['GUIDECONN'] and message['GUIDESTAT'] == GuideStatusEnum.RUNNING:
+            self.store.record('guide.error_x', message['GUIDEX'], timestamp)
+            self.store.record('guide.error_y', message['GUIDEY'], timestamp)
+        if message['CCDCONN']:
+            self.record_device_reading('ccd.temperature', message['CCDTEMP'], timestamp)
+            self.record_device_reading('ccd.power', message['CCDPOW'], timestamp)
+        if message['AFCONN']:
+            self.record_device_reading('focuser.temperature', message['AFTEMP'], timestamp)
+
+    def record_device_reading(self, name: str, value, timestamp: float):
+        # Connected devices still report special values, e.g. a focuser without temperature probe, they aren't readings
+        if value in (SpecialDeviceReadingEnum.VALUE_DEVICE_OFF, SpecialDeviceReadingEnum.VALUE_ERROR):
+            return
+        self.store.record(name, value, timestamp)
+
+    def record_weather_data(self, message: Dict, timestamp: float):
+        # Weather stations report different sets of readings, keep every numeric one
+        for key, value in message.items():
+            if key.startswith('WS') and isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.store.record(f'weather.{key[2:].lower()}', value, timestamp)
+
+    def record_memory_usage(self, memory_usage: MemoryUsage = None, **kwargs):
+        if not memory_usage:
+            return
+        self.store.record('memory.voyager_rss', memory_usage.voyager_rss, memory_usage.timestamp)
+        self.store.record('memory.voyager_vms', memory_usage.voyager_vms, memory_usage.timestamp)
+        self.store.record('memory.bot_rss', memory_usage.bot_rss, memory_usage.timestamp)
+        self.store.record('memory.bot_vms', memory_usage.bot_vms, memory_usage.timestamp)
@@ -6,6 +6,8 @@ import dataclasses
 
 # This is just one of the event handlers which are interested in log events. You can write more
 from utils.observing_condition_reporter import ObservingConditionReporter
+from utils.sky_data_utils import get_weather_conditions, get_roof_condition, SkyCondition, CloudCondition, \
+    WindCondition, RainCondition, DayCondition
 
 
 class WeatherSafetyHandler(VoyagerEventHandler):
@@ -20,6 +22,14 @@ class WeatherSafetyHandler(VoyagerEventHandler):
         # latest WeatherSafety data class from 'LogEvent'
         self.ws_log_event = None
 
+        # Local sky condition and roof files, when available they fill in what Voyager didn't tell us
+        self.sky_condition_file = ''
+        self.roof_condition_file = ''
+        if hasattr(self.config.observing_condition_config, 'sky_condition_file'):
+            self.sky_condition_file = self.config.observing_condition_config.sky_condition_file
+        if hasattr(self.config.observing_condition_config, 'roof_condition_file'):
+            self.roof_condition_file = self.config.observing_condition_config.roof_condition_file
+
     def interested_event_names(self):
         return [
             'LogEvent',
@@ -126,12 +136,31 @@ class WeatherSafetyHandler(VoyagerEventHandler):
             ws.rain = self.ws_wasmd.rain
         if not ws.light:
             ws.light = self.ws_wasmd.light
+        self.merge_condition_files(ws)
         ws.weather_station_connected = self.ws_wasmd.weather_station_connected
         ws.safe_monitor_connected = self.ws_wasmd.safe_monitor_connected
         ws.safe_monitor_status = self.ws_wasmd.safe_monitor_status
         reporter = ObservingConditionReporter(ws=ws)
         reporter.report()
 
+    def merge_condition_files(self, ws: WeatherSafety):
+        # Snapshots are cached by the file watchers, files are only read again when they change
+        if self.sky_condition_file:
+            sky_conditions = get_weather_conditions(file_path=self.sky_condition_file)
+            if not ws.cloud and sky_conditions[SkyCondition.CLOUD]:
+                ws.cloud = CloudCondition(sky_conditions[SkyCondition.CLOUD]).name
+            if not ws.wind and sky_conditions[SkyCondition.WIND]:
+                ws.wind = WindCondition(sky_conditions[SkyCondition.WIND]).name
+            if not ws.rain and sky_conditions[SkyCondition.RAIN]:
+                ws.rain = RainCondition(sky_conditions[SkyCondition.RAIN]).name
+            if not ws.light and sky_conditions[SkyCondition.DAYLIGHT]:
+                ws.light = DayCondition(sky_conditions[SkyCondition.DAYLIGHT]).name
+        if self.roof_condition_file:
+            roof_condition = get_roof_condition(file_path=self.roof_condition_file)
+            if roof_condition != 'UNKNOWN':
+                # The roof status file is more reliable than guessing from the source of the emergency
+                ws.roof = roof_condition
+
 
 if __name__ == '__main__':
     from configs import ConfigBuilder
@@ -2,10 +2,10 @@
 import gc
 import io
 import math
-from collections import defaultdict, deque
+import sys
 from datetime import datetime
 from statistics import mean, stdev
-from typing import Tuple
+from typing import Dict, Tuple
 
 import matplotlib
 import numpy as np
@@ -16,6 +16,7 @@ from matplotlib.dates import ConciseDateFormatter, AutoDateLocator
 
 from data_structure.filter_info import ExposureInfo
 from data_structure.focus_result import FocusResult
+from data_structure.memory_history import MemoryHistory, MEMORY_USAGE_DTYPE
 
 matplotlib.use('agg')
 
@@ -26,17 +27,29 @@ class SequenceStat:
         self.name = name
         self.existing_exposure_info_list = list()
         self.exposure_info_list = list()
+        # Running exposure time totals in seconds, by (target name, filter name)
+        self.today_exposure_totals = dict()  # type: Dict[Tuple[str, str], float]
+        self.previous_exposure_totals = dict()  # type: Dict[Tuple[str, str], float]
         self.focus_result_list = list()
         self.guide_x_error_list = list()  # list of guide error on x axis in pixel
         self.guide_y_error_list = list()  # list of guide error on y axis in pixel
 
+    @staticmethod
+    def exposure_key(exposure: ExposureInfo) -> Tuple[str, str]:
+        # Interned, since the same few targets and filters are repeated for every exposure
+        return sys.intern(exposure.sequence_target), sys.intern(exposure.filter_name)
+
     def merge_existing_exposure_info(self, existing_exposure_info_dict: dict) -> None:
         for filter_name, exposure_time in existing_exposure_info_dict.items():
             exposure = ExposureInfo(filter_name=filter_name, exposure_time=exposure_time, sequence_target=self.name)
             self.existing_exposure_info_list.append(exposure)
+            key = self.exposure_key(exposure)
+            self.previous_exposure_totals[key] = self.previous_exposure_totals.get(key, 0.0) + exposure.exposure_time
 
     def add_exposure(self, exposure: ExposureInfo) -> None:
         self.exposure_info_list.append(exposure)
+        key = self.exposure_key(exposure)
+        self.today_exposure_totals[key] = self.today_exposure_totals.get(key, 0.0) + exposure.exposure_time
 
     def add_focus_result(self, focus_result: FocusResult):
         focus_result.recommended_index = self.exposure_count() - 0.5
@@ -52,32 +65,35 @@ class SequenceStat:
     def exposure_count(self):
         return len(self.exposure_info_list)
 
+    def exposure_time_totals(self) -> Dict[Tuple[str, str], Tuple[float, float]]:
+        """
+        Exposure time stats by (target name, filter name), targets of today first.
+        Value is a pair of seconds, the first value is the cumulative exposure time recorded today, while the second
+        value is the previously accumulated results.
+        """
+        result = {key: (seconds, self.previous_exposure_totals.get(key, 0.0))
+                  for key, seconds in self.today_exposure_totals.items()}
+        for key, seconds in self.previous_exposure_totals.items():
+            if key not in result:
+                result[key] = (0.0, seconds)
+        return result
+
     def new_exposure_time_stat_dictionary(self):
         """
         Exposure time stats in a dictionary form.
         Key is the target_name+filter name, normalized. Value is a pair of seconds, the first value is the cumulative
         exposure time recorded today, while the second value is the previously accumulated results.
         """
-        result = defaultdict(lambda: (0.0, 0.0))
-        for expo in self.exposure_info_list:
-            key = expo.sequence_target + ' ' + expo.filter_name
-            left, right = result[key]
-            result[key] = (left + expo.exposure_time, right)
-        for expo in self.existing_exposure_info_list:
-            key = expo.sequence_target + ' ' + expo.filter_name
-            left, right = result[key]
-            result[key] = (left, right + expo.exposure_time)
-        return result
+        return {target + ' ' + filter_name: seconds
+                for (target, filter_name), seconds in self.exposure_time_totals().items()}
 
     def exposure_time_stat_dictionary(self):
         """
         Exposure time stats in a dictionary form.
         Key is the target_name+filter name, normalized, value is the cumulative time in seconds.
         """
-        result = defaultdict(float)
-        for expo in self.exposure_info_list:
-            result[expo.sequence_target + ' ' + expo.filter_name] += expo.exposure_time
-        return result
+        return {target + ' ' + filter_name: seconds for (target, filter_name), seconds in
+                self.today_exposure_totals.items()}
 
 
 class StatPlotter:
@@ -151,8 +167,11 @@ class StatPlotter:
 
     def exposure_plot(self, ax: axes.Axes = None, sequence_stat: SequenceStat = None, target_name: str = ''):
         ax.set_facecolor('#212121')
-        total_exposure_stat = sequence_stat.new_exposure_time_stat_dictionary()
+        exposure_totals = sequence_stat.exposure_time_totals()
+        total_exposure_stat = {target + ' ' + filter_name: seconds
+                               for (target, filter_name), seconds in exposure_totals.items()}
         keys = list(total_exposure_stat.keys())
+        filter_names = [filter_name for target, filter_name in exposure_totals]
         today_exposure_values = list(map(lambda x: total_exposure_stat[x][0], keys))
 
         def seconds_to_readable_hours(seconds):
@@ -171,7 +190,7 @@ class StatPlotter:
         previous_rectangles = ax.bar(keys, previously_exposure_values)
         today_rectangles = ax.bar(keys, today_exposure_values, bottom=previously_exposure_values)
         for i in range(len(keys)):
-            filter_name = keys[i].split()[-1]
+            filter_name = filter_names[i]
             if filter_name in self.filter_meta:
                 color = self.filter_meta[filter_name]['color']
             else:
@@ -198,13 +217,29 @@ class StatPlotter:
         ax.yaxis.label.set_color('#F5F5F5')
         ax.set_title('Cumulative Exposure Time by Filter ({target})'.format(target=target_name))
 
-    def memory_history_plot(self, ax: axes.Axes = None, memory_history: deque = deque()):
-        voyager_physical_memory = [x.voyager_rss for x in memory_history]
-        voyager_virtual_memory = [x.voyager_vms for x in memory_history]
-        bot_physical_memory = [x.bot_rss for x in memory_history]
-        bot_virtual_memory = [x.bot_vms for x in memory_history]
+    @staticmethod
+    def epoch_to_local_datetime64(timestamps: np.ndarray) -> np.ndarray:
+        # Vectorised version of datetime.fromtimestamp, which matplotlib can plot directly.
+        def utc_offset_sec(timestamp: float) -> float:
+            return datetime.fromtimestamp(timestamp).astimezone().utcoffset().total_seconds()
+
+        if len(timestamps) == 0:
+            return timestamps.astype('datetime64[ms]')
+        first_offset = utc_offset_sec(float(timestamps[0]))
+        if first_offset == utc_offset_sec(float(timestamps[-1])):
+            offsets = first_offset
+        else:
+            # History spans a daylight saving time change, every sample needs its own offset
+            offsets = np.array([utc_offset_sec(float(timestamp)) for timestamp in timestamps])
+        return ((timestamps + offsets) * 1000).astype(np.int64).astype('datetime64[ms]')
+
+    def memory_history_plot(self, ax: axes.Axes = None, memory_history: MemoryHistory = None):
+        if memory_history is None:
+            history = np.zeros(0, dtype=MEMORY_USAGE_DTYPE)
+        else:
+            history = memory_history.series()
 
-        time_series = [datetime.fromtimestamp(x.timestamp) for x in memory_history]
+        time_series = self.epoch_to_local_datetime64(history['timestamp'])
         ax.set_facecolor('#212121')
 
         locator = AutoDateLocator()
@@ -213,15 +248,14 @@ class StatPlotter:
         ax.xaxis.set_major_formatter(formatter)
         ax.xaxis.set_major_locator(locator)
 
-        for memory_usage in memory_history:
-            if memory_usage.oom_observed:
-                ax.axvline(x=datetime.fromtimestamp(memory_usage.timestamp), color='#FF6D00')
+        for oom_time in time_series[history['oom_observed']]:
+            ax.axvline(x=oom_time, color='#FF6D00')
 
         # hfd and star index
-        ax.plot(time_series, voyager_physical_memory, color='#F44336', linewidth=10, zorder=1)
-        ax.plot(time_series, voyager_virtual_memory, color='#B71C1C', linewidth=10, zorder=1)
-        ax.plot(time_series, bot_virtual_memory, color='#2196F3', linewidth=10, zorder=1)
-        ax.plot(time_series, bot_physical_memory, color='#3F51B5', linewidth=10, zorder=1)
+        ax.plot(time_series, history['voyager_rss'], color='#F44336', linewidth=10, zorder=1)
+        ax.plot(time_series, history['voyager_vms'], color='#B71C1C', linewidth=10, zorder=1)
+        ax.plot(time_series, history['bot_vms'], color='#2196F3', linewidth=10, zorder=1)
+        ax.plot(time_series, history['bot_rss'], color='#3F51B5', linewidth=10, zorder=1)
 
         ax.tick_params(axis='y', labelcolor='#F44336')
         ax.set_ylabel('Memory(MB)', color='#F44336')
@@ -312,7 +346,7 @@ class StatPlotter:
 
         ax_scatter.scatter(x=guide_x_error_list, y=guide_y_error_list, color='#26C6DA')
 
-    def plot(self, sequence_stat: SequenceStat = None, memory_history: deque = deque()):
+    def plot(self, sequence_stat: SequenceStat = None, memory_history: MemoryHistory = None):
         if sequence_stat is None:
             return
 
@@ -0,0 +1,48 @@
+import threading
+from typing import Any, Callable, Tuple
+
+
+class LatestValueBus:
+    """
+    A coalescing bus for state-style events, like system status or message counters.
+
+    Unlike the event emitter, producers don't call listeners: they overwrite a slot identified by a topic, and
+    consumers pull the newest snapshot at their own cadence, usually the refresh rate of the screen. A slot can hold a
+    factory instead of a value, so the snapshot is only built when somebody actually reads it, and at most once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = dict()  # topic => [version, value, factory]
+
+    def publish(self, topic: str, value: Any = None, factory: Callable[[], Any] = None) -> None:
+        """
+        Overwrites the slot of the given topic.
+        :param topic: Name of the slot, usually a BotEvent name.
+        :param value: The new snapshot.
+        :param factory: A callable building the new snapshot lazily, used instead of value if provided.
+        """
+        with self._lock:
+            slot = self._slots.setdefault(topic, [0, None, None])
+            slot[0] += 1
+            slot[1] = value
+            slot[2] = factory
+
+    def latest(self, topic: str, since_version: int = 0) -> Tuple[int, Any]:
+        """
+        Pulls the newest snapshot of a topic.
+        :param topic: Name of the slot.
+        :param since_version: Version the consumer has already seen.
+        :return: A pair of (version, snapshot). Snapshot is None if nothing newer than since_version was published.
+        """
+        with self._lock:
+            slot = self._slots.get(topic)
+            if not slot or slot[0] <= since_version:
+                return since_version, None
+            if slot[2]:
+                slot[1] = slot[2]()
+                slot[2] = None
+            return slot[0], slot[1]
+
+
+state_bus = LatestValueBus()
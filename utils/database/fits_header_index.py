@@ -0,0 +1,274 @@
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from astropy.io import fits
+
+from utils.database.sequence_database_manager import normalize_file_path
+
+# Keyword => sqlite column type. Keywords missing from a file are stored as NULL.
+DEFAULT_KEYWORDS = {
+    'OBJECT': 'TEXT',
+    'FILTER': 'TEXT',
+    'IMAGETYP': 'TEXT',
+    'DATE-OBS': 'TEXT',
+    'EXPOSURE': 'REAL',
+    'GAIN': 'REAL',
+    'OFFSET': 'REAL',
+    'CCD-TEMP': 'REAL',
+    'SET-TEMP': 'REAL',
+    'XBINNING': 'INTEGER',
+    'YBINNING': 'INTEGER',
+    'FOCPOS': 'INTEGER',
+    'FOCTEMP': 'REAL',
+    'AIRMASS': 'REAL',
+    'PIERSIDE': 'TEXT',
+    'INSTRUME': 'TEXT',
+    'TELESCOP': 'TEXT',
+    'BAYERPAT': 'TEXT',
+}
+
+# Columns most queries filter on
+INDEXED_COLUMNS = [('object', 'filter'), ('date_obs',), ('gain',), ('ccd_temp',)]
+
+# Columns of FRAME_QUALITY which can be queried along with headers, see SequenceDatabaseManager
+FRAME_QUALITY_COLUMNS = ['star_count', 'hfd', 'fwhm', 'eccentricity', 'background', 'noise']
+
+CONDITION_PATTERN = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_\-]*)\s*(<=|>=|!=|=|<|>|~)\s*(.*?)\s*$')
+FITS_EXTENSIONS = ('.FIT', '.FITS', '.FTS')
+
+
+def column_name(keyword: str) -> str:
+    """'CCD-TEMP' => 'ccd_temp'"""
+    return re.sub(r'[^a-z0-9_]', '_', keyword.lower())
+
+
+def convert_value(value, column_type: str):
+    if value is None:
+        return None
+    try:
+        if column_type == 'REAL':
+            return float(value)
+        if column_type == 'INTEGER':
+            return int(round(float(value)))
+    except (TypeError, ValueError):
+        return None
+    return str(value).strip()
+
+
+def read_headers(file_entries: List[Tuple[str, int, int]], keywords: Dict[str, str]) -> List[tuple]:
+    """
+    Read the primary headers of a batch of files, it's a plain function so it can run in worker processes.
+    Only the header blocks are read, never the data.
+    :param file_entries: (path, mtime_ns, size) of each file.
+    :return: One row per readable file: path, mtime_ns, size, then values of the keywords in the same order.
+    """
+    rows = list()
+    for file_path, mtime_ns, size in file_entries:
+        try:
+            header = fits.getheader(file_path, 0)
+        except Exception as exception:
+            print(f'Unable to read header of {file_path}: {exception}')
+            continue
+        if 'EXPOSURE' in keywords and 'EXPOSURE' not in header and 'EXPTIME' in header:
+            # Different capture software, same meaning
+            header['EXPOSURE'] = header['EXPTIME']
+        rows.append((file_path, mtime_ns, size) +
+                    tuple(convert_value(header.get(keyword), column_type) for keyword, column_type in keywords.items()))
+    return rows
+
+
+class FitsHeaderIndex:
+    """
+    Selected header keywords of every fits file of the image library, in typed and indexed sqlite columns, so
+    questions like 'Ha subs of M42 at gain 100 below -9C' are answered without opening any fits file.
+    The index lives in the sequence database, so frame quality measurements can be queried along with headers.
+    """
+
+    def __init__(self, database_filename: str = 'data/sequence.db', keywords: Optional[Dict[str, str]] = None):
+        """
+        :param keywords: Keyword => column type (TEXT, REAL or INTEGER), DEFAULT_KEYWORDS if not given. Columns of
+        keywords added later are added to an existing index, files scanned before need a rescan to fill them.
+        """
+        self.database_filename = database_filename
+        self.keywords = dict(keywords or DEFAULT_KEYWORDS)
+        self.columns = {column_name(keyword): column_type for keyword, column_type in self.keywords.items()}
+
+        if os.path.dirname(database_filename):
+            Path(os.path.dirname(database_filename)).mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(database_filename, check_same_thread=False)
+        self.lock = Lock()
+        self.create_table()
+
+    def create_table(self):
+        with self.lock:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS FITS_HEADERS ('
+                                    'filepath text NOT NULL PRIMARY KEY, mtime_ns INTEGER NOT NULL, '
+                                    'size INTEGER NOT NULL);')
+            existing_columns = {row[1] for row in self.connection.execute('PRAGMA table_info(FITS_HEADERS);')}
+            for name, column_type in self.columns.items():
+                if name not in existing_columns:
+                    self.connection.execute(f'ALTER TABLE FITS_HEADERS ADD COLUMN "{name}" {column_type};')
+            for indexed_columns in INDEXED_COLUMNS:
+                if all(name in self.columns for name in indexed_columns):
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS FITS_HEADERS_BY_{"_".join(indexed_columns)} '
+                                            f'ON FITS_HEADERS ({", ".join(indexed_columns)});')
+            self.connection.commit()
+
+    def has_frame_quality(self) -> bool:
+        return self.connection.execute("SELECT name FROM sqlite_master WHERE type='table' AND "
+                                       "name='FRAME_QUALITY';").fetchone() is not None
+
+    @staticmethod
+    def find_fits_files(folder: str) -> Iterable[Tuple[str, int, int]]:
+        for root, dirs, files in os.walk(folder):
+            for file in files:
+                if not file.upper().endswith(FITS_EXTENSIONS):
+                    continue
+                full_path = normalize_file_path(os.path.join(root, file))
+                try:
+                    stat = os.stat(full_path)
+                except OSError:
+                    continue
+                yield full_path, stat.st_mtime_ns, stat.st_size
+
+    def scan(self, folder: str, workers: Optional[int] = None, batch_size: int = 64) -> int:
+        """
+        Index every fits file under the folder. Files already indexed with the same mtime and size are skipped, so
+        scanning the library again only reads new or changed files.
+        :param workers: Number of worker processes, defaults to the number of CPUs.
+        :return: Number of files indexed.
+        """
+        with self.lock:
+            indexed = {row[0]: (row[1], row[2]) for row in
+                       self.connection.execute('SELECT filepath, mtime_ns, size FROM FITS_HEADERS;')}
+        pending = [entry for entry in self.find_fits_files(folder) if indexed.get(entry[0]) != (entry[1], entry[2])]
+        if not pending:
+            return 0
+
+        column_names = ', '.join(f'"{name}"' for name in self.columns)
+        placeholders = ', '.join('?' * (len(self.columns) + 3))
+        insert_sql = f'REPLACE INTO FITS_HEADERS (filepath, mtime_ns, size, {column_names}) VALUES ({placeholders});'
+        count = 0
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for rows in executor.map(read_headers, batches, [self.keywords] * len(batches)):
+                with self.lock:
+                    self.connection.executemany(insert_sql, rows)
+                    self.connection.commit()
+                count += len(rows)
+        return count
+
+    @staticmethod
+    def qualified_column(name: str, known_columns: List[str]) -> str:
+        # Both tables have object, filter... columns, header ones win
+        column = column_name(name)
+        if column not in known_columns:
+            raise ValueError(f'Unknown column {column}, valid ones are: {", ".join(known_columns)}')
+        table = 'FRAME_QUALITY' if column in FRAME_QUALITY_COLUMNS else 'FITS_HEADERS'
+        return f'{table}."{column}"'
+
+    def query(self, conditions: List[Tuple[str, str, object]], order_by: str = 'date_obs',
+              limit: Optional[int] = None) -> Tuple[List[str], List[tuple]]:
+        """
+        :param conditions: (column, operator, value) like ('gain', '=', 100). Operators are =, !=, <, <=, >, >=
+        and ~ for a case insensitive LIKE match with '*' as wildcard. Columns are keyword columns, like 'ccd_temp',
+        or frame quality ones, like 'hfd'.
+        :return: Column names and matching rows.
+        """
+        use_quality = self.has_frame_quality()
+        known_columns = ['filepath'] + list(self.columns) + (FRAME_QUALITY_COLUMNS if use_quality else [])
+        where = list()
+        parameters = list()
+        for column, operator, value in conditions:
+            column = self.qualified_column(column, known_columns)
+            if operator == '~':
+                where.append(f'{column} LIKE ?')
+                parameters.append(str(value).replace('*', '%'))
+            elif operator in ('=', '!=', '<', '<=', '>', '>='):
+                where.append(f'{column} {operator} ?')
+                if column == 'FITS_HEADERS."filepath"' and operator in ('=', '!='):
+                    # Stored the same way, whatever the path looked like when it was given
+                    value = normalize_file_path(str(value))
+                parameters.append(value)
+            else:
+                raise ValueError(f'Unknown operator {operator}')
+
+        selected = ['filepath'] + list(self.columns)
+        sql = 'SELECT ' + ', '.join(f'FITS_HEADERS."{name}"' for name in selected)
+        if use_quality:
+            selected += FRAME_QUALITY_COLUMNS
+            sql += ', ' + ', '.join(f'FRAME_QUALITY."{name}"' for name in FRAME_QUALITY_COLUMNS)
+            sql += ' FROM FITS_HEADERS LEFT JOIN FRAME_QUALITY USING (filepath)'
+        else:
+            sql += ' FROM FITS_HEADERS'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += f' ORDER BY {self.qualified_column(order_by, known_columns)}'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        with self.lock:
+            return selected, self.connection.execute(sql + ';', parameters).fetchall()
+
+
+def parse_condition(text: str) -> Tuple[str, str, object]:
+    """'ccd_temp<=-9' => ('ccd_temp', '<=', -9.0). Values which look like numbers are compared as numbers."""
+    match = CONDITION_PATTERN.match(text)
+    if not match:
+        raise ValueError(f'Invalid condition: {text}')
+    column, operator, value = match.groups()
+    try:
+        value = float(value)
+    except ValueError:
+        pass
+    return column, operator, value
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Index and query fits headers of the image library.')
+    parser.add_argument('--database', default='data/sequence.db', help='The sequence database file')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    scan_parser = subparsers.add_parser('scan', help='Index new and changed fits files of a folder')
+    scan_parser.add_argument('folder')
+    scan_parser.add_argument('-j', '--workers', type=int, default=None)
+    scan_parser.add_argument('--keywords', default='',
+                             help='Extra keywords to index, like EGAIN:REAL,SITENAME:TEXT')
+    query_parser = subparsers.add_parser('query', help='Find frames, e.g. object=M42 filter=Ha gain=100 "hfd<3"')
+    query_parser.add_argument('conditions', nargs='*')
+    query_parser.add_argument('--order-by', default='date_obs')
+    query_parser.add_argument('--limit', type=int, default=None)
+    query_parser.add_argument('--columns', default='object,filter,exposure,gain,ccd_temp,date_obs',
+                              help='Columns to print besides the file path')
+    args = parser.parse_args()
+
+    index_keywords = dict(DEFAULT_KEYWORDS)
+    if args.command == 'scan' and args.keywords:
+        for keyword_spec in args.keywords.split(','):
+            keyword, _, keyword_type = keyword_spec.partition(':')
+            index_keywords[keyword.strip().upper()] = (keyword_type or 'TEXT').strip().upper()
+    header_index = FitsHeaderIndex(database_filename=args.database, keywords=index_keywords)
+
+    start = time.perf_counter()
+    if args.command == 'scan':
+        indexed_count = header_index.scan(args.folder, workers=args.workers)
+        print(f'{indexed_count} files indexed in {time.perf_counter() - start:.1f}s')
+    else:
+        columns, result_rows = header_index.query([parse_condition(condition) for condition in args.conditions],
+                                                  order_by=args.order_by, limit=args.limit)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        printed_columns = [column_name(name) for name in args.columns.split(',') if column_name(name) in columns]
+        printed_indexes = [columns.index(name) for name in printed_columns]
+        print('\t'.join(printed_columns + ['filepath']))
+        for result_row in result_rows:
+            print('\t'.join(str(result_row[i]) for i in printed_indexes) + '\t' + result_row[0])
+        total_exposure = 0
+        if 'exposure' in columns:
+            total_exposure = sum(result_row[columns.index('exposure')] or 0 for result_row in result_rows)
+        print(f'{len(result_rows)} frames, {total_exposure / 3600:.2f}h total exposure, queried in {elapsed_ms:.1f}ms')
@@ -4,7 +4,7 @@ import subprocess
 from os.path import exists
 from pathlib import Path
 from platform import uname
-from threading import Thread
+from threading import Thread, Lock
 from time import sleep
 
 from astropy.io import fits
@@ -19,6 +19,28 @@ create_table_sql = '''CREATE TABLE IF NOT EXISTS SEQUENCES (
   filepath text NOT NULL PRIMARY KEY
 );'''
 
+create_frame_quality_table_sql = '''CREATE TABLE IF NOT EXISTS FRAME_QUALITY (
+  filepath text NOT NULL PRIMARY KEY,
+  target_name text NOT NULL,
+  filter text NOT NULL,
+  exposure REAL NOT NULL,
+  date text NOT NULL,
+  star_count INTEGER NOT NULL,
+  hfd REAL NOT NULL,
+  fwhm REAL NOT NULL,
+  eccentricity REAL NOT NULL,
+  background REAL NOT NULL,
+  noise REAL NOT NULL
+);'''
+
+
+def normalize_file_path(file_path: str) -> str:
+    """
+    Absolute and case normalized path, the key of a fits file in tables shared by the bot and command line tools, so
+    they match no matter how the file was reached.
+    """
+    return os.path.normcase(os.path.abspath(file_path))
+
 
 class SequenceDatabaseManager:
 
@@ -31,6 +53,8 @@ class SequenceDatabaseManager:
         self.database_filename = database_filename
         self.sequence_folder_path = sequence_folder_path
         self.thread = None
+        # The connection is shared by the event thread, fits file threads and the image analyzer
+        self.lock = Lock()
         if not exists(database_filename):
             Path(os.path.dirname(database_filename)).mkdir(parents=True, exist_ok=True)
             self.connection = self.create_database()
@@ -38,6 +62,10 @@ class SequenceDatabaseManager:
                 self.scan_sequence_folder()
         else:
             self.connection = sqlite3.connect(database_filename, check_same_thread=False)
+        # Added after the sequences table, so existing databases get it too
+        with self.lock:
+            self.connection.execute(create_frame_quality_table_sql)
+            self.connection.commit()
 
     def __del__(self):
         self.connection.close()
@@ -83,11 +111,12 @@ class SequenceDatabaseManager:
                     pass
                 except Exception as exp:
                     pass
-        cur = self.connection.cursor()
         print(records)
-        cur.executemany('REPLACE INTO SEQUENCES (target_name, filter, exposure, date, filepath) VALUES(?,?,?,?,?);',
-                        records)
-        self.connection.commit()
+        with self.lock:
+            cur = self.connection.cursor()
+            cur.executemany('REPLACE INTO SEQUENCES (target_name, filter, exposure, date, filepath) '
+                            'VALUES(?,?,?,?,?);', records)
+            self.connection.commit()
 
     def in_wsl(self) -> bool:
         return 'microsoft' in str(uname().release).lower()
@@ -117,16 +146,32 @@ class SequenceDatabaseManager:
             filter_name = headers['FILTER']
             exposure = headers['EXPOSURE']
             datetime = headers['DATE-OBS']
-            cur = self.connection.cursor()
-            cur.executemany('REPLACE INTO SEQUENCES (target_name, filter, exposure, date, filepath) VALUES(?,?,?,?,?);',
-                            [(object_name, filter_name, int(exposure), datetime, fit_filename)])
-            self.connection.commit()
+            with self.lock:
+                cur = self.connection.cursor()
+                cur.executemany('REPLACE INTO SEQUENCES (target_name, filter, exposure, date, filepath) '
+                                'VALUES(?,?,?,?,?);',
+                                [(object_name, filter_name, int(exposure), datetime, fit_filename)])
+                self.connection.commit()
         except FileNotFoundError:
             pass
         except Exception as exp:
             print(exp, fit_filename)
             main_console.print_exception()
 
+    def add_frame_quality(self, frame_quality) -> None:
+        """
+        Save the quality of a frame measured by utils.image_analysis, replacing previous results of the same file.
+        :param frame_quality: A FrameQuality.
+        """
+        with self.lock:
+            self.connection.execute(
+                'REPLACE INTO FRAME_QUALITY (filepath, target_name, filter, exposure, date, star_count, hfd, fwhm, '
+                'eccentricity, background, noise) VALUES(?,?,?,?,?,?,?,?,?,?,?);',
+                (normalize_file_path(frame_quality.file_path), frame_quality.object_name, frame_quality.filter_name,
+                 frame_quality.exposure_time, frame_quality.date_obs, frame_quality.star_count, frame_quality.hfd,
+                 frame_quality.fwhm, frame_quality.eccentricity, frame_quality.background, frame_quality.noise))
+            self.connection.commit()
+
     def get_accumulated_exposure(self, object_name: str) -> dict:
         """
         Find accumlated exposure time per filter, using provided object name.
@@ -135,9 +180,10 @@ class SequenceDatabaseManager:
         """
         get_accumulated_exposure_sql = f'select filter, sum(exposure) from sequences where target_name="{object_name}" ' \
                                        f'group by target_name, filter; '
-        cur = self.connection.cursor()
-        cur.execute(get_accumulated_exposure_sql)
-        rows = cur.fetchall()
+        with self.lock:
+            cur = self.connection.cursor()
+            cur.execute(get_accumulated_exposure_sql)
+            rows = cur.fetchall()
         return dict(rows)
 
 
@@ -0,0 +1,228 @@
+import os
+import queue
+import sqlite3
+import time
+from pathlib import Path
+from threading import Thread, Lock
+from typing import Dict, List, Optional, Tuple
+
+from console import main_console
+
+# Rollup resolutions in seconds: 1 min, 10 min and 1 hour
+ROLLUP_RESOLUTIONS = (60, 600, 3600)
+
+create_tables_sql = '''
+CREATE TABLE IF NOT EXISTS METRICS (
+  metric_id INTEGER PRIMARY KEY,
+  name text NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS SAMPLES (
+  metric_id INTEGER NOT NULL,
+  timestamp REAL NOT NULL,
+  value REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS SAMPLES_BY_METRIC_TIME ON SAMPLES (metric_id, timestamp);
+CREATE TABLE IF NOT EXISTS ROLLUPS (
+  metric_id INTEGER NOT NULL,
+  resolution INTEGER NOT NULL,
+  bucket_start INTEGER NOT NULL,
+  count INTEGER NOT NULL,
+  sum REAL NOT NULL,
+  min REAL NOT NULL,
+  max REAL NOT NULL,
+  PRIMARY KEY (metric_id, resolution, bucket_start)
+) WITHOUT ROWID;
+'''
+
+upsert_rollup_sql = '''INSERT INTO ROLLUPS (metric_id, resolution, bucket_start, count, sum, min, max)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (metric_id, resolution, bucket_start) DO UPDATE SET
+  count = count + excluded.count,
+  sum = sum + excluded.sum,
+  min = MIN(min, excluded.min),
+  max = MAX(max, excluded.max);'''
+
+
+class TimeSeriesStore:
+    """
+    An append optimised store of numeric telemetry, backed by SQLite. Raw samples are kept for 'raw_retention_days',
+    1 min, 10 min and 1 hour rollups (count, sum, min, max) are maintained while writing, so long range queries
+    never touch raw samples. Writes are queued and committed in batches by a background thread.
+    """
+
+    def __init__(self, database_filename: str = 'data/telemetry.db', raw_retention_days: float = 7,
+                 minute_rollup_retention_days: float = 90, flush_interval_sec: float = 2):
+        self.database_filename = database_filename
+        self.raw_retention_days = raw_retention_days
+        self.minute_rollup_retention_days = minute_rollup_retention_days
+        self.flush_interval_sec = flush_interval_sec
+
+        if os.path.dirname(database_filename):
+            Path(os.path.dirname(database_filename)).mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(database_filename, check_same_thread=False)
+        # WAL lets readers (plots, reports) query while the writer thread appends
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute('PRAGMA synchronous=NORMAL;')
+        self.connection.executescript(create_tables_sql)
+        self.connection.commit()
+        self.lock = Lock()
+
+        self.metric_ids = dict()  # type: Dict[str, int]
+        for metric_id, name in self.connection.execute('SELECT metric_id, name FROM METRICS;'):
+            self.metric_ids[name] = metric_id
+
+        self.pending = queue.Queue()
+        self.last_prune_timestamp = 0
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.thread = Thread(target=self.write_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def record(self, metric: str, value: float, timestamp: Optional[float] = None):
+        """
+        Queue a sample, it will be written by the writer thread in the next batch.
+        :param metric: Name of the metric, like 'guide.error_x'.
+        :param timestamp: Seconds since epoch, defaults to now.
+        """
+        if value is None:
+            return
+        self.pending.put((metric, float(value), timestamp or time.time()))
+
+    def write_loop(self):
+        while True:
+            time.sleep(self.flush_interval_sec)
+            try:
+                self.flush()
+                self.maybe_prune()
+            except Exception:
+                main_console.print_exception()
+
+    def metric_id(self, metric: str) -> int:
+        if metric not in self.metric_ids:
+            cursor = self.connection.execute('INSERT OR IGNORE INTO METRICS (name) VALUES (?);', (metric,))
+            if cursor.lastrowid and cursor.rowcount:
+                self.metric_ids[metric] = cursor.lastrowid
+            else:
+                self.metric_ids[metric] = self.connection.execute('SELECT metric_id FROM METRICS WHERE name = ?;',
+                                                                  (metric,)).fetchone()[0]
+        return self.metric_ids[metric]
+
+    def flush(self) -> int:
+        """
+        Write all queued samples in one transaction.
+        :return: Number of samples written.
+        """
+        samples = list()
+        while True:
+            try:
+                samples.append(self.pending.get_nowait())
+            except queue.Empty:
+                break
+        if not samples:
+            return 0
+
+        with self.lock:
+            raw_rows = list()
+            # Aggregate the batch in memory first, so each bucket is upserted only once per batch
+            rollups = dict()  # type: Dict[Tuple[int, int, int], List[float]]
+            for metric, value, timestamp in samples:
+                metric_id = self.metric_id(metric)
+                raw_rows.append((metric_id, timestamp, value))
+                for resolution in ROLLUP_RESOLUTIONS:
+                    key = (metric_id, resolution, int(timestamp // resolution) * resolution)
+                    aggregate = rollups.get(key)
+                    if aggregate is None:
+                        rollups[key] = [1, value, value, value]
+                    else:
+                        aggregate[0] += 1
+                        aggregate[1] += value
+                        aggregate[2] = min(aggregate[2], value)
+                        aggregate[3] = max(aggregate[3], value)
+
+            self.connection.executemany('INSERT INTO SAMPLES (metric_id, timestamp, value) VALUES (?, ?, ?);',
+                                        raw_rows)
+            self.connection.executemany(upsert_rollup_sql,
+                                        [key + tuple(aggregate) for key, aggregate in rollups.items()])
+            self.connection.commit()
+        return len(samples)
+
+    def maybe_prune(self):
+        now = time.time()
+        if now - self.last_prune_timestamp < 3600:
+            return
+        self.last_prune_timestamp = now
+        with self.lock:
+            self.connection.execute('DELETE FROM SAMPLES WHERE timestamp < ?;',
+                                    (now - self.raw_retention_days * 86400,))
+            self.connection.execute('DELETE FROM ROLLUPS WHERE resolution = ? AND bucket_start < ?;',
+                                    (ROLLUP_RESOLUTIONS[0], now - self.minute_rollup_retention_days * 86400))
+            self.connection.commit()
+
+    def metrics(self) -> List[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT name FROM METRICS ORDER BY name;')]
+
+    def query(self, metric: str, start_timestamp: float, end_timestamp: float, resolution: Optional[int] = None,
+              max_points: int = 2000) -> List[Tuple[float, float, float, float]]:
+        """
+        Range query of one metric.
+        :param resolution: 0 for raw samples, or one of the rollup resolutions in seconds. By default the finest
+        resolution which returns no more than 'max_points' buckets is picked.
+        :return: List of (timestamp, mean, min, max), for raw samples mean, min and max are the same value.
+        """
+        if resolution is None:
+            resolution = self.pick_resolution(start_timestamp, end_timestamp, max_points)
+        with self.lock:
+            metric_id = self.metric_ids.get(metric)
+            if metric_id is None:
+                return []
+            if resolution == 0:
+                rows = self.connection.execute(
+                    'SELECT timestamp, value, value, value FROM SAMPLES '
+                    'WHERE metric_id = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp;',
+                    (metric_id, start_timestamp, end_timestamp))
+            else:
+                rows = self.connection.execute(
+                    'SELECT bucket_start, sum / count, min, max FROM ROLLUPS '
+                    'WHERE metric_id = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ? '
+                    'ORDER BY bucket_start;',
+                    (metric_id, resolution, int(start_timestamp // resolution) * resolution, end_timestamp))
+            return rows.fetchall()
+
+    def pick_resolution(self, start_timestamp: float, end_timestamp: float, max_points: int) -> int:
+        duration = end_timestamp - start_timestamp
+        if time.time() - start_timestamp < self.raw_retention_days * 86400 and duration < max_points:
+            # Less than one sample per second on average can't exceed max_points
+            return 0
+        for resolution in ROLLUP_RESOLUTIONS:
+            if duration / resolution <= max_points:
+                if resolution == ROLLUP_RESOLUTIONS[0] and \
+                        time.time() - start_timestamp > self.minute_rollup_retention_days * 86400:
+                    continue
+                return resolution
+        return ROLLUP_RESOLUTIONS[-1]
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+
+    store = TimeSeriesStore(database_filename=os.path.join(tempfile.mkdtemp(), 'telemetry.db'))
+    now = time.time()
+    # Three nights of 1Hz guiding errors
+    start = time.perf_counter()
+    for i in range(3 * 86400 // 4):
+        store.record('guide.error_x', random.gauss(0, 0.3), timestamp=now - 3 * 86400 + i * 4)
+        if i % 50000 == 0:
+            store.flush()
+    store.flush()
+    print(f'Wrote {3 * 86400 // 4} samples in {time.perf_counter() - start:.2f}s')
+
+    for resolution in (None, 0, 60, 600, 3600):
+        start = time.perf_counter()
+        rows = store.query('guide.error_x', now - 3 * 86400, now, resolution=resolution)
+        print(f'resolution {resolution}: {len(rows)} rows in {(time.perf_counter() - start) * 1000:.1f}ms')
@@ -0,0 +1,19 @@
+EVENT_NAME_PREFIX = '"Event":"'
+
+
+def probe_event_name(message_string: str = '') -> str or None:
+    """
+    Extracts the event name from a raw Voyager message without decoding the whole json payload.
+    Voyager always serializes 'Event' as the first field, e.g. '{"Event":"ControlData","Timestamp":...}', so only the
+    head of the string is inspected.
+    :param message_string: The raw message received from voyager application server.
+    :return: The event name, or None if the message is not an event (e.g. a jsonrpc response) or can't be probed.
+    """
+    start = message_string.find(EVENT_NAME_PREFIX, 0, 32)
+    if start < 0:
+        return None
+    start += len(EVENT_NAME_PREFIX)
+    end = message_string.find('"', start)
+    if end < 0:
+        return None
+    return message_string[start:end]
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class FileWatcher(Generic[T]):
+    """
+    Keeps the parsed content of a small text file which is rewritten by another program, like the one line files
+    written by cloud sensors. The file is only read and parsed again when its mtime, inode or size changes.
+    A read which races with the writer (the file changes during the read, can't be opened, or doesn't parse) is
+    ignored and the last good snapshot is kept, it will be retried on the next check.
+    """
+
+    def __init__(self, file_path: str, parser: Callable[[str], T], default: T, min_check_interval_sec: float = 1):
+        """
+        :param parser: Parses the whole file content, raises ValueError or IndexError if content is incomplete.
+        :param default: Snapshot used when the file doesn't exist.
+        :param min_check_interval_sec: Calling snapshot() more often than this won't even stat the file.
+        """
+        self.file_path = file_path
+        self.parser = parser
+        self.default = default
+        self.value = default  # type: T
+        self.signature = None  # type: Optional[Tuple[int, int, int]]
+        self.min_check_interval_sec = min_check_interval_sec
+        self.last_check_timestamp = 0
+        self.subscribers = list()  # type: List[Callable[[T], None]]
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def subscribe(self, callback: Callable[[T], None]):
+        """Get called with the new snapshot, whenever it changes."""
+        self.subscribers.append(callback)
+
+    def file_signature(self) -> Tuple[int, int, int]:
+        stat = os.stat(self.file_path)
+        return stat.st_mtime_ns, stat.st_ino, stat.st_size
+
+    def check(self) -> bool:
+        """
+        Re-parse the file if it changed.
+        :return: Whether the snapshot has changed.
+        """
+        with self.lock:
+            self.last_check_timestamp = time.time()
+            try:
+                signature = self.file_signature()
+            except OSError:
+                # File is gone, which is different from a file being rewritten
+                if self.signature is None:
+                    return False
+                self.signature = None
+                new_value = self.default
+            else:
+                if signature == self.signature:
+                    return False
+                try:
+                    with open(self.file_path, 'r', errors='replace') as f:
+                        content = f.read()
+                    if self.file_signature() != signature:
+                        # The writer is still busy with the file
+                        return False
+                    new_value = self.parser(content)
+                except (OSError, ValueError, IndexError):
+                    # PermissionError while the sensor holds the file, or a partially written file
+                    return False
+                self.signature = signature
+
+            changed = new_value != self.value
+            self.value = new_value
+        if changed:
+            for callback in self.subscribers:
+                callback(new_value)
+        return changed
+
+    def snapshot(self) -> T:
+        if time.time() - self.last_check_timestamp >= self.min_check_interval_sec:
+            self.check()
+        return self.value
+
+    def start(self, poll_interval_sec: float = 5):
+        """Keep checking the file in a background thread, so subscribers get notified without anyone asking."""
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.poll_loop, args=(poll_interval_sec,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def poll_loop(self, poll_interval_sec: float):
+        while True:
+            try:
+                self.check()
+            except Exception as exception:
+                print(f'Failed to check {self.file_path}: {exception}')
+            time.sleep(poll_interval_sec)
+
+
+shared_file_watchers = dict()  # type: Dict[tuple, FileWatcher]
+shared_file_watchers_lock = threading.Lock()
+
+
+def shared_file_watcher(file_path: str, parser: Callable[[str], T], default: T) -> FileWatcher[T]:
+    """
+    :return: The watcher of given file and parser, so all readers of one file share a snapshot.
+    """
+    key = (file_path, parser)
+    with shared_file_watchers_lock:
+        if key not in shared_file_watchers:
+            shared_file_watchers[key] = FileWatcher(file_path=file_path, parser=parser, default=default)
+        return shared_file_watchers[key]
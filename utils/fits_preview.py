@@ -6,11 +6,14 @@
 # cv2.imwrite('../out.jpg', rgb)
 import enum
 import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
 
 import cv2
 import numpy as np
 from astropy.io import fits
-from scipy.ndimage import zoom
 
 
 class ZoomEnum(enum.Enum):
@@ -35,8 +38,25 @@ class FitsRawData:
         self.width = width
         self.height = height
         self.bits = bits
-        self.raw = raw
+        self.raw = raw  # memory mapped, unscaled data, see 'bzero' and 'bscale'
+        self.bzero = 0
+        self.bscale = 1
         self.owner = ''
+        self.object_name = ''
+        self.filter_name = ''
+        self.exposure_time = 0
+        self.bayer_pattern = None  # type: Optional[BayerPattern]
+
+
+# Target background and shadow clipping of the auto stretch, same as the defaults of PixInsight's STF
+STRETCH_TARGET_BACKGROUND = 0.25
+STRETCH_SHADOWS_CLIPPING = -2.8
+# Statistics of the stretch are computed on about this many pixels
+STRETCH_SAMPLE_COUNT = 200000
+
+
+def midtones_transfer(midtones: float, x: np.ndarray) -> np.ndarray:
+    return (midtones - 1) * x / ((2 * midtones - 1) * x - midtones)
 
 
 class FitsPreview:
@@ -46,25 +66,114 @@ class FitsPreview:
             return None
 
         fits_raw_data = FitsRawData()
-        with fits.open(file_path) as hdu_list:
-            fits_raw_data.height = hdu_list[0].header['NAXIS1']
-            fits_raw_data.width = hdu_list[0].header['NAXIS2']
-            fits_raw_data.bits = hdu_list[0].header['BITPIX']
-            fits_raw_data.owner = hdu_list[0].header['OBSERVER']
-
-            fits_raw_data.raw = hdu_list[0].data
+        # Scaling is done later on the downsampled image, otherwise astropy would load and convert the whole frame.
+        hdu_list = fits.open(file_path, memmap=True, do_not_scale_image_data=True)
+        header = hdu_list[0].header
+        fits_raw_data.width = header['NAXIS1']
+        fits_raw_data.height = header['NAXIS2']
+        fits_raw_data.bits = header['BITPIX']
+        fits_raw_data.bzero = header.get('BZERO', 0)
+        fits_raw_data.bscale = header.get('BSCALE', 1)
+        fits_raw_data.owner = header.get('OBSERVER', '')
+        fits_raw_data.object_name = header.get('OBJECT', '')
+        fits_raw_data.filter_name = header.get('FILTER', '')
+        fits_raw_data.exposure_time = header.get('EXPTIME', header.get('EXPOSURE', 0))
+        fits_raw_data.bayer_pattern = FitsPreview.bayer_pattern_from_header(header)
+        # The memory map stays valid after the file is closed, and is released with the array
+        fits_raw_data.raw = hdu_list[0].data
+        hdu_list.close()
 
         return fits_raw_data
 
     @staticmethod
-    def get_valid_output_file_name(original_path: str = '') -> str:
-        valid_output_file_name = 'preview.png'
+    def bayer_pattern_from_header(header) -> Optional[BayerPattern]:
+        """
+        :return: Pattern of the top left 2x2 cell of the data, taking XBAYROFF and YBAYROFF into account, or None if
+        the frame isn't a raw color frame.
+        """
+        pattern = str(header.get('BAYERPAT', '')).strip().upper()
+        if len(pattern) != 4 or pattern not in BayerPattern.__members__:
+            return None
+        rows = [pattern[:2], pattern[2:]]
+        if int(header.get('YBAYROFF', 0)) % 2:
+            rows.reverse()
+        if int(header.get('XBAYROFF', 0)) % 2:
+            rows = [row[::-1] for row in rows]
+        return BayerPattern[''.join(rows)]
 
-        return valid_output_file_name
+    @staticmethod
+    def get_valid_output_file_name(original_path: str = '', extension: str = '.png') -> str:
+        if original_path:
+            return original_path
+        return 'preview' + extension
+
+    @staticmethod
+    def to_uint16(fits_image: FitsRawData, image_data: np.ndarray) -> np.ndarray:
+        """Apply BZERO and BSCALE to an already downsampled image, and bring it to native byte order uint16."""
+        if fits_image.bits == 16 and fits_image.bscale == 1 and fits_image.bzero == 32768:
+            # The usual way of storing unsigned 16 bit data, adding 32768 is flipping the sign bit
+            unsigned = image_data.view(image_data.dtype.str.replace('i', 'u'))
+            return (unsigned ^ np.uint16(0x8000)).astype(np.uint16)
+        if fits_image.bits > 0:
+            image_data = image_data.astype(np.int64) * fits_image.bscale + fits_image.bzero
+            return np.clip(image_data, 0, 65535).astype(np.uint16)
+        # Floating point frames have no fixed range, normalize them to the range of the frame
+        image_data = np.nan_to_num(image_data.astype(np.float32))
+        low, high = image_data.min(), image_data.max()
+        return ((image_data - low) * (65535 / max(high - low, 1e-12))).astype(np.uint16)
+
+    @staticmethod
+    def downsample(fits_image: FitsRawData, zoom_factor: float, is_color: bool) -> np.ndarray:
+        """
+        Shrink the memory mapped frame to the size of the preview, only reading the rows and columns needed.
+        Integer striding brings the frame to about twice the target size, then the area interpolation averages it
+        down, so the preview isn't aliased.
+        :return: uint16 mono image, or uint16 bayer mosaic with the same pattern as the frame if is_color.
+        """
+        raw = fits_image.raw
+        stride = max(int(1 / (2 * zoom_factor)), 1)
+        if not is_color:
+            image_data = FitsPreview.to_uint16(fits_image, raw[::stride, ::stride])
+            size = (max(int(fits_image.width * zoom_factor), 1), max(int(fits_image.height * zoom_factor), 1))
+            return cv2.resize(image_data, size, interpolation=cv2.INTER_AREA)
+
+        # Bayer cells are kept whole, so every 2x2 cell of the result still has the pattern of the frame
+        cells = [FitsPreview.to_uint16(fits_image, raw[row::2 * stride, column::2 * stride])
+                 for row in (0, 1) for column in (0, 1)]
+        cell_height = min(cell.shape[0] for cell in cells)
+        cell_width = min(cell.shape[1] for cell in cells)
+        size = (max(int(fits_image.width * zoom_factor / 2), 1), max(int(fits_image.height * zoom_factor / 2), 1))
+        cells = [cv2.resize(cell[:cell_height, :cell_width], size, interpolation=cv2.INTER_AREA) for cell in cells]
+        mosaic = np.empty((size[1] * 2, size[0] * 2), dtype=np.uint16)
+        mosaic[0::2, 0::2], mosaic[0::2, 1::2], mosaic[1::2, 0::2], mosaic[1::2, 1::2] = cells
+        return mosaic
 
     @staticmethod
     def non_linear_stretch(image_data: np.ndarray = np.zeros((1, 1))) -> np.ndarray:
-        return image_data
+        """
+        Auto stretch like the screen transfer function of PixInsight: shadows are clipped a few MADs below the
+        median, and the median is moved to the target background with a midtones transfer function.
+        Statistics come from a subsample, the stretch itself is a lookup table over all uint16 values.
+        :param image_data: uint16 image, mono or RGB.
+        :return: uint8 image of the same shape. Channels of a color image are stretched separately.
+        """
+        if image_data.ndim == 3:
+            return np.dstack([FitsPreview.non_linear_stretch(image_data[:, :, channel])
+                              for channel in range(image_data.shape[2])])
+
+        step = max(int(np.sqrt(image_data.size / STRETCH_SAMPLE_COUNT)), 1)
+        sample = image_data[::step, ::step].astype(np.float32) / 65535
+        median = float(np.median(sample))
+        mad = float(np.median(np.abs(sample - median))) * 1.4826
+        shadows = min(max(median + STRETCH_SHADOWS_CLIPPING * mad, 0.0), 1.0)
+        midtones = float(midtones_transfer(STRETCH_TARGET_BACKGROUND, np.float32(median - shadows)))
+        if not 0 < midtones < 1:
+            # A flat or saturated frame, nothing to stretch
+            midtones = 0.5
+
+        values = np.clip((np.arange(65536, dtype=np.float32) / 65535 - shadows) / max(1 - shadows, 1e-6), 0, 1)
+        lookup_table = (midtones_transfer(midtones, values) * 255 + 0.5).astype(np.uint8)
+        return lookup_table[image_data]
 
     @staticmethod
     def debayer_with_pattern(image_data: np.ndarray = np.zeros((1, 1)),
@@ -74,33 +183,51 @@ class FitsPreview:
 
     @staticmethod
     def add_watermark(image_data: np.ndarray = np.zeros((1, 1)), text: str = '') -> np.ndarray:
-        watermark = np.zeros(shape=(image_data.shape[0], image_data.shape[1]), dtype=np.uint16)
+        """Blend the text into the preview, which is already small, instead of into a full size frame."""
+        text = text.strip()
+        if not text:
+            return image_data
+        watermark = image_data.copy()
+        white = 255 if image_data.ndim == 2 else (255,) * image_data.shape[2]
+        font_scale = image_data.shape[1] / 1000
+        cv2.putText(watermark, text=text, org=(image_data.shape[1] // 16, image_data.shape[0] * 15 // 16),
+                    fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=font_scale, color=white,
+                    thickness=max(int(font_scale * 2.5), 1), lineType=cv2.LINE_AA)
 
-        cv2.putText(watermark, text=text.strip(), org=(image_data.shape[1] // 16, image_data.shape[0] * 15 // 16),
-                    fontFace=cv2.FONT_HERSHEY_SIMPLEX, fontScale=3, color=65535, thickness=8, lineType=cv2.LINE_AA)
-
-        image_data = cv2.addWeighted(src1=image_data, alpha=1, src2=watermark, beta=0.25, gamma=0)
+        image_data = cv2.addWeighted(src1=image_data, alpha=0.75, src2=watermark, beta=0.25, gamma=0)
 
         return image_data
 
     @staticmethod
     def load_and_process_fits(file_path: str = '', zoom_factor: float = ZoomEnum.LARGE.value,
-                              is_color: bool = False, watermark: bool = True) -> np.ndarray:
+                              is_color: bool = False, watermark: bool = True,
+                              bayer_pattern: BayerPattern = BayerPattern.RGGB) -> np.ndarray:
+        """
+        :return: 8 bit preview, mono or BGR ready to be written by cv2.
+        """
+        fits_image = FitsPreview.load_fits_data(file_path=file_path)
+        if fits_image is None:
+            return np.zeros((1, 1))
+        return FitsPreview.process_fits_data(fits_image=fits_image, zoom_factor=zoom_factor, is_color=is_color,
+                                             watermark=watermark, bayer_pattern=bayer_pattern)
+
+    @staticmethod
+    def process_fits_data(fits_image: FitsRawData, zoom_factor: float = ZoomEnum.LARGE.value,
+                          is_color: bool = False, watermark: bool = True,
+                          bayer_pattern: BayerPattern = BayerPattern.RGGB) -> np.ndarray:
         if not 0 < zoom_factor < 3.0:
             print('Invalid zoom factor parameter. Use default value(1.0).')
             zoom_factor = 1.0
 
-        fits_image = FitsPreview.load_fits_data(file_path=file_path)
-        if fits_image is None:
-            return np.zeros((1, 1))
-        # Resampling
-        resized_image_data = zoom(fits_image.raw, zoom_factor, order=1)
+        # Resampling, before anything is converted, so only the small image is ever held in memory
+        image_data = FitsPreview.downsample(fits_image=fits_image, zoom_factor=zoom_factor, is_color=is_color)
+        # Release the memory map, only header information is needed from now on
+        fits_image.raw = None
         # Debayering
         if is_color:
-            image_data = FitsPreview.debayer_with_pattern(image_data=resized_image_data,
-                                                          bayer_pattern=BayerPattern.RGGB)
-        else:
-            image_data = resized_image_data
+            image_data = cv2.cvtColor(FitsPreview.debayer_with_pattern(image_data=image_data,
+                                                                       bayer_pattern=bayer_pattern),
+                                      cv2.COLOR_RGB2BGR)
         # Stretching
         image_data = FitsPreview.non_linear_stretch(image_data=image_data)
         # Adding watermark
@@ -113,27 +240,114 @@ class FitsPreview:
     def generate_png_preview(file_path: str = '', output_file_path: str = '', zoom_factor: float = ZoomEnum.LARGE.value,
                              is_color: bool = False) -> str or None:
         image_data = FitsPreview.load_and_process_fits(file_path=file_path, zoom_factor=zoom_factor, is_color=is_color)
-        file_path = cv2.imwrite(filename=FitsPreview.get_valid_output_file_name(output_file_path), img=image_data)
+        output_file_path = FitsPreview.get_valid_output_file_name(output_file_path, extension='.png')
+        # Fast compression, a preview is written once and the default level is several times slower
+        if not cv2.imwrite(filename=output_file_path, img=image_data, params=[cv2.IMWRITE_PNG_COMPRESSION, 1]):
+            return None
 
-        return file_path
+        return output_file_path
 
     @staticmethod
     def generate_jpg_preview(file_path: str = '', output_file_path: str = '', zoom_factor: float = ZoomEnum.LARGE.value,
-                             is_color: bool = False, quality: int = 95) -> str:
+                             is_color: bool = False, quality: int = 95) -> str or None:
         if not 0 <= quality <= 100:
             print('Invalid quality parameter. Use default value(95).')
             quality = 95
 
         image_data = FitsPreview.load_and_process_fits(file_path=file_path, zoom_factor=zoom_factor, is_color=is_color)
-        file_path = cv2.imwrite(filename=FitsPreview.get_valid_output_file_name(output_file_path), img=image_data,
-                                params=[cv2.IMWRITE_JPEG_QUALITY, quality])
+        output_file_path = FitsPreview.get_valid_output_file_name(output_file_path, extension='.jpg')
+        if not cv2.imwrite(filename=output_file_path, img=image_data, params=[cv2.IMWRITE_JPEG_QUALITY, quality]):
+            return None
 
-        return file_path
+        return output_file_path
+
+    @staticmethod
+    def generate_jpg_preview_data(file_path: str = '', zoom_factor: float = ZoomEnum.SMALL.value,
+                                  quality: int = 90) -> Tuple[Optional[bytes], Optional[FitsRawData]]:
+        """
+        Encode the preview in memory. Color is decided by the BAYERPAT header of the frame.
+        :return: Jpg data and the header information of the frame, or (None, None) if the file can't be read.
+        """
+        fits_image = FitsPreview.load_fits_data(file_path=file_path)
+        if fits_image is None:
+            return None, None
+        is_color = fits_image.bayer_pattern is not None
+        image_data = FitsPreview.process_fits_data(fits_image=fits_image, zoom_factor=zoom_factor, is_color=is_color,
+                                                   bayer_pattern=fits_image.bayer_pattern or BayerPattern.RGGB)
+        success, encoded = cv2.imencode('.jpg', image_data, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not success:
+            return None, None
+        return encoded.tobytes(), fits_image
+
+
+class FitsPreviewRenderer:
+    """
+    Renders jpg previews of fits files on a pool of worker threads, so event handling never waits for them.
+    Previews are cached by file path and modification time, a frame reported more than once is only rendered once.
+    """
+
+    def __init__(self, zoom_factor: float = ZoomEnum.SMALL.value, quality: int = 90, worker_count: int = 2,
+                 cache_size: int = 16):
+        self.zoom_factor = zoom_factor
+        self.quality = quality
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # type: OrderedDict[Tuple[str, int], Tuple[bytes, FitsRawData]]
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='fits_preview')
+
+    def submit(self, file_path: str, callback: Callable[[str, bytes, FitsRawData], None]):
+        """
+        Render the preview in background, 'callback' is called from a worker thread with the file path, jpg data and
+        header information when done. Nothing is called if the file can't be read.
+        """
+        self.executor.submit(self.render, file_path, callback)
+
+    def render(self, file_path: str, callback: Callable[[str, bytes, FitsRawData], None]):
+        try:
+            key = (file_path, os.stat(file_path).st_mtime_ns)
+        except OSError as exception:
+            print(f'Unable to preview {file_path}: {exception}')
+            return
+
+        try:
+            with self.lock:
+                cached = self.cache.get(key)
+                if cached:
+                    self.cache.move_to_end(key)
+            if not cached:
+                image_data, fits_image = FitsPreview.generate_jpg_preview_data(file_path=file_path,
+                                                                               zoom_factor=self.zoom_factor,
+                                                                               quality=self.quality)
+                if image_data is None:
+                    return
+                cached = (image_data, fits_image)
+                with self.lock:
+                    self.cache[key] = cached
+                    while len(self.cache) > self.cache_size:
+                        self.cache.popitem(last=False)
+            callback(file_path, *cached)
+        except Exception as exception:
+            print(f'Failed to preview {file_path}: {exception}')
 
 
 if __name__ == '__main__':
-    mono_fits_folder = 'some_folder'
-    mono_fits_fn = 'some_file.fit'
-    mono_fits_path = os.path.join(mono_fits_folder, mono_fits_fn)
-    png_path = FitsPreview.generate_png_preview(file_path=mono_fits_path, zoom_factor=ZoomEnum.LARGE.value,
-                                                is_color=False)
+    import tempfile
+    import time
+
+    # A synthetic 60MP 16 bit frame, saved like capture software does with BZERO=32768
+    rng = np.random.default_rng(0)
+    frame = (rng.normal(1200, 40, size=(6388, 9576)) +
+             3000 * np.exp(-((np.arange(9576) - 4788) / 2000.0) ** 2)[np.newaxis, :]).astype(np.uint16)
+    header = fits.Header()
+    header['OBSERVER'] = 'VoyagerTelegramBot'
+    mono_fits_path = os.path.join(tempfile.mkdtemp(), 'some_file.fit')
+    fits.PrimaryHDU(data=frame, header=header).writeto(mono_fits_path)
+    del frame
+
+    for zoom_enum in ZoomEnum:
+        for is_color in (False, True):
+            start = time.perf_counter()
+            png_path = FitsPreview.generate_png_preview(file_path=mono_fits_path,
+                                                        output_file_path=f'{mono_fits_path}_{zoom_enum.name}_{is_color}.png',
+                                                        zoom_factor=zoom_enum.value, is_color=is_color)
+            print(f'{zoom_enum.name} color={is_color}: {png_path} in {time.perf_counter() - start:.2f}s')
@@ -0,0 +1,151 @@
+import json
+import math
+import os
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+
+@dataclass
+class FilterFocusStats:
+    """Sufficient statistics of (temperature, position) pairs of one filter."""
+    count: int = 0
+    sum_temperature: float = 0
+    sum_position: float = 0
+    sum_temperature_squared: float = 0
+    sum_temperature_position: float = 0
+    sum_position_squared: float = 0
+
+    def add(self, temperature: float, position: float):
+        self.count += 1
+        self.sum_temperature += temperature
+        self.sum_position += position
+        self.sum_temperature_squared += temperature * temperature
+        self.sum_temperature_position += temperature * position
+        self.sum_position_squared += position * position
+
+    def centered_temperature_squared(self) -> float:
+        return self.sum_temperature_squared - self.sum_temperature ** 2 / self.count
+
+    def centered_temperature_position(self) -> float:
+        return self.sum_temperature_position - self.sum_temperature * self.sum_position / self.count
+
+    def centered_position_squared(self) -> float:
+        return self.sum_position_squared - self.sum_position ** 2 / self.count
+
+
+class FocusModel:
+    """
+    Temperature compensation model of the focuser: position = slope * temperature + offset of the filter.
+    The slope is shared by all filters, since it's a property of the optical train, while every filter has its own
+    offset. It's an ordinary least squares fit which only keeps sums per filter, so it's updated in O(1) for each
+    autofocus result and persisted as a tiny json file.
+    """
+
+    def __init__(self, model_filename: str = 'data/focus_model.json', min_temperature_span: float = 1.0):
+        """
+        :param min_temperature_span: The slope isn't trusted until temperatures of the results spread at least this
+        many degrees.
+        """
+        self.model_filename = model_filename
+        self.min_temperature_span = min_temperature_span
+        self.stats = dict()  # type: Dict[str, FilterFocusStats]
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.model_filename):
+            return
+        try:
+            with open(self.model_filename, 'r') as model_file:
+                content = json.load(model_file)
+            self.stats = {filter_key: FilterFocusStats(**stats) for filter_key, stats in content['filters'].items()}
+        except (OSError, ValueError, KeyError, TypeError) as exception:
+            print(f'Ignoring broken focus model {self.model_filename}: {exception}')
+
+    def save(self):
+        if os.path.dirname(self.model_filename):
+            Path(os.path.dirname(self.model_filename)).mkdir(parents=True, exist_ok=True)
+        content = {'filters': {filter_key: asdict(stats) for filter_key, stats in self.stats.items()}}
+        temp_filename = self.model_filename + '.tmp'
+        with open(temp_filename, 'w') as model_file:
+            json.dump(content, model_file, indent=2)
+        os.replace(temp_filename, self.model_filename)
+
+    def add_result(self, filter_index: int, temperature: float, position: float, should_save: bool = True):
+        with self.lock:
+            self.stats.setdefault(str(filter_index), FilterFocusStats()).add(temperature, position)
+            if should_save:
+                self.save()
+
+    def slope(self) -> Optional[float]:
+        """
+        :return: Focuser steps per degree, or None if temperatures haven't varied enough to tell.
+        """
+        centered_temperature_squared = sum(stats.centered_temperature_squared() for stats in self.stats.values())
+        # Sum of squared deviations of n samples spanning d degrees is at least d^2 / 2
+        if centered_temperature_squared < self.min_temperature_span ** 2 / 2:
+            return None
+        return sum(stats.centered_temperature_position() for stats in self.stats.values()) / \
+            centered_temperature_squared
+
+    def offset(self, filter_index: int) -> Optional[float]:
+        stats = self.stats.get(str(filter_index))
+        slope = self.slope()
+        if not stats or slope is None:
+            return None
+        return (stats.sum_position - slope * stats.sum_temperature) / stats.count
+
+    def predict(self, filter_index: int, temperature: float) -> Optional[float]:
+        """
+        :return: Predicted focus position of the filter at given temperature, or None if the model doesn't know yet.
+        """
+        offset = self.offset(filter_index)
+        if offset is None:
+            return None
+        return self.slope() * temperature + offset
+
+    def residual_rms(self) -> Optional[float]:
+        """
+        :return: RMS of the residuals of all results against the fit, in focuser steps.
+        """
+        slope = self.slope()
+        count = sum(stats.count for stats in self.stats.values())
+        # One degree of freedom is taken by the slope, and one by each offset
+        degrees_of_freedom = count - len(self.stats) - 1
+        if slope is None or degrees_of_freedom <= 0:
+            return None
+        squared_error = sum(stats.centered_position_squared() - slope * stats.centered_temperature_position()
+                            for stats in self.stats.values())
+        return math.sqrt(max(squared_error, 0) / degrees_of_freedom)
+
+    def is_refocus_needed(self, filter_index: int, temperature: float, current_position: float,
+                          tolerance_steps: float) -> bool:
+        """
+        :param current_position: Position the focuser is at, usually the result of the last autofocus.
+        :param tolerance_steps: Shift of focus position which is still within the critical focus zone.
+        :return: Whether the predicted position moved away from the current one, always True if the model can't tell.
+        """
+        predicted = self.predict(filter_index, temperature)
+        if predicted is None:
+            return True
+        return abs(predicted - current_position) > tolerance_steps
+
+
+if __name__ == '__main__':
+    import random
+    import tempfile
+
+    model = FocusModel(model_filename=os.path.join(tempfile.mkdtemp(), 'focus_model.json'))
+    filter_offsets = {0: 10000, 1: 10040, 2: 9985}
+    for i in range(60):
+        filter_index = random.choice(list(filter_offsets))
+        temperature = random.uniform(0, 15)
+        model.add_result(filter_index, temperature, -32 * temperature + filter_offsets[filter_index] +
+                         random.gauss(0, 8))
+    print(f'slope {model.slope():.2f} steps/C, residual rms {model.residual_rms():.1f} steps')
+    reloaded = FocusModel(model_filename=model.model_filename)
+    for filter_index, offset in filter_offsets.items():
+        print(f'filter {filter_index}: offset {reloaded.offset(filter_index):.1f} (truth {offset}), '
+              f'predicted at 5C {reloaded.predict(filter_index, 5):.1f} (truth {offset - 32 * 5})')
@@ -1,9 +1,13 @@
+import threading
+import time
 from abc import abstractmethod
 from datetime import datetime
 
 import pytz
 import requests
 
+from utils.forecast.http_cache import HttpCache, CachedResponse
+
 FORECAST_HEADER = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36',
 }
@@ -19,32 +23,124 @@ class BaseHttpForecast:
         self.key = None
         self.api_url = None
 
+        observing_condition_config = getattr(config, 'observing_condition_config', None)
+        self.timeout_sec = 10
+        if hasattr(observing_condition_config, 'forecast_timeout_sec'):
+            self.timeout_sec = observing_condition_config.forecast_timeout_sec
+        cache_folder = 'data/forecast_cache/'
+        if hasattr(observing_condition_config, 'forecast_cache_folder'):
+            cache_folder = observing_condition_config.forecast_cache_folder
+        self.cache = HttpCache(cache_folder=cache_folder)
+        self.update_interval_sec = 3600
+        self.retry_interval_sec = 300
+        self.last_attempt_time = None  # type: datetime.datetime
+
+        self.session = requests.Session()
+        self.session.headers.update(FORECAST_HEADER)
+        self.thread = None
+        self.lock = threading.Lock()
+
     @abstractmethod
     def get_api_url(self) -> str:
         return ''
 
     @abstractmethod
-    def parse_response(self, raw_response: str = None):
-        return
+    def parse_response(self, raw_response: str = None) -> list:
+        """
+        :param raw_response: Body of the http response.
+        :return: A new list of forecast data points.
+        """
+        return list()
+
+    def apply_response(self, raw_response: str, updated_time: datetime):
+        # Parse into a new list and swap it in, so readers never see a half parsed forecast
+        self.forecast = self.parse_response(raw_response=raw_response)
+        self.last_updated_time = updated_time
+
+    def load_cached_forecast(self) -> bool:
+        """
+        Serve the forecast cached on disk, even if it is stale, so the console has something to show right away.
+        :return: Whether a cached forecast was loaded.
+        """
+        api_url = self.get_api_url()
+        if api_url == '':
+            return False
+        cached_response = self.cache.load(api_url)
+        if not cached_response:
+            return False
+        try:
+            self.apply_response(raw_response=cached_response.body,
+                                updated_time=datetime.fromtimestamp(cached_response.fetched_timestamp))
+        except Exception as exception:
+            print(f'Failed to parse cached forecast of {self.service_name}: {exception}')
+            return False
+        return True
 
     def update_forecast(self):
-        if self.get_api_url() == '':
-            print('Fail to generate API URL')
-            return
+        with self.lock:
+            self.last_attempt_time = datetime.now()
+            api_url = self.get_api_url()
+            if api_url == '':
+                print('Fail to generate API URL')
+                return
 
-        response = requests.get(self.get_api_url(), headers=FORECAST_HEADER)
-        if response.status_code != 200:
-            print(f'Failed to fetch data from: {self.get_api_url()}')
-        self.parse_response(raw_response=response.text)
-        self.last_updated_time = datetime.now()
+            cached_response = self.cache.load(api_url)
+            try:
+                response = self.session.get(api_url, headers=self.cache.conditional_headers(cached_response),
+                                            timeout=self.timeout_sec)
+            except requests.RequestException as exception:
+                print(f'Failed to fetch data from: {api_url}, {exception}')
+                return
+
+            if response.status_code == 304 and cached_response:
+                # Not modified, the forecast we are showing is still the latest one.
+                self.cache.touch(cached_response)
+                if not self.forecast:
+                    self.apply_response(raw_response=cached_response.body, updated_time=datetime.now())
+                else:
+                    self.last_updated_time = datetime.now()
+                return
+            if response.status_code != 200:
+                print(f'Failed to fetch data from: {api_url}, status code: {response.status_code}')
+                return
+
+            self.apply_response(raw_response=response.text, updated_time=datetime.now())
+            self.cache.store(CachedResponse(url=api_url, body=response.text,
+                                            etag=response.headers.get('ETag', ''),
+                                            last_modified=response.headers.get('Last-Modified', ''),
+                                            fetched_timestamp=time.time()))
 
     def maybe_update_forecast(self):
-        if self.last_updated_time and (
-                datetime.now() - self.last_updated_time).total_seconds() < 3600:
+        now = datetime.now()
+        if self.last_updated_time and (now - self.last_updated_time).total_seconds() < self.update_interval_sec:
             # recently updated, do nothing
             return
+        if self.last_attempt_time and (now - self.last_attempt_time).total_seconds() < self.retry_interval_sec:
+            # recently failed, wait a bit before trying again
+            return
         self.update_forecast()
 
+    def start(self):
+        """Serve the cached forecast right away, and keep the forecast updated in a background thread."""
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self.update_loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def update_loop(self):
+        # Resolving the api url may need a http request as well, so even loading the cache happens off the caller
+        try:
+            self.load_cached_forecast()
+        except Exception as exception:
+            print(f'Failed to load cached forecast of {self.service_name}: {exception}')
+        while True:
+            try:
+                self.maybe_update_forecast()
+            except Exception as exception:
+                print(f'Failed to update forecast of {self.service_name}: {exception}')
+            time.sleep(60)
+
 
 class BaseAlgorithmForecast:
     def __init__(self, config: object):
@@ -53,13 +149,99 @@ class BaseAlgorithmForecast:
         self.config = config
         self.timezone = pytz.timezone(self.config.timezone)
         self.last_updated_time = None  # type: datetime.datetime
+        self.update_interval_sec = 3600
 
     def update_forecast(self):
         self.last_updated_time = datetime.now()
 
     def maybe_update_forecast(self):
         if self.last_updated_time and (
-                datetime.now() - self.last_updated_time).total_seconds() < 3600:
+                datetime.now() - self.last_updated_time).total_seconds() < self.update_interval_sec:
             # recently updated, do nothing
             return
         self.update_forecast()
+
+
+if __name__ == '__main__':
+    # Exercise the http cache against a local stub server: the first fetch gets the full body, the restarted
+    # service serves the cached body right away, and revalidating it returns 304 without a body. The same is checked
+    # for a server which only sends Last-Modified, without an ETag.
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+    from configs import class_from_dict
+
+    class StubHandler(BaseHTTPRequestHandler):
+        etag = '"v1"'
+        last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        # (path, If-None-Match, If-Modified-Since, status) of every request
+        requests_seen = list()
+
+        def do_GET(self):
+            use_etag = self.path == '/forecast'
+            if_none_match = self.headers.get('If-None-Match')
+            if_modified_since = self.headers.get('If-Modified-Since')
+            not_modified = if_none_match == self.etag if use_etag else if_modified_since == self.last_modified
+            status = 304 if not_modified else 200
+            self.requests_seen.append((self.path, if_none_match, if_modified_since, status))
+            self.send_response(status)
+            if not_modified:
+                self.end_headers()
+                return
+            body = b'clear\nclear\ncloudy'
+            if use_etag:
+                self.send_header('ETag', self.etag)
+            self.send_header('Last-Modified', self.last_modified)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            return
+
+    class LineForecast(BaseHttpForecast):
+        path = '/forecast'
+
+        def get_api_url(self) -> str:
+            return f'http://127.0.0.1:{server.server_port}{self.path}'
+
+        def parse_response(self, raw_response: str = None) -> list:
+            return raw_response.splitlines()
+
+    class LastModifiedLineForecast(LineForecast):
+        path = '/forecast-without-etag'
+
+    server = HTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = class_from_dict('Configs', {
+        'observing_condition_config': {'forecast_cache_folder': tempfile.mkdtemp()},
+        'timezone': 'America/Los_Angeles'})()
+    expected_forecast = ['clear', 'clear', 'cloudy']
+
+    for forecast_class, uses_etag in [(LineForecast, True), (LastModifiedLineForecast, False)]:
+        service = forecast_class(config=config)
+        service.update_forecast()
+        print('fetched:', service.forecast)
+        assert service.forecast == expected_forecast
+        assert StubHandler.requests_seen[-1] == (forecast_class.path, None, None, 200)
+
+        restarted_service = forecast_class(config=config)
+        assert restarted_service.load_cached_forecast()
+        print('loaded from cache:', restarted_service.forecast)
+        assert restarted_service.forecast == expected_forecast
+
+        # A 304 without a body must leave the cached body in place, even when nothing was shown before
+        revalidating_service = forecast_class(config=config)
+        revalidating_service.update_forecast()
+        print('after revalidation:', revalidating_service.forecast)
+        path, if_none_match, if_modified_since, status = StubHandler.requests_seen[-1]
+        assert status == 304
+        if uses_etag:
+            assert if_none_match == StubHandler.etag
+        else:
+            # No ETag was sent, so Last-Modified is the only validator
+            assert if_none_match is None and if_modified_since == StubHandler.last_modified
+        assert revalidating_service.forecast == expected_forecast
+        assert revalidating_service.last_updated_time is not None
+    server.shutdown()
+    print('http cache checks passed')
@@ -1,17 +1,46 @@
 import datetime
+import html
 import re
 import time
 from collections import deque
+from typing import Iterator, Tuple
 
 import pytz
-import requests
-from bs4 import BeautifulSoup
 from rich import pretty
 
 from configs import class_from_dict
 from data_structure.clear_dark_sky import ClearDarkSkyDataPoint, Transparency, Seeing, WindSpeed, CloudCover, \
     Temperature
-from utils.forecast.base_forecast import BaseHttpForecast, FORECAST_HEADER
+from utils.forecast.base_forecast import BaseHttpForecast
+from utils.forecast.http_cache import CachedResponse
+
+# Only the <area> tags of the image map and the <h1> title are needed from the chart page, pick them out with regular
+# expressions instead of building a whole DOM.
+# Attribute values may contain '>', like title="9:00: >45 mph (12Z+3hr)", so quoted values are matched as a whole.
+AREA_TAG_PATTERN = re.compile(r'<area\b((?:[^>"\']|"[^"]*"|\'[^\']*\')*)>', re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([a-zA-Z-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))')
+H1_PATTERN = re.compile(r'<h1\b[^>]*>([^<]*)', re.IGNORECASE)
+# First link directly inside a table cell of the chart finder result
+CHART_LINK_PATTERN = re.compile(r'<td\b[^>]*>[^<]*<a\b[^>]*?\bhref\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def extract_areas(raw_response: str) -> Iterator[Tuple[str, str]]:
+    """
+    :return: (coords, title) of each <area> tag that has both attributes, in document order.
+    """
+    for area_match in AREA_TAG_PATTERN.finditer(raw_response):
+        attributes = dict()
+        for name, double_quoted, single_quoted, unquoted in ATTRIBUTE_PATTERN.findall(area_match.group(1)):
+            attributes[name.lower()] = double_quoted or single_quoted or unquoted
+        if 'coords' in attributes and 'title' in attributes:
+            yield attributes['coords'], html.unescape(attributes['title'])
+
+
+def extract_title(raw_response: str) -> str:
+    h1_match = H1_PATTERN.search(raw_response)
+    if not h1_match:
+        return ''
+    return html.unescape(h1_match.group(1))
 
 
 class ClearDarkSkyForecast(BaseHttpForecast):
@@ -21,8 +50,13 @@ class ClearDarkSkyForecast(BaseHttpForecast):
         self.service_name = 'ClearDarkSky'
 
     def get_api_url(self) -> str:
-        self.determine_key()
-        self.api_url = f'http://www.cleardarksky.com/c/{self.key}.html'
+        if not self.api_url:
+            # The chart key never changes for a location, resolve it only once
+            self.determine_key()
+            if self.key:
+                self.api_url = f'http://www.cleardarksky.com/c/{self.key}.html'
+            else:
+                return ''
 
         return self.api_url
 
@@ -34,39 +68,51 @@ class ClearDarkSkyForecast(BaseHttpForecast):
         if hasattr(config, 'clear_dark_sky_key'):
             self.key = config.clear_dark_sky_key
         elif hasattr(config, 'latitude') and hasattr(config, 'longitude'):
-            find_result = requests.get(
-                f'http://www.cleardarksky.com/cgi-bin/find_chart.py?' + \
-                f'type=llmap&Mn=telescope%2520accessory&olat={config.latitude}&olong={config.longitude}' + \
-                f'&olatd=&olatm=&olongd=&olongm=&unit=1',
-                headers=FORECAST_HEADER)
-            if find_result.status_code != 200:
-                print(f'failed to search for {config.latitude}x{config.latitude}')
-            soup = BeautifulSoup(find_result.text, 'html.parser')
-            links = soup.select('tr td>a')
-            link = links[0].get('href').replace('../c/', '')
-            self.key = re.sub(r'\.html.*$', '', link)
+            self.key = self.find_chart_key(latitude=config.latitude, longitude=config.longitude)
         else:
             self.key = 'RnhHdlAZkey'
 
-    def parse_response(self, raw_response: str = None):
-        soup = BeautifulSoup(raw_response, 'html.parser')
+    def find_chart_key(self, latitude: float, longitude: float) -> str:
+        """
+        Look up the chart closest to given location, the result is memoized in the forecast cache folder.
+        :return: Key of the chart, or an empty string if the lookup failed.
+        """
+        find_url = f'http://www.cleardarksky.com/cgi-bin/find_chart.py?' + \
+                   f'type=llmap&Mn=telescope%2520accessory&olat={latitude}&olong={longitude}' + \
+                   f'&olatd=&olatm=&olongd=&olongm=&unit=1'
+        cached_key = self.cache.load(find_url)
+        if cached_key and cached_key.body:
+            return cached_key.body
+
+        find_result = self.session.get(find_url, timeout=self.timeout_sec)
+        if find_result.status_code != 200:
+            print(f'failed to search for {latitude}x{longitude}')
+            return ''
+        link_match = CHART_LINK_PATTERN.search(find_result.text)
+        if not link_match:
+            print(f'No clear dark sky chart found for {latitude}x{longitude}')
+            return ''
+        link = html.unescape(link_match.group(1)).replace('../c/', '')
+        key = re.sub(r'\.html.*$', '', link)
+        self.cache.store(CachedResponse(url=find_url, body=key, fetched_timestamp=time.time()))
+        return key
 
-        header = soup.select('h1')
-        if len(header):
-            h1 = header[0]
-            if h1.contents:
-                self.title = h1.contents[0]
+    def parse_response(self, raw_response: str = None) -> list:
+        forecast = list()
+
+        title = extract_title(raw_response)
+        if title:
+            self.title = title
 
-        areas = soup.select('map area')
         area_dict = dict()
-        for area in areas:
-            x, y, x1, y1 = [int(x) for x in area.get('coords').split(',')]
+        for coords, area_title in extract_areas(raw_response):
+            x, y, x1, y1 = [int(x) for x in coords.split(',')]
             if x == 0 or x1 - x < 10:
                 # weird area tag, skip it
                 continue
             if y not in area_dict:
                 area_dict[y] = deque()
-            area_dict[y].append((x, y, x1, y1, area.get('title')))
+            area_dict[y].append((x, y, x1, y1, area_title))
         cloud_cover_queue = area_dict.get(77)
         transparency_queue = area_dict.get(93)
         seeing_queue = area_dict.get(109)
@@ -87,7 +133,8 @@ class ClearDarkSkyForecast(BaseHttpForecast):
                                           transparency_string=transparency_string, seeing_string=seeing_string,
                                           smoke_string=smoke_string, wind_string=wind_string,
                                           humidity_string=humidity_string, temperature_string=temperature_string)
-            self.forecast.append(datapoint)
+            forecast.append(datapoint)
+        return forecast
 
     def parse_record(self, cloud_cover_string: str, transparency_string: str,
                      seeing_string: str, smoke_string: str, wind_string: str,
@@ -232,6 +279,22 @@ class ClearDarkSkyForecast(BaseHttpForecast):
 
 
 if __name__ == '__main__':
+    # Titles of the hottest and windiest cells contain a literal '>', they must not cut the <area> tag short
+    chart_rows = [(77, 'Clear'), (93, 'Average'), (109, 'Average 3/5'), (173, 'No Smoke'), (189, '>45 mph'),
+                  (205, '25% to 30%'), (221, '>113F')]
+    chart_page = '<h1>Test Chart</h1><map>' + ''.join(
+        f'<area shape="rect" coords="100,{y},120,{y + 16}" title="9:00: {value} (12Z+3hr)">'
+        for y, value in chart_rows) + '</map>'
+    assert [area_title for coords, area_title in extract_areas(chart_page)] == \
+           [f'9:00: {value} (12Z+3hr)' for y, value in chart_rows]
+    offline_config = class_from_dict('Configs', {'observing_condition_config': {'clear_dark_sky_key': 'TestKey'},
+                                                 'timezone': 'America/Los_Angeles'})()
+    offline_forecast = ClearDarkSkyForecast(config=offline_config).parse_response(chart_page)
+    assert len(offline_forecast) == 1
+    assert offline_forecast[0].wind_speed == WindSpeed.LARGER_THAN_FORTY_FIVE
+    assert offline_forecast[0].temperature == Temperature.LARGER_THAN_113
+    print('area extraction checks passed')
+
     config = {
         'observing_condition_config': {
             'clear_dark_sky_key': 'RssCrkObCAkey',
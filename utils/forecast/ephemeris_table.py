@@ -0,0 +1,203 @@
+import math
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+import ephem
+import numpy as np
+
+# ephem counts days since 1899/12/31 12:00 UTC, this is 1970/1/1 00:00 UTC in that scale
+UNIX_EPOCH_IN_EPHEM_DATE = 25567.5
+SECONDS_PER_DAY = 86400.0
+
+SUN_HORIZON = '-0.34'
+ASTRO_TWILIGHT_HORIZON = '-18'
+
+MOON_PHASE_FUNCTIONS = {
+    'new': (ephem.previous_new_moon, ephem.next_new_moon),
+    'first_quarter': (ephem.previous_first_quarter_moon, ephem.next_first_quarter_moon),
+    'full': (ephem.previous_full_moon, ephem.next_full_moon),
+    'last_quarter': (ephem.previous_last_quarter_moon, ephem.next_last_quarter_moon),
+}
+
+
+def ephem_date_from_timestamp(timestamp: float) -> ephem.Date:
+    return ephem.Date(timestamp / SECONDS_PER_DAY + UNIX_EPOCH_IN_EPHEM_DATE)
+
+
+def timestamp_from_ephem_date(date: ephem.Date) -> float:
+    return (float(date) - UNIX_EPOCH_IN_EPHEM_DATE) * SECONDS_PER_DAY
+
+
+class EphemerisTable:
+    """
+    Sun and moon positions sampled at fixed steps, plus rise, set, twilight and moon phase events, for a window of
+    time starting at 'start_timestamp'. Computed once, after that every lookup is an interpolation or a binary search,
+    no ephem searches needed. All timestamps are seconds since epoch.
+    """
+
+    def __init__(self, observer: ephem.Observer, start_timestamp: float, duration_hours: float = 48,
+                 step_minutes: float = 5):
+        self.observer = observer.copy()
+        self.start_timestamp = start_timestamp
+        self.step_sec = step_minutes * 60
+        step_count = int(math.ceil(duration_hours * 3600 / self.step_sec)) + 1
+        self.end_timestamp = start_timestamp + (step_count - 1) * self.step_sec
+
+        self.columns = dict()  # type: Dict[str, np.ndarray]
+        self.compute_positions(step_count)
+
+        # Events are searched a bit further than the table, so that the 'next' event is known everywhere in the table.
+        events_end_timestamp = self.end_timestamp + 2 * SECONDS_PER_DAY
+        sun = ephem.Sun()
+        moon = ephem.Moon()
+        self.events = {
+            'sunrise': self.find_events(sun, 'next_rising', SUN_HORIZON, False, events_end_timestamp),
+            'sunset': self.find_events(sun, 'next_setting', SUN_HORIZON, False, events_end_timestamp),
+            # Morning astronomical twilight ends when sun rises above -18 degrees, evening one starts when it sets.
+            'astro_twilight_end': self.find_events(sun, 'next_rising', ASTRO_TWILIGHT_HORIZON, True,
+                                                   events_end_timestamp),
+            'astro_twilight_start': self.find_events(sun, 'next_setting', ASTRO_TWILIGHT_HORIZON, True,
+                                                     events_end_timestamp),
+            'moonrise': self.find_events(moon, 'next_rising', SUN_HORIZON, False, events_end_timestamp),
+            'moonset': self.find_events(moon, 'next_setting', SUN_HORIZON, False, events_end_timestamp),
+        }  # type: Dict[str, List[float]]
+        self.phase_events = dict()  # type: Dict[str, List[float]]
+        for phase_name, (previous_phase, next_phase) in MOON_PHASE_FUNCTIONS.items():
+            self.phase_events[phase_name] = self.find_phase_events(previous_phase, next_phase)
+
+    def compute_positions(self, step_count: int):
+        sun = ephem.Sun()
+        moon = ephem.Moon()
+        self.observer.horizon = SUN_HORIZON
+        sun_altitude = np.zeros(step_count)
+        sun_azimuth = np.zeros(step_count)
+        moon_altitude = np.zeros(step_count)
+        moon_azimuth = np.zeros(step_count)
+        moon_ra = np.zeros(step_count)
+        moon_dec = np.zeros(step_count)
+        moon_phase = np.zeros(step_count)
+        for i in range(step_count):
+            self.observer.date = ephem_date_from_timestamp(self.start_timestamp + i * self.step_sec)
+            sun.compute(self.observer)
+            moon.compute(self.observer)
+            sun_altitude[i] = sun.alt
+            sun_azimuth[i] = sun.az
+            moon_altitude[i] = moon.alt
+            moon_azimuth[i] = moon.az
+            moon_ra[i] = moon.ra
+            moon_dec[i] = moon.dec
+            moon_phase[i] = moon.moon_phase
+
+        # Angles are kept in degrees. Azimuth and RA are unwrapped so interpolating across 360->0 stays continuous.
+        self.columns['sun_altitude'] = np.degrees(sun_altitude)
+        self.columns['sun_azimuth'] = np.degrees(np.unwrap(sun_azimuth))
+        self.columns['moon_altitude'] = np.degrees(moon_altitude)
+        self.columns['moon_azimuth'] = np.degrees(np.unwrap(moon_azimuth))
+        self.columns['moon_ra'] = np.degrees(np.unwrap(moon_ra))
+        self.columns['moon_dec'] = np.degrees(moon_dec)
+        self.columns['moon_phase'] = moon_phase
+
+    def find_events(self, body: ephem.Body, search_method: str, horizon: str, use_center: bool,
+                    end_timestamp: float) -> List[float]:
+        self.observer.horizon = horizon
+        self.observer.date = ephem_date_from_timestamp(self.start_timestamp)
+        end_date = ephem_date_from_timestamp(end_timestamp)
+        events = list()
+        while True:
+            try:
+                event_date = getattr(self.observer, search_method)(body, use_center=use_center)
+            except (ephem.AlwaysUpError, ephem.NeverUpError):
+                break
+            if event_date > end_date:
+                break
+            events.append(timestamp_from_ephem_date(event_date))
+            self.observer.date = event_date + ephem.minute
+        return events
+
+    def find_phase_events(self, previous_phase, next_phase) -> List[float]:
+        """
+        :return: From the last phase event before the table, to the first one after the table.
+        """
+        event_date = previous_phase(ephem_date_from_timestamp(self.start_timestamp))
+        end_date = ephem_date_from_timestamp(self.end_timestamp)
+        events = [timestamp_from_ephem_date(event_date)]
+        while event_date <= end_date:
+            event_date = next_phase(event_date + 1)
+            events.append(timestamp_from_ephem_date(event_date))
+        return events
+
+    def covers(self, timestamp: float) -> bool:
+        return self.start_timestamp <= timestamp <= self.end_timestamp
+
+    def interpolate(self, column_name: str, timestamp: float) -> float:
+        column = self.columns[column_name]
+        position = (timestamp - self.start_timestamp) / self.step_sec
+        index = min(max(int(position), 0), len(column) - 2)
+        fraction = min(max(position - index, 0.0), 1.0)
+        return float(column[index] + (column[index + 1] - column[index]) * fraction)
+
+    def sun_position(self, timestamp: float) -> Tuple[float, float]:
+        """
+        :return: altitude and azimuth of the sun in degrees.
+        """
+        return self.interpolate('sun_altitude', timestamp), self.interpolate('sun_azimuth', timestamp) % 360
+
+    def moon_position(self, timestamp: float) -> Tuple[float, float]:
+        """
+        :return: altitude and azimuth of the moon in degrees.
+        """
+        return self.interpolate('moon_altitude', timestamp), self.interpolate('moon_azimuth', timestamp) % 360
+
+    def moon_equatorial(self, timestamp: float) -> Tuple[float, float]:
+        """
+        :return: apparent RA and DEC of the moon in degrees.
+        """
+        return self.interpolate('moon_ra', timestamp) % 360, self.interpolate('moon_dec', timestamp)
+
+    def moon_illumination(self, timestamp: float) -> float:
+        return self.interpolate('moon_phase', timestamp)
+
+    def next_event(self, event_name: str, timestamp: float) -> Optional[float]:
+        events = self.events[event_name]
+        index = bisect_right(events, timestamp)
+        return events[index] if index < len(events) else None
+
+    def next_phase(self, phase_name: str, timestamp: float) -> Optional[float]:
+        events = self.phase_events[phase_name]
+        index = bisect_right(events, timestamp)
+        return events[index] if index < len(events) else None
+
+    def previous_phase(self, phase_name: str, timestamp: float) -> Optional[float]:
+        events = self.phase_events[phase_name]
+        index = bisect_left(events, timestamp)
+        return events[index - 1] if index > 0 else None
+
+
+if __name__ == '__main__':
+    import time
+    import timeit
+
+    observer = ephem.Observer()
+    observer.lat = '37.3'
+    observer.lon = '-121.9'
+    observer.pressure = 0
+    now = time.time()
+
+    start = time.perf_counter()
+    table = EphemerisTable(observer=observer, start_timestamp=now)
+    print(f'Table built in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+    # Compare with direct computations half way between two samples
+    timestamp = now + 6 * 3600 + 150
+    observer.date = ephem_date_from_timestamp(timestamp)
+    moon = ephem.Moon(observer)
+    sun = ephem.Sun(observer)
+    print('sun', table.sun_position(timestamp), math.degrees(sun.alt), math.degrees(sun.az))
+    print('moon', table.moon_position(timestamp), math.degrees(moon.alt), math.degrees(moon.az))
+    print('moon phase', table.moon_illumination(timestamp), moon.moon_phase)
+    observer.horizon = SUN_HORIZON
+    print('sunset', table.next_event('sunset', timestamp),
+          timestamp_from_ephem_date(observer.next_setting(ephem.Sun())))
+    print('full moon', table.next_phase('full', timestamp),
+          timestamp_from_ephem_date(ephem.next_full_moon(observer.date)))
+    print('lookup: {:.2f}us'.format(timeit.timeit(lambda: table.moon_position(timestamp), number=10000) * 100))
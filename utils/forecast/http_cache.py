@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+
+@dataclass
+class CachedResponse:
+    url: str = ''
+    body: str = ''
+    etag: str = ''
+    last_modified: str = ''
+    fetched_timestamp: float = 0  # timestamp in seconds since epoch of the last successful fetch or revalidation
+
+
+class HttpCache:
+    """
+    A tiny on-disk cache of HTTP responses, one json file per url. Validators (ETag and Last-Modified) are kept so
+    that the cached body can be revalidated with a conditional request.
+    """
+
+    def __init__(self, cache_folder: str):
+        self.cache_folder = cache_folder
+
+    def cache_file_path(self, url: str) -> str:
+        file_name = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json'
+        return os.path.join(self.cache_folder, file_name)
+
+    def load(self, url: str) -> Optional[CachedResponse]:
+        try:
+            with open(self.cache_file_path(url), 'r', encoding='utf-8') as f:
+                cached_response = CachedResponse(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            return None
+        if cached_response.url != url:
+            return None
+        return cached_response
+
+    def store(self, cached_response: CachedResponse):
+        try:
+            os.makedirs(self.cache_folder, exist_ok=True)
+            file_path = self.cache_file_path(cached_response.url)
+            # write to a temporary file first, so a crash never leaves a half written cache behind
+            temp_file_path = file_path + '.tmp'
+            with open(temp_file_path, 'w', encoding='utf-8') as f:
+                json.dump(asdict(cached_response), f)
+            os.replace(temp_file_path, file_path)
+        except OSError as exception:
+            print(f'Failed to write forecast cache for {cached_response.url}: {exception}')
+
+    def conditional_headers(self, cached_response: Optional[CachedResponse]) -> dict:
+        headers = dict()
+        if cached_response:
+            if cached_response.etag:
+                headers['If-None-Match'] = cached_response.etag
+            if cached_response.last_modified:
+                headers['If-Modified-Since'] = cached_response.last_modified
+        return headers
+
+    def touch(self, cached_response: CachedResponse):
+        """Mark a cached response as freshly revalidated."""
+        cached_response.fetched_timestamp = time.time()
+        self.store(cached_response)
@@ -0,0 +1,215 @@
+import datetime
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.forecast.ephemeris_table import EphemerisTable
+from utils.forecast.sun_and_moon import SunAndMoon
+from utils.seq_generator import AstroTarget
+
+UNIX_EPOCH_IN_JULIAN_DATE = 2440587.5
+J2000_IN_JULIAN_DATE = 2451545.0
+
+
+def parse_sexagesimal(value: str, hours: bool = False) -> float:
+    """
+    Parse '05 35 17.300' or '-05:23:28.00' like strings.
+    :param hours: Whether the value is in hours, like RA.
+    :return: Value in degrees.
+    """
+    parts = value.replace(':', ' ').split()
+    sign = -1 if parts[0].startswith('-') else 1
+    degrees = 0
+    for i, part in enumerate(parts[:3]):
+        degrees += abs(float(part)) / (60 ** i)
+    degrees *= sign
+    return degrees * 15 if hours else degrees
+
+
+@dataclass
+class TargetObservability:
+    name: str = ''
+    usable_hours: float = 0
+    # Usable windows as (start, end) in local time
+    windows: List[Tuple[datetime.datetime, datetime.datetime]] = field(default_factory=list)
+    max_altitude: float = -90  # max altitude during the dark hours, in degrees
+    min_airmass: float = float('inf')  # airmass at max altitude, inf if the target never rises during the dark hours
+
+
+@dataclass
+class NightGrid:
+    """Everything about a night which doesn't depend on targets, sampled on a fixed time grid."""
+    timestamps: np.ndarray
+    dark: np.ndarray  # whether sun is below the dark sky altitude
+    local_sidereal_time: np.ndarray  # in degrees
+    moon_altitude: np.ndarray
+    moon_ra: np.ndarray
+    moon_dec: np.ndarray
+
+
+class ObservabilityCalculator:
+    """
+    Evaluates altitude, airmass and moon separation of many targets at once on a time grid of a night, and reports
+    the windows in which each target is usable. Grids and results are cached per night.
+    Target coordinates are treated as apparent ones, precession is ignored as it hardly matters for planning.
+    """
+
+    def __init__(self, config: object, step_minutes: float = 5, dark_sun_altitude: float = -18):
+        self.sun_and_moon = SunAndMoon(config=config)
+        self.observer = self.sun_and_moon.observer
+        self.timezone = self.sun_and_moon.timezone
+        self.latitude = float(self.observer.lat)  # ephem angles are in radians
+        self.longitude_deg = np.degrees(float(self.observer.lon))
+        self.step_minutes = step_minutes
+        self.dark_sun_altitude = dark_sun_altitude
+
+        self.night_grids = dict()  # type: Dict[datetime.date, NightGrid]
+        self.results = dict()  # type: Dict[tuple, TargetObservability]
+
+    def current_night(self) -> datetime.date:
+        # Nights are named by the date they start, before noon we are still in last night.
+        now = datetime.datetime.now(tz=self.timezone)
+        if now.hour < 12:
+            return (now - datetime.timedelta(days=1)).date()
+        return now.date()
+
+    def night_grid(self, night: datetime.date) -> NightGrid:
+        if night in self.night_grids:
+            return self.night_grids[night]
+
+        noon = self.timezone.localize(datetime.datetime.combine(night, datetime.time(hour=12)))
+        table = EphemerisTable(observer=self.observer, start_timestamp=noon.timestamp(), duration_hours=24,
+                               step_minutes=self.step_minutes)
+        timestamps = table.start_timestamp + np.arange(len(table.columns['sun_altitude'])) * table.step_sec
+        julian_days = timestamps / 86400.0 + UNIX_EPOCH_IN_JULIAN_DATE
+        greenwich_sidereal_time = 280.46061837 + 360.98564736629 * (julian_days - J2000_IN_JULIAN_DATE)
+        grid = NightGrid(timestamps=timestamps,
+                         dark=table.columns['sun_altitude'] < self.dark_sun_altitude,
+                         local_sidereal_time=np.mod(greenwich_sidereal_time + self.longitude_deg, 360),
+                         moon_altitude=table.columns['moon_altitude'],
+                         moon_ra=np.mod(table.columns['moon_ra'], 360),
+                         moon_dec=table.columns['moon_dec'])
+
+        # Only keep the grid of the nights being asked for recently
+        if len(self.night_grids) > 2:
+            oldest_night = min(self.night_grids)
+            del self.night_grids[oldest_night]
+            self.results = {key: value for key, value in self.results.items() if key[0] != oldest_night}
+        self.night_grids[night] = grid
+        return grid
+
+    def evaluate(self, targets: List[AstroTarget], night: Optional[datetime.date] = None, min_altitude: float = 30,
+                 min_moon_separation: float = 30) -> List[TargetObservability]:
+        """
+        :param targets: Targets with sexagesimal RA (hours) and DEC (degrees).
+        :param night: Date when the night starts, defaults to the current night.
+        :param min_altitude: Minimum altitude in degrees for a target to be usable.
+        :param min_moon_separation: Minimum distance to the moon in degrees, when the moon is above the horizon.
+        :return: Observability of each target, in the same order of targets.
+        """
+        if night is None:
+            night = self.current_night()
+        grid = self.night_grid(night)
+
+        results = [None] * len(targets)  # type: List[Optional[TargetObservability]]
+        missing_indexes = list()
+        missing_keys = list()
+        for i, target in enumerate(targets):
+            key = (night, target.name, target.ra, target.dec, min_altitude, min_moon_separation)
+            if key in self.results:
+                results[i] = self.results[key]
+            else:
+                missing_indexes.append(i)
+                missing_keys.append(key)
+        if not missing_indexes:
+            return results
+
+        ra = np.radians([parse_sexagesimal(targets[i].ra, hours=True) for i in missing_indexes])[:, np.newaxis]
+        dec = np.radians([parse_sexagesimal(targets[i].dec) for i in missing_indexes])[:, np.newaxis]
+
+        # Altitude of every target (rows) at every time of the grid (columns)
+        hour_angle = np.radians(grid.local_sidereal_time)[np.newaxis, :] - ra
+        sin_altitude = np.sin(dec) * np.sin(self.latitude) + np.cos(dec) * np.cos(self.latitude) * np.cos(hour_angle)
+        altitude = np.degrees(np.arcsin(np.clip(sin_altitude, -1, 1)))
+
+        moon_ra = np.radians(grid.moon_ra)[np.newaxis, :]
+        moon_dec = np.radians(grid.moon_dec)[np.newaxis, :]
+        cos_separation = np.sin(dec) * np.sin(moon_dec) + np.cos(dec) * np.cos(moon_dec) * np.cos(ra - moon_ra)
+        moon_separation = np.degrees(np.arccos(np.clip(cos_separation, -1, 1)))
+
+        usable = grid.dark[np.newaxis, :] & (altitude >= min_altitude) & \
+                 ((moon_separation >= min_moon_separation) | (grid.moon_altitude < 0)[np.newaxis, :])
+        dark_altitude = np.where(grid.dark[np.newaxis, :], altitude, -90)
+        max_altitude = dark_altitude.max(axis=1)
+        step_hours = self.step_minutes / 60
+
+        for row, (i, key) in enumerate(zip(missing_indexes, missing_keys)):
+            result = TargetObservability(name=targets[i].name,
+                                         usable_hours=float(usable[row].sum() * step_hours),
+                                         windows=self.windows(grid.timestamps, usable[row]),
+                                         max_altitude=float(max_altitude[row]),
+                                         min_airmass=airmass(float(max_altitude[row])))
+            self.results[key] = result
+            results[i] = result
+        return results
+
+    def windows(self, timestamps: np.ndarray, usable: np.ndarray) -> List[Tuple[datetime.datetime, datetime.datetime]]:
+        # Edges of consecutive usable samples
+        edges = np.diff(np.concatenate(([0], usable.astype(np.int8), [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        return [(datetime.datetime.fromtimestamp(timestamps[start], tz=self.timezone),
+                 datetime.datetime.fromtimestamp(timestamps[end], tz=self.timezone))
+                for start, end in zip(starts, ends)]
+
+    def rank_targets(self, targets: List[AstroTarget], night: Optional[datetime.date] = None,
+                     min_altitude: float = 30, min_moon_separation: float = 30) -> List[AstroTarget]:
+        """
+        :return: Targets which have usable hours in the night, most usable hours first.
+        """
+        results = self.evaluate(targets=targets, night=night, min_altitude=min_altitude,
+                                min_moon_separation=min_moon_separation)
+        ranked = sorted(zip(targets, results), key=lambda pair: pair[1].usable_hours, reverse=True)
+        return [target for target, result in ranked if result.usable_hours > 0]
+
+
+def airmass(altitude: float) -> float:
+    """
+    Kasten and Young (1989) airmass formula, which is still sane near the horizon.
+    :param altitude: Altitude in degrees.
+    """
+    if altitude <= 0:
+        return float('inf')
+    return 1 / (np.sin(np.radians(altitude)) + 0.50572 * (altitude + 6.07995) ** -1.6364)
+
+
+if __name__ == '__main__':
+    import time
+
+    from configs import class_from_dict
+
+    config = class_from_dict('Configs', {
+        'observing_condition_config': {'latitude': 37.3, 'longitude': -121.9},
+        'timezone': 'America/Los_Angeles'})()
+    calculator = ObservabilityCalculator(config=config)
+    targets = [AstroTarget(target_name='M42', ra='05 35 17.300', dec='-05 23 28.00'),
+               AstroTarget(target_name='M31', ra='00 42 44.300', dec='41 16 09.00'),
+               AstroTarget(target_name='M101', ra='14 03 12.600', dec='54 20 57.00')]
+    # Plenty of random targets to show the batch cost
+    random_state = np.random.default_rng(0)
+    for i in range(500):
+        targets.append(AstroTarget(target_name=f'Random {i}',
+                                   ra=f'{random_state.integers(0, 24)} {random_state.integers(0, 60)} 00',
+                                   dec=f'{random_state.integers(-30, 90)} {random_state.integers(0, 60)} 00'))
+
+    start = time.perf_counter()
+    results = calculator.evaluate(targets=targets)
+    print(f'{len(targets)} targets evaluated in {(time.perf_counter() - start) * 1000:.1f}ms')
+    start = time.perf_counter()
+    calculator.evaluate(targets=targets)
+    print(f'cached: {(time.perf_counter() - start) * 1000:.1f}ms')
+    for result in results[:3]:
+        print(result.name, f'{result.usable_hours:.1f}h', f'max alt {result.max_altitude:.1f}',
+              f'airmass {result.min_airmass:.2f}', [(s.strftime('%H:%M'), e.strftime('%H:%M')) for s, e in result.windows])
+    print('Best targets:', [target.name for target in calculator.rank_targets(targets)[:5]])
@@ -42,13 +42,14 @@ class OpenWeatherForecast(BaseHttpForecast):
 
         return self.api_url
 
-    def parse_response(self, raw_response: str = None):
+    def parse_response(self, raw_response: str = None) -> list:
+        forecast = list()
         if not raw_response:
-            return
+            return forecast
         json_response = json.loads(raw_response)
         if 'hourly' not in json_response:
             # response is not from 'onecall' API
-            return
+            return forecast
 
         current_forecast = json_response['current']
         data_point = FreeWeatherDataPoint(
@@ -60,7 +61,7 @@ class OpenWeatherForecast(BaseHttpForecast):
             dew_point=current_forecast['dew_point'],
             wind_speed=current_forecast['wind_speed']
         )
-        self.forecast.append(data_point)
+        forecast.append(data_point)
 
         hourly_forecast_records = json_response['hourly']
         for hourly_record in hourly_forecast_records:
@@ -73,7 +74,8 @@ class OpenWeatherForecast(BaseHttpForecast):
                 dew_point=hourly_record['dew_point'],
                 wind_speed=hourly_record['wind_speed']
             )
-            self.forecast.append(data_point)
+            forecast.append(data_point)
+        return forecast
 
 
 if __name__ == '__main__':
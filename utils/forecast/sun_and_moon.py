@@ -1,10 +1,13 @@
 import datetime
 import math
+import time
 from dataclasses import dataclass
+from typing import Optional
 
 import ephem
 
 from utils.forecast.base_forecast import BaseAlgorithmForecast
+from utils.forecast.ephemeris_table import EphemerisTable
 
 
 @dataclass
@@ -51,18 +54,30 @@ class SunAndMoon(BaseAlgorithmForecast):
 
         self.observer.pressure = 0
         self.observer.horizon = '-0:34'
-
-    def human_moon(self):
-        target_date_utc = self.observer.date
-        target_date_local = ephem.localtime(target_date_utc).date()
-        next_full = ephem.localtime(ephem.next_full_moon(target_date_utc)).date()
-        next_new = ephem.localtime(ephem.next_new_moon(target_date_utc)).date()
-        next_last_quarter = ephem.localtime(ephem.next_last_quarter_moon(target_date_utc)).date()
-        next_first_quarter = ephem.localtime(ephem.next_first_quarter_moon(target_date_utc)).date()
-        previous_full = ephem.localtime(ephem.previous_full_moon(target_date_utc)).date()
-        previous_new = ephem.localtime(ephem.previous_new_moon(target_date_utc)).date()
-        previous_last_quarter = ephem.localtime(ephem.previous_last_quarter_moon(target_date_utc)).date()
-        previous_first_quarter = ephem.localtime(ephem.previous_first_quarter_moon(target_date_utc)).date()
+        # Positions and events are looked up from a precomputed table, which is cheap enough to update every minute
+        self.ephemeris = None  # type: EphemerisTable
+        self.update_interval_sec = 60
+
+    def maybe_rebuild_ephemeris(self, timestamp: float):
+        # Keep at least a day of look ahead, this rebuilds the table about once a day.
+        if self.ephemeris and self.ephemeris.start_timestamp <= timestamp and \
+                self.ephemeris.end_timestamp - timestamp > 24 * 3600:
+            return
+        self.ephemeris = EphemerisTable(observer=self.observer, start_timestamp=timestamp - 3600)
+
+    def local_date(self, timestamp: float) -> datetime.date:
+        return datetime.datetime.fromtimestamp(timestamp, tz=self.timezone).date()
+
+    def human_moon(self, timestamp: float):
+        target_date_local = self.local_date(timestamp)
+        next_full = self.local_date(self.ephemeris.next_phase('full', timestamp))
+        next_new = self.local_date(self.ephemeris.next_phase('new', timestamp))
+        next_last_quarter = self.local_date(self.ephemeris.next_phase('last_quarter', timestamp))
+        next_first_quarter = self.local_date(self.ephemeris.next_phase('first_quarter', timestamp))
+        previous_full = self.local_date(self.ephemeris.previous_phase('full', timestamp))
+        previous_new = self.local_date(self.ephemeris.previous_phase('new', timestamp))
+        previous_last_quarter = self.local_date(self.ephemeris.previous_phase('last_quarter', timestamp))
+        previous_first_quarter = self.local_date(self.ephemeris.previous_phase('first_quarter', timestamp))
 
         waxing, waning = 'Waxing', 'Waning'
         if self.observer.lat < 0:
@@ -85,52 +100,41 @@ class SunAndMoon(BaseAlgorithmForecast):
         elif previous_last_quarter < next_new < next_first_quarter < next_full < next_last_quarter:
             return waning + ' Crescent'
 
-    def moon_emoji(self):
-        human_readable_moon_phase = self.human_moon()
-        return moon_phase_emoji_map[human_readable_moon_phase]
-
-    def localtime_from_ephem_date(self, date: ephem.Date):
-        utc_date_string = date.datetime().isoformat() + '+00:00'
-        utc_datetime = datetime.datetime.fromisoformat(utc_date_string)
-        return utc_datetime.astimezone(self.timezone).time()
+    def localtime_from_timestamp(self, timestamp: Optional[float]) -> datetime.time:
+        if timestamp is None:
+            # no such event in the ephemeris table, e.g. sun never sets
+            return datetime.time()
+        return datetime.datetime.fromtimestamp(timestamp, tz=self.timezone).time()
 
     def update_forecast(self):
         super().update_forecast()
 
-        dt = datetime.datetime.now(tz=self.timezone)
-        sun = ephem.Sun()
-
-        self.observer.date = dt
-        self.observer.horizon = '-0.34'
-        sun.compute(self.observer)
-        sun_altitude = sun.alt  # type: ephem.Angle
+        timestamp = time.time()
+        self.maybe_rebuild_ephemeris(timestamp)
+        ephemeris = self.ephemeris
 
-        sunrise = self.localtime_from_ephem_date(self.observer.next_rising(sun))
-        sunset = self.localtime_from_ephem_date(self.observer.next_setting(sun))
+        sun_altitude, _ = ephemeris.sun_position(timestamp)
+        sunrise = self.localtime_from_timestamp(ephemeris.next_event('sunrise', timestamp))
+        sunset = self.localtime_from_timestamp(ephemeris.next_event('sunset', timestamp))
 
         # astro twilight
-        self.observer.horizon = '-18'
-        astro_twilight_end = self.localtime_from_ephem_date(self.observer.next_rising(sun, use_center=True))
-        astro_twilight_start = self.localtime_from_ephem_date(self.observer.next_setting(sun, use_center=True))
-
-        self.observer.horizon = '-0.34'
-
-        moon = ephem.Moon()
-        moon.compute(self.observer)
-        moon_altitude = moon.alt
-        moon_azimuth = moon.az
-        moonrise = self.localtime_from_ephem_date(self.observer.next_rising(moon))
-        moonset = self.localtime_from_ephem_date(self.observer.next_setting(moon))
-        moon_phase_string = self.human_moon()
-        moon_phase_emoji = self.moon_emoji()
-
-        self.forecast = SunAndMoonDataPoint(sun_altitude=sun_altitude * 180 / math.pi,
+        astro_twilight_end = self.localtime_from_timestamp(ephemeris.next_event('astro_twilight_end', timestamp))
+        astro_twilight_start = self.localtime_from_timestamp(ephemeris.next_event('astro_twilight_start', timestamp))
+
+        moon_altitude, moon_azimuth = ephemeris.moon_position(timestamp)
+        moonrise = self.localtime_from_timestamp(ephemeris.next_event('moonrise', timestamp))
+        moonset = self.localtime_from_timestamp(ephemeris.next_event('moonset', timestamp))
+        moon_phase_string = self.human_moon(timestamp)
+        moon_phase_emoji = moon_phase_emoji_map[moon_phase_string]
+
+        self.forecast = SunAndMoonDataPoint(sun_altitude=sun_altitude,
                                             sunrise_localtime=sunrise, sunset_localtime=sunset,
                                             astro_twilight_start_localtime=astro_twilight_start,
                                             astro_twilight_end_localtime=astro_twilight_end,
-                                            moon_altitude=moon_altitude * 180 / math.pi,
-                                            moon_azimuth=moon_azimuth * 180 / math.pi,
-                                            moon_phase=moon.moon_phase, moon_phase_string=moon_phase_string,
+                                            moon_altitude=moon_altitude,
+                                            moon_azimuth=moon_azimuth,
+                                            moon_phase=ephemeris.moon_illumination(timestamp),
+                                            moon_phase_string=moon_phase_string,
                                             moon_phase_emoji=moon_phase_emoji,
                                             moonset_localtime=moonset, moonrise_localtime=moonrise)
 
@@ -0,0 +1,298 @@
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from astropy.io import fits
+
+from console import main_console
+
+# Background is estimated on tiles of this size, in binned pixels
+BACKGROUND_TILE_SIZE = 32
+# Offsets of the 8 neighbours of a pixel
+NEIGHBOUR_OFFSETS = [(dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx]
+
+
+@dataclass
+class FrameQuality:
+    """Quality metrics of one frame. Sizes are in pixels of the frame, medians over all measured stars."""
+    file_path: str = ''
+    object_name: str = ''
+    filter_name: str = ''
+    exposure_time: float = 0
+    date_obs: str = ''
+    star_count: int = 0  # stars detected
+    measured_star_count: int = 0  # unsaturated stars the sizes are measured on
+    hfd: float = 0
+    fwhm: float = 0
+    eccentricity: float = 0
+    background: float = 0  # median background in ADU
+    noise: float = 0  # background noise in ADU
+
+
+def scaled(raw: np.ndarray, bzero: float, bscale: float) -> np.ndarray:
+    return raw.astype(np.float32) * np.float32(bscale) + np.float32(bzero)
+
+
+def bin2x2(raw: np.ndarray, bzero: float, bscale: float) -> np.ndarray:
+    """Mean of 2x2 cells, read straight from the memory map. For color frames these are bayer superpixels."""
+    height = raw.shape[0] // 2 * 2
+    width = raw.shape[1] // 2 * 2
+    binned = scaled(raw[0:height:2, 0:width:2], bzero, bscale)
+    binned += scaled(raw[1:height:2, 0:width:2], bzero, bscale)
+    binned += scaled(raw[0:height:2, 1:width:2], bzero, bscale)
+    binned += scaled(raw[1:height:2, 1:width:2], bzero, bscale)
+    return binned / 4
+
+
+def estimate_background(image: np.ndarray) -> Tuple[np.ndarray, float]:
+    """
+    :return: Background map of the same shape as the image, from medians of tiles, and the background noise.
+    """
+    # Every other pixel is plenty for medians of tiles, and four times cheaper
+    sample_step = 2
+    tile = BACKGROUND_TILE_SIZE // sample_step
+    sample = image[::sample_step, ::sample_step]
+    rows = max(sample.shape[0] // tile, 1)
+    columns = max(sample.shape[1] // tile, 1)
+    cropped = sample[:rows * tile, :columns * tile]
+    tiles = cropped.reshape(rows, cropped.shape[0] // rows, columns, cropped.shape[1] // columns)
+    grid = np.median(tiles.transpose(0, 2, 1, 3).reshape(rows, columns, -1), axis=2)
+
+    background = np.repeat(np.repeat(grid, BACKGROUND_TILE_SIZE, axis=0), BACKGROUND_TILE_SIZE, axis=1)
+    pad_height = max(image.shape[0] - background.shape[0], 0)
+    pad_width = max(image.shape[1] - background.shape[1], 0)
+    background = np.pad(background, ((0, pad_height), (0, pad_width)), mode='edge')[:image.shape[0], :image.shape[1]]
+
+    residual = cropped - np.repeat(np.repeat(grid, tile, axis=0), tile, axis=1)
+    noise = float(np.median(np.abs(residual)) * 1.4826)
+    return background, max(noise, 1e-6)
+
+
+def detect_stars(residual: np.ndarray, noise: float, detection_sigma: float, margin: int) -> np.ndarray:
+    """
+    Local maxima of the 3x3 smoothed, background subtracted image above the threshold.
+    :return: (y, x) of the stars, brightest first.
+    """
+    height, width = residual.shape
+    smoothed = np.zeros((height - 2, width - 2), dtype=np.float32)
+    for dy in range(3):
+        for dx in range(3):
+            smoothed += residual[dy:dy + height - 2, dx:dx + width - 2]
+    smoothed /= 9
+
+    # Noise of a mean of 9 pixels is a third of the noise of one pixel
+    center = smoothed[1:-1, 1:-1]
+    is_peak = center > detection_sigma * noise / 3
+    for dy, dx in NEIGHBOUR_OFFSETS:
+        is_peak &= center >= smoothed[1 + dy:smoothed.shape[0] - 1 + dy, 1 + dx:smoothed.shape[1] - 1 + dx]
+    ys, xs = np.nonzero(is_peak)
+    # Back to coordinates of the residual image, skip stars too close to the edges to be measured
+    ys += 2
+    xs += 2
+    inside = (ys >= margin) & (ys < height - margin) & (xs >= margin) & (xs < width - margin)
+    ys, xs = ys[inside], xs[inside]
+    order = np.argsort(-center[ys - 2, xs - 2], kind='stable')
+    return np.stack([ys[order], xs[order]], axis=1)
+
+
+def measure_stars(stamps: np.ndarray, radius: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Measure all stars at once.
+    :param stamps: (star, 2 * radius + 1, 2 * radius + 1) cutouts centered on the stars.
+    :return: HFD, FWHM and eccentricity of each star.
+    """
+    size = 2 * radius + 1
+    offsets = np.arange(size, dtype=np.float32) - radius
+    grid_y, grid_x = np.meshgrid(offsets, offsets, indexing='ij')
+
+    # Local background from the ring at the edge of the stamps
+    ring = np.hypot(grid_y, grid_x) >= radius - 1.5
+    local_background = np.median(stamps[:, ring], axis=1)
+    flux = np.clip(stamps - local_background[:, np.newaxis, np.newaxis], 0, None)
+
+    total = flux.sum(axis=(1, 2))
+    total[total == 0] = 1
+    center_y = (flux * grid_y).sum(axis=(1, 2)) / total
+    center_x = (flux * grid_x).sum(axis=(1, 2)) / total
+    dy = grid_y[np.newaxis] - center_y[:, np.newaxis, np.newaxis]
+    dx = grid_x[np.newaxis] - center_x[:, np.newaxis, np.newaxis]
+    distance = np.hypot(dy, dx)
+
+    # HFD as 2 * flux weighted mean distance to the centroid, within the aperture
+    aperture_flux = np.where(distance <= radius, flux, 0)
+    aperture_total = aperture_flux.sum(axis=(1, 2))
+    aperture_total[aperture_total == 0] = 1
+    hfd = 2 * (aperture_flux * distance).sum(axis=(1, 2)) / aperture_total
+
+    # FWHM from the area above half maximum
+    peak = flux.max(axis=(1, 2))[:, np.newaxis, np.newaxis]
+    fwhm = 2 * np.sqrt((flux >= peak / 2).sum(axis=(1, 2)) / np.pi)
+    # Shape from the second moments of the core, which has enough pixels to not depend on where the center falls
+    # within a pixel, while the noisy wings are left out
+    weights = np.clip(flux - peak / 10, 0, None)
+    weight_total = weights.sum(axis=(1, 2))
+    weight_total[weight_total == 0] = 1
+    moment_yy = (weights * dy * dy).sum(axis=(1, 2)) / weight_total
+    moment_xx = (weights * dx * dx).sum(axis=(1, 2)) / weight_total
+    moment_xy = (weights * dx * dy).sum(axis=(1, 2)) / weight_total
+    half_trace = (moment_xx + moment_yy) / 2
+    spread = np.sqrt(((moment_xx - moment_yy) / 2) ** 2 + moment_xy ** 2)
+    major = half_trace + spread
+    minor = np.clip(half_trace - spread, 0, None)
+    major[major == 0] = 1
+    eccentricity = np.sqrt(1 - minor / major)
+    return hfd, fwhm, eccentricity
+
+
+def analyze_frame(file_path: str, max_stars: int = 300, detection_sigma: float = 5.0,
+                  star_radius: int = 12) -> Optional[FrameQuality]:
+    """
+    Detect stars of a fits frame and measure their sizes. Stars are detected on a 2x2 binned image, mono frames are
+    then measured on full resolution cutouts read from the memory map, color frames on bayer superpixels.
+    It's a plain function so it can run in worker processes.
+    :param max_stars: Sizes are measured on up to this many of the brightest unsaturated stars.
+    :param star_radius: Radius of the aperture in pixels of the frame.
+    :return: Quality of the frame, or None if it isn't a 2D image.
+    """
+    with fits.open(file_path, memmap=True, do_not_scale_image_data=True) as hdu_list:
+        header = hdu_list[0].header
+        raw = hdu_list[0].data
+        if raw is None or raw.ndim != 2:
+            return None
+        bzero = header.get('BZERO', 0)
+        bscale = header.get('BSCALE', 1)
+        is_color = bool(str(header.get('BAYERPAT', '')).strip())
+        saturation = header.get('SATURATE', {8: 255, 16: 65535}.get(header['BITPIX'], np.inf))
+
+        quality = FrameQuality(file_path=file_path, object_name=header.get('OBJECT', ''),
+                               filter_name=header.get('FILTER', ''),
+                               exposure_time=header.get('EXPOSURE', header.get('EXPTIME', 0)),
+                               date_obs=header.get('DATE-OBS', ''))
+
+        binned = bin2x2(raw, bzero, bscale)
+        background, noise = estimate_background(binned)
+        quality.background = float(np.median(background))
+        quality.noise = noise
+
+        # Color frames are measured on superpixels, one binned pixel is 2 pixels of the frame
+        binned_radius = (star_radius + 1) // 2
+        stars = detect_stars(binned - background, noise, detection_sigma,
+                             margin=binned_radius + 1)
+        quality.star_count = int(len(stars))
+        if not len(stars):
+            return quality
+
+        size = 2 * binned_radius + 1 if is_color else 2 * star_radius + 1
+        offsets = np.arange(size) - size // 2
+        if is_color:
+            source = binned
+            centers = stars
+            scale = 2
+        else:
+            source = raw
+            # The brightest of the 4 pixels of a binned peak doesn't matter, the centroid is measured anyway
+            centers = stars * 2
+            scale = 1
+        # Candidates are gathered in chunks, most frames have far more faint stars than needed
+        stamps_list = list()
+        for start in range(0, len(centers), max_stars):
+            chunk = centers[start:start + max_stars]
+            rows = chunk[:, 0, np.newaxis, np.newaxis] + offsets[np.newaxis, :, np.newaxis]
+            columns = chunk[:, 1, np.newaxis, np.newaxis] + offsets[np.newaxis, np.newaxis, :]
+            chunk_stamps = source[rows, columns]
+            if not is_color:
+                chunk_stamps = scaled(chunk_stamps, bzero, bscale)
+            unsaturated = chunk_stamps.max(axis=(1, 2)) < saturation * 0.95
+            stamps_list.append(chunk_stamps[unsaturated])
+            if sum(len(stamps) for stamps in stamps_list) >= max_stars:
+                break
+        stamps = np.concatenate(stamps_list)[:max_stars]
+
+    quality.measured_star_count = int(len(stamps))
+    if not len(stamps):
+        return quality
+    hfd, fwhm, eccentricity = measure_stars(stamps.astype(np.float32), size // 2)
+    quality.hfd = float(np.median(hfd)) * scale
+    quality.fwhm = float(np.median(fwhm)) * scale
+    quality.eccentricity = float(np.median(eccentricity))
+    return quality
+
+
+class ImageAnalyzer:
+    """Runs analyze_frame on a pool of worker processes, so measuring a frame never blocks event handling."""
+
+    def __init__(self, worker_count: int = 2):
+        self.executor = ProcessPoolExecutor(max_workers=worker_count)
+
+    def submit(self, file_path: str, callback: Callable[[FrameQuality], None]):
+        """
+        Analyze the frame in background, 'callback' is called with the result from a thread of the pool.
+        Nothing is called if the frame can't be analyzed.
+        """
+        future = self.executor.submit(analyze_frame, file_path)
+
+        def on_done(done_future: Future):
+            try:
+                quality = done_future.result()
+                if quality:
+                    callback(quality)
+            except Exception:
+                main_console.print(f'Failed to analyze {file_path}')
+                main_console.print_exception()
+
+        future.add_done_callback(on_done)
+
+
+if __name__ == '__main__':
+    import glob
+    import sys
+    import tempfile
+    import time
+    from concurrent.futures import as_completed
+
+    if len(sys.argv) > 1:
+        # Analyze every fits file of a folder, like frames of previous nights, and save the results to the database
+        from utils.database.sequence_database_manager import SequenceDatabaseManager
+
+        database_manager = SequenceDatabaseManager(database_filename=sys.argv[2] if len(sys.argv) > 2
+                                                   else 'data/sequence.db')
+        file_paths = [path for path in glob.glob(os.path.join(sys.argv[1], '**', '*.*'), recursive=True)
+                      if path.upper().endswith(('.FIT', '.FITS'))]
+        start = time.perf_counter()
+        with ProcessPoolExecutor() as executor:
+            futures = {executor.submit(analyze_frame, path): path for path in file_paths}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as exception:
+                    print(f'Failed to analyze {futures[future]}: {exception}')
+                    continue
+                if result:
+                    database_manager.add_frame_quality(result)
+                    print(f'{result.file_path}: HFD {result.hfd:.2f} FWHM {result.fwhm:.2f} '
+                          f'e {result.eccentricity:.2f} stars {result.star_count}')
+        print(f'{len(file_paths)} frames analyzed in {time.perf_counter() - start:.1f}s')
+        sys.exit()
+
+    # Synthetic 60MP frame with gaussian stars of known size
+    rng = np.random.default_rng(0)
+    height, width, sigma = 6388, 9576, 1.5
+    frame = rng.normal(1000, 20, size=(height, width)).astype(np.float32)
+    star_size = 15
+    offsets = np.arange(star_size) - star_size // 2
+    for _ in range(2000):
+        y, x = rng.integers(20, height - 20), rng.integers(20, width - 20)
+        amplitude = rng.uniform(300, 20000)
+        frame[y - 7:y + 8, x - 7:x + 8] += amplitude * np.exp(
+            -(offsets[:, np.newaxis] ** 2 + (offsets[np.newaxis, :] / 1.2) ** 2) / (2 * sigma ** 2))
+    file_path = os.path.join(tempfile.mkdtemp(), 'synthetic.fit')
+    fits.PrimaryHDU(data=np.clip(frame, 0, 65535).astype(np.uint16)).writeto(file_path)
+    del frame
+
+    start = time.perf_counter()
+    result = analyze_frame(file_path)
+    print(f'analyzed in {time.perf_counter() - start:.2f}s: {result}')
+    expected_fwhm = 2.3548 * sigma * np.sqrt(1.2)
+    print(f'expected FWHM about {expected_fwhm:.2f}, eccentricity {np.sqrt(1 - 1 / 1.2 ** 2):.2f}')
@@ -0,0 +1,61 @@
+import time
+from typing import Tuple
+
+import psutil
+
+MEGA_BYTES = 1024 * 1024
+
+
+class ProcessMemorySampler:
+    """
+    Samples memory usages of the bot itself and of another process (Voyager) running on the same computer.
+
+    The other process is looked up by name only when it's unknown or has disappeared, instead of walking through every
+    process of the host for each sample. When the process is not running, lookups are rate limited as well.
+    """
+
+    def __init__(self, process_name: str = 'Voyager2.exe', lookup_interval_sec: float = 60):
+        self.process_name = process_name
+        self.lookup_interval_sec = lookup_interval_sec
+        self.own_process = psutil.Process()
+        self.target_process = None  # type: psutil.Process
+        self.last_lookup_time = None  # monotonic timestamp of last lookup
+
+    def find_target_process(self) -> psutil.Process or None:
+        self.last_lookup_time = time.monotonic()
+        for process in psutil.process_iter(attrs=['name']):
+            if process.info['name'] == self.process_name:
+                return process
+        return None
+
+    def maybe_find_target_process(self) -> psutil.Process or None:
+        if self.target_process is not None and self.target_process.is_running():
+            return self.target_process
+
+        self.target_process = None
+        if self.last_lookup_time is None or time.monotonic() - self.last_lookup_time >= self.lookup_interval_sec:
+            self.target_process = self.find_target_process()
+        return self.target_process
+
+    def sample_target(self) -> Tuple[float, float]:
+        """
+        :return: A pair of virtual and physical memory used by the target process in mega bytes. (0, 0) if not found.
+        """
+        process = self.maybe_find_target_process()
+        if process is None:
+            return 0, 0
+        try:
+            memory_info = process.memory_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            # Look it up again next time.
+            self.target_process = None
+            self.last_lookup_time = None
+            return 0, 0
+        return memory_info.vms / MEGA_BYTES, memory_info.rss / MEGA_BYTES
+
+    def sample_self(self) -> Tuple[float, float]:
+        """
+        :return: A pair of virtual and physical memory used by the bot in mega bytes.
+        """
+        memory_info = self.own_process.memory_info()
+        return memory_info.vms / MEGA_BYTES, memory_info.rss / MEGA_BYTES
@@ -1,7 +1,13 @@
+import csv
+import io
 import os
+import re
 from collections import OrderedDict
+from typing import List
+from xml.sax.saxutils import XMLGenerator, escape
 
 import xmltodict
+import yaml
 
 ITEM_LOCATOR = {
     'TARGET_ARRAY': 'ref-3',
@@ -16,52 +22,59 @@ ITEM_LOCATOR = {
 
 A3_SCHEMA = 'http://schemas.microsoft.com/clr/nsassem/Voyager2/Voyager2%2C%20Version%3D1.0.0.0%2C%20Culture%3Dneutral%2C%20PublicKeyToken%3Dnull'
 START_IDX = 150
-
-
-# Personalized dict2xml parser since dicttoxml cannot parse xmltodict object
-def dict2xml(d, root_node=None):
-    wrap = False if None == root_node or isinstance(d, list) else True
-    root = 'objects' if None == root_node else root_node
-    root_singular = root[:-1] if 's' == root[-1] and None == root_node else root
-    xml = ''
-    attr = ''
-    children = []
-
-    if isinstance(d, dict):
-        for key, value in dict.items(d):
-            if isinstance(value, dict):
-                children.append(dict2xml(value, key))
-            elif isinstance(value, list):
-                children.append(dict2xml(value, key))
-            elif key[0] == '@':
-                # attributes
-                attr = attr + ' ' + key[1::] + '="' + str(value) + '"'
-            elif key == '#text':
-                # text
-                xml = str(value)
-                children.append(xml)
-            else:
-                xml = '<' + key + ">" + str(value) + '</' + key + '>'
-                children.append(xml)
-
-    else:
-        # if list
-        for value in d:
-            children.append(dict2xml(value, root_singular))
-
-    end_tag = '>' if 0 < len(children) else '/>'
-
-    if wrap or isinstance(d, dict):
-        xml = '<' + root + attr + end_tag
-
-    if 0 < len(children):
-        for child in children:
-            xml = xml + child
-
-        if wrap or isinstance(d, dict):
-            xml = xml + '</' + root + '>'
-
-    return xml
+# Marks where values of a compiled template go, it can't appear in any xml document
+SLOT_MARK = '\x00'
+
+
+class TemplateSlot(str):
+    """
+    Placeholder of a value filled in when a compiled sequence template is rendered. Written by write_xml in place
+    of the element it replaces, or as the text when it's the '#text' of an element.
+    """
+
+    def __str__(self):
+        return SLOT_MARK + self + SLOT_MARK
+
+
+def write_xml(generator: XMLGenerator, name: str, value) -> None:
+    """
+    Writes a xmltodict object as an element through the generator, children are streamed as they are visited.
+    Lists are repeated elements of the same name, '@' keys are attributes and '#text' is the text content.
+    """
+    if isinstance(value, TemplateSlot):
+        generator.characters(str(value))
+        return
+
+    if isinstance(value, list):
+        for item in value:
+            write_xml(generator, name, item)
+        return
+
+    if isinstance(value, dict):
+        generator.startElement(name, {key[1:]: str(child) for key, child in value.items() if key[0] == '@'})
+        for key, child in value.items():
+            if key == '#text':
+                generator.characters(str(child))
+            elif key[0] != '@':
+                write_xml(generator, key, child)
+        generator.endElement(name)
+        return
+
+    generator.startElement(name, {})
+    if value is not None:
+        generator.characters(str(value))
+    generator.endElement(name)
+
+
+def dict2xml(d) -> str:
+    """
+    Serializes a xmltodict object, like the parsed sequence, to a string.
+    """
+    output = io.StringIO()
+    generator = XMLGenerator(output, short_empty_elements=True)
+    for key, value in d.items():
+        write_xml(generator, key, value)
+    return output.getvalue()
 
 
 class GainOffset:
@@ -100,7 +113,47 @@ class VoyagerSequenceGenerator:
 
         self.base_seq_path = base_seq_path
         self.target = None
-        self.sequence_obj = None
+        self.sequence_xml = None
+        # The template is parsed and serialized only once, generating a sequence fills in the slots
+        self.template_chunks = self.compile_template()
+
+    def compile_template(self) -> List[str]:
+        """
+        Serializes the base sequence with slots in place of the target and its image slots.
+        :return: Static xml chunks and slot names, alternating: chunk, slot name, chunk, ..., chunk.
+        """
+        with open(self.base_seq_path, 'r') as base_sequence_f:
+            sequence_content = xmltodict.parse(base_sequence_f.read())
+
+        body = sequence_content['SOAP-ENV:Envelope']['SOAP-ENV:Body']
+        slot_items = {
+            ITEM_LOCATOR['TARGET_NAME']: TemplateSlot('TARGET_NAME'),
+            ITEM_LOCATOR['TARGET_RA']: TemplateSlot('TARGET_RA'),
+            ITEM_LOCATOR['TARGET_DEC']: TemplateSlot('TARGET_DEC'),
+        }
+        for array_obj in body['SOAP-ENC:Array']:
+            if array_obj.get('@id') == ITEM_LOCATOR['TARGET_ARRAY']:
+                # Object that contains target information
+                for item in array_obj['item']:
+                    if item.get('@id') in slot_items:
+                        item['#text'] = slot_items[item['@id']]
+            if array_obj.get('@id') == ITEM_LOCATOR['GAIN_OFFSET_ARRAY']:
+                # Object that contains gain/offset reference
+                array_obj['item'] = TemplateSlot('GAIN_OFFSET_REFERENCES')
+            if array_obj.get('@id') == ITEM_LOCATOR['IMAGE_SLOT_ARRAY']:
+                # Object that contains image slots reference
+                array_obj['item'] = TemplateSlot('IMAGE_SLOT_REFERENCES')
+
+        # Reference array lists
+        for a1_array_obj in body['a1:ArrayList']:
+            if a1_array_obj.get('@id') in (ITEM_LOCATOR['GAIN_OFFSET_ARRAY_LIST'],
+                                           ITEM_LOCATOR['IMAGE_SLOT_ARRAY_LIST']):
+                a1_array_obj['_size'] = {'#text': TemplateSlot('SLOT_COUNT')}
+
+        body['a3:SequenzaElementoGainOffset'] = TemplateSlot('GAIN_OFFSETS')
+        body['a3:SequenzaElemento'] = TemplateSlot('IMAGE_SLOTS')
+
+        return dict2xml(sequence_content).split(SLOT_MARK)
 
     def set_target(self, target: AstroTarget or None):
         if target is None:
@@ -112,109 +165,122 @@ class VoyagerSequenceGenerator:
         if self.target is None:
             return
 
-        sequence_content = None
-        with open(self.base_seq_path, 'r') as base_sequence_f:
-            base_sequence_content = base_sequence_f.read()
-            sequence_content = xmltodict.parse(base_sequence_content)
-
-        if sequence_content is None:
-            return
-
-        ref_idx = START_IDX
-        array_objs = sequence_content['SOAP-ENV:Envelope']['SOAP-ENV:Body']['SOAP-ENC:Array']
-        for array_obj in array_objs:
-            if '@id' in array_obj:
-                if array_obj['@id'] == ITEM_LOCATOR['TARGET_ARRAY']:
-                    # Object that contains target information
-                    for item in array_obj['item']:
-                        if '@id' in item:
-                            if item['@id'] == ITEM_LOCATOR['TARGET_NAME']:
-                                item['#text'] = self.target.name
-                            if item['@id'] == ITEM_LOCATOR['TARGET_RA']:
-                                item['#text'] = self.target.ra
-                            if item['@id'] == ITEM_LOCATOR['TARGET_DEC']:
-                                item['#text'] = self.target.dec
-
-                if array_obj['@id'] == ITEM_LOCATOR['GAIN_OFFSET_ARRAY']:
-                    # Object that contains gain/offset reference
-                    gain_offset_list = list()
-
-                    for _ in range(self.target.slot_counter):
-                        ref_idx_str = '#ref-{}'.format(ref_idx)
-                        ref_dict = OrderedDict([('@href', ref_idx_str)])
-                        gain_offset_list.append(ref_dict)
-                        ref_idx += 1
-
-                    array_obj['item'] = gain_offset_list
-
-                if array_obj['@id'] == ITEM_LOCATOR['IMAGE_SLOT_ARRAY']:
-                    # Object that contains image slots reference
-                    image_slots_list = list()
-
-                    for _ in range(self.target.slot_counter):
-                        ref_idx_str = '#ref-{}'.format(ref_idx)
-                        ref_dict = OrderedDict([('@href', ref_idx_str)])
-                        image_slots_list.append(ref_dict)
-                        ref_idx += 1
-
-                    array_obj['item'] = image_slots_list
-
-        # Reference array lists
-        a1_array_objs = sequence_content['SOAP-ENV:Envelope']['SOAP-ENV:Body']['a1:ArrayList']
-        for a1_array_obj in a1_array_objs:
-            if '@id' in a1_array_obj:
-                if a1_array_obj['@id'] == ITEM_LOCATOR['GAIN_OFFSET_ARRAY_LIST'] or \
-                        a1_array_obj['@id'] == ITEM_LOCATOR['IMAGE_SLOT_ARRAY_LIST']:
-                    a1_array_obj['_size'] = self.target.slot_counter
-
-        ref_idx = START_IDX
-        gain_offset_list = list()
-        image_slots_list = list()
+        slot_count = self.target.slot_counter
+        gain_offset_references = list()
+        image_slot_references = list()
+        gain_offsets = list()
+        image_slots = list()
         for idx, image_slot in enumerate(self.target.image_slots):
+            gain_offset_ref = 'ref-{}'.format(START_IDX + idx)
+            image_slot_ref = 'ref-{}'.format(START_IDX + idx + slot_count)
+            gain_offset_references.append(OrderedDict([('@href', '#' + gain_offset_ref)]))
+            image_slot_references.append(OrderedDict([('@href', '#' + image_slot_ref)]))
             # Add gain/offset item
-            ref_idx_str = 'ref-{}'.format(ref_idx + idx)
-            gain_offset_obj = OrderedDict([('@id', ref_idx_str),
-                                           ('@xmlns:a3', A3_SCHEMA),
-                                           ('SlotNumber', idx + 1),
-                                           ('Gain', image_slot.gain_offset.gain),
-                                           ('Offset', image_slot.gain_offset.offset)])
-            gain_offset_list.append(gain_offset_obj)
+            gain_offsets.append(OrderedDict([('@id', gain_offset_ref),
+                                             ('@xmlns:a3', A3_SCHEMA),
+                                             ('SlotNumber', idx + 1),
+                                             ('Gain', image_slot.gain_offset.gain),
+                                             ('Offset', image_slot.gain_offset.offset)]))
             # Add image slot
-            ref_idx_str = 'ref-{}'.format(ref_idx + idx + self.target.slot_counter)
-            image_slot_obj = OrderedDict([('@id', ref_idx_str),
-                                          ('@xmlns:a3', A3_SCHEMA),
-                                          ('mTipoEsposizione', 0),
-                                          ('mFiltroIndice', image_slot.filter_idx),
-                                          ('mFiltroLabel', OrderedDict([('@href', '#ref-140')])),
-                                          ('mEsposizioneSecondi', image_slot.exposure),
-                                          ('mBinning', image_slot.binning),
-                                          ('mNumero', image_slot.count),
-                                          ('mSpeedIndice', 0),
-                                          ('mReadoutIndice', 0),
-                                          ('mPlanningHelpElaborate', 0),
-                                          ('mEseguite', 0),
-                                          ('mStatisticheSub', OrderedDict([('@xsi:null', '1')])),
-                                          ('mLastInsNum', 0)])
-            image_slots_list.append(image_slot_obj)
-
-        sequence_content['SOAP-ENV:Envelope']['SOAP-ENV:Body']['a3:SequenzaElementoGainOffset'] = gain_offset_list
-        sequence_content['SOAP-ENV:Envelope']['SOAP-ENV:Body']['a3:SequenzaElemento'] = image_slots_list
-
-        self.sequence_obj = sequence_content
+            image_slots.append(OrderedDict([('@id', image_slot_ref),
+                                            ('@xmlns:a3', A3_SCHEMA),
+                                            ('mTipoEsposizione', 0),
+                                            ('mFiltroIndice', image_slot.filter_idx),
+                                            ('mFiltroLabel', OrderedDict([('@href', '#ref-140')])),
+                                            ('mEsposizioneSecondi', image_slot.exposure),
+                                            ('mBinning', image_slot.binning),
+                                            ('mNumero', image_slot.count),
+                                            ('mSpeedIndice', 0),
+                                            ('mReadoutIndice', 0),
+                                            ('mPlanningHelpElaborate', 0),
+                                            ('mEseguite', 0),
+                                            ('mStatisticheSub', OrderedDict([('@xsi:null', '1')])),
+                                            ('mLastInsNum', 0)]))
+
+        slot_values = {
+            'TARGET_NAME': escape(self.target.name),
+            'TARGET_RA': escape(self.target.ra),
+            'TARGET_DEC': escape(self.target.dec),
+            'SLOT_COUNT': str(slot_count),
+            'GAIN_OFFSET_REFERENCES': dict2xml({'item': gain_offset_references}),
+            'IMAGE_SLOT_REFERENCES': dict2xml({'item': image_slot_references}),
+            'GAIN_OFFSETS': dict2xml({'a3:SequenzaElementoGainOffset': gain_offsets}),
+            'IMAGE_SLOTS': dict2xml({'a3:SequenzaElemento': image_slots}),
+        }
+        # Odd chunks are slot names
+        self.sequence_xml = ''.join(slot_values[chunk] if i % 2 else chunk
+                                    for i, chunk in enumerate(self.template_chunks))
 
     def generate_seq_with_target(self, target: AstroTarget or None):
         self.set_target(target=target)
         self.generate_seq()
 
     def write_seq_to_file(self, file_path: str = ''):
-        print(self.sequence_obj)
-        with open(file_path, 'w') as output_f:
-            xml_obj = dict2xml(self.sequence_obj)[9:-10]
-            output_f.write(xml_obj)
-        pass
+        if self.sequence_xml is None:
+            return
+
+        with open(file_path, 'w', encoding='utf-8') as output_f:
+            output_f.write(self.sequence_xml)
+
+    def generate_batch(self, targets: List[AstroTarget], output_folder: str) -> List[str]:
+        """
+        Generates one sequence file per target, named after the target.
+        :return: Paths of the generated files.
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        file_paths = list()
+        for target in targets:
+            self.generate_seq_with_target(target=target)
+            file_path = os.path.join(output_folder, re.sub(r'[^\w\-. ]', '_', target.name) + '.s2q')
+            self.write_seq_to_file(file_path=file_path)
+            file_paths.append(file_path)
+        return file_paths
+
+
+def load_targets(file_path: str) -> List[AstroTarget]:
+    """
+    Reads a target list from a csv or yaml file.
+    CSV files have one image slot per row, with columns target_name, ra, dec, exposure, binning, count, filter_idx,
+    gain and offset. Consecutive rows of the same target_name make the slots of that target.
+    YAML files are a list of targets, each with target_name, ra, dec and a list of slots with the other keys.
+    """
+    if file_path.lower().endswith(('.yml', '.yaml')):
+        with open(file_path, 'r') as target_f:
+            target_dicts = yaml.safe_load(target_f) or list()
+    else:
+        target_dicts = list()
+        with open(file_path, 'r', newline='') as target_f:
+            for row in csv.DictReader(target_f):
+                if not target_dicts or target_dicts[-1]['target_name'] != row['target_name']:
+                    target_dicts.append({'target_name': row['target_name'], 'ra': row['ra'], 'dec': row['dec'],
+                                         'slots': list()})
+                target_dicts[-1]['slots'].append(row)
+
+    targets = list()
+    for target_dict in target_dicts:
+        target = AstroTarget(target_name=str(target_dict['target_name']), ra=str(target_dict['ra']),
+                             dec=str(target_dict['dec']))
+        for slot in target_dict.get('slots', list()):
+            target.append_slot(ImageSlot(exposure=float(slot.get('exposure', 1.0)),
+                                         binning=int(slot.get('binning', 1)),
+                                         count=int(slot.get('count', 1)),
+                                         filter_idx=int(slot.get('filter_idx', 0)),
+                                         gain_offset=GainOffset(gain=int(slot.get('gain', 0)),
+                                                                offset=int(slot.get('offset', 0)))))
+        targets.append(target)
+    return targets
 
 
 if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) == 4:
+        # python -m utils.seq_generator base.s2q targets.csv output_folder
+        seq_generator = VoyagerSequenceGenerator(base_seq_path=sys.argv[1])
+        for generated_file_path in seq_generator.generate_batch(load_targets(sys.argv[2]), sys.argv[3]):
+            print(generated_file_path)
+        sys.exit(0)
+
     sequence_target = AstroTarget(target_name='M42', ra='05 35 17.300', dec='-05 23 28.00')
     narrowband_gain_offset = GainOffset(gain=100, offset=10)
     wideband_gain_offset = GainOffset(gain=10, offset=10)
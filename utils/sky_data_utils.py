@@ -1,7 +1,8 @@
-import os
 from enum import Enum
 from typing import Dict
 
+from utils.file_watcher import FileWatcher, shared_file_watcher
+
 
 class SkyCondition(Enum):
     # See https://diffractionlimited.com/wp-content/uploads/2016/04/Cloud-SensorII-Users-Manual.pdf on pp.45(V0029)
@@ -57,7 +58,7 @@ class AlertCondition(Enum):
     UNSAFE = 1
 
 
-def get_weather_conditions(file_path: str = '') -> Dict[SkyCondition, int]:
+def default_weather_conditions() -> Dict[SkyCondition, int]:
     sky_conditions = dict()
 
     sky_conditions[SkyCondition.CLOUD] = CloudCondition.UNKNOWN.value
@@ -66,40 +67,63 @@ def get_weather_conditions(file_path: str = '') -> Dict[SkyCondition, int]:
     sky_conditions[SkyCondition.DAYLIGHT] = DayCondition.UNKNOWN.value
     sky_conditions[SkyCondition.ROOF] = RoofCondition.NOT_REQUESTED.value
     sky_conditions[SkyCondition.ALERT] = AlertCondition.SAFE.value
+    return sky_conditions
 
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        return sky_conditions
-
-    try:
-        with open(file_path, 'r') as sky_file:
-            conditions = sky_file.readline().rsplit(sep=' ', maxsplit=7)
 
-            if len(conditions) < 7:
-                return sky_conditions
+def parse_weather_conditions(content: str) -> Dict[SkyCondition, int]:
+    """
+    Parse the one line weather data file.
+    :raise ValueError: if the line is incomplete, e.g. the file is being written.
+    """
+    lines = content.splitlines()
+    conditions = lines[0].rsplit(sep=' ', maxsplit=7) if lines else []
+    if len(conditions) < 7:
+        raise ValueError(f'Incomplete weather data: {content}')
 
-            sky_conditions[SkyCondition.CLOUD] = int(conditions[-6])
-            sky_conditions[SkyCondition.WIND] = int(conditions[-5])
-            sky_conditions[SkyCondition.RAIN] = int(conditions[-4])
-            sky_conditions[SkyCondition.DAYLIGHT] = int(conditions[-3])
-            sky_conditions[SkyCondition.ROOF] = int(conditions[-2])
-            sky_conditions[SkyCondition.ALERT] = int(conditions[-1])
-    except PermissionError:
-        pass
+    sky_conditions = dict()
+    sky_conditions[SkyCondition.CLOUD] = int(conditions[-6])
+    sky_conditions[SkyCondition.WIND] = int(conditions[-5])
+    sky_conditions[SkyCondition.RAIN] = int(conditions[-4])
+    sky_conditions[SkyCondition.DAYLIGHT] = int(conditions[-3])
+    sky_conditions[SkyCondition.ROOF] = int(conditions[-2])
+    sky_conditions[SkyCondition.ALERT] = int(conditions[-1])
     return sky_conditions
 
 
+def parse_roof_condition(content: str) -> str:
+    """
+    Parse the roof status file, like '2022-05-24 12:01:05PM Roof Status: CLOSED'.
+    :raise ValueError: if the line is incomplete, e.g. the file is being written.
+    """
+    lines = content.splitlines()
+    conditions = lines[0].rsplit(sep=':', maxsplit=2) if lines else []
+    if len(conditions) < 2 or not conditions[-1].strip():
+        raise ValueError(f'Incomplete roof status: {content}')
+    return conditions[-1].strip()
+
+
+def weather_conditions_watcher(file_path: str) -> FileWatcher[Dict[SkyCondition, int]]:
+    return shared_file_watcher(file_path=file_path, parser=parse_weather_conditions,
+                               default=default_weather_conditions())
+
+
+def roof_condition_watcher(file_path: str) -> FileWatcher[str]:
+    return shared_file_watcher(file_path=file_path, parser=parse_roof_condition, default='UNKNOWN')
+
+
+def get_weather_conditions(file_path: str = '') -> Dict[SkyCondition, int]:
+    """
+    :return: Latest good snapshot of the weather data file, the file is only parsed again when it changes.
+    """
+    if not file_path:
+        return default_weather_conditions()
+    return dict(weather_conditions_watcher(file_path).snapshot())
+
+
 def get_roof_condition(file_path: str = '') -> str:
-    roof_condition = 'UNKNOWN'
-    if not os.path.exists(file_path) or not os.path.isfile(file_path):
-        return roof_condition
-    try:
-        with open(file_path, 'r') as sky_file:
-            conditions = sky_file.readline().rsplit(sep=':', maxsplit=2)
-
-            if len(conditions) < 2:
-                return roof_condition
-
-            roof_condition = conditions[-1].strip()
-    except PermissionError:
-        pass
-    return roof_condition
+    """
+    :return: Latest good snapshot of the roof status file, the file is only parsed again when it changes.
+    """
+    if not file_path:
+        return 'UNKNOWN'
+    return roof_condition_watcher(file_path).snapshot()
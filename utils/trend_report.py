@@ -0,0 +1,318 @@
+#!/bin/env python3
+import argparse
+import glob
+import json
+import math
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import matplotlib
+import numpy as np
+import pytz
+from matplotlib import pyplot as plt
+
+from data_structure.system_status_info import GuideStatusEnum
+from utils.event_probe import probe_event_name
+
+matplotlib.use('agg')
+
+LOG_FILE_PATTERN = '*_voyager_bot_log.txt'
+INTERESTING_EVENTS = {'NewJPGReady', 'ControlData', 'AutoFocusResult', 'LogEvent'}
+OOM_TEXTS = ('insufficient memory', 'outofmemoryexception')
+
+# HFD histograms share fixed bins so partial results of every log file can simply be added up
+HFD_BINS = np.linspace(0, 10, 101)
+
+
+@dataclass
+class TrendSummary:
+    """
+    Aggregates of one or more log files. Everything is kept as sums, counts or short lists, so summaries of
+    different log files are cheap to send between processes and can be merged in any order.
+    """
+    # (target, filter) -> [exposure seconds, frame count]
+    integration: Dict[Tuple[str, str], List[float]] = field(default_factory=dict)
+    # filter -> HFD histogram over HFD_BINS
+    hfd_histograms: Dict[str, np.ndarray] = field(default_factory=dict)
+    # night -> [sample count, sum of squared x error, sum of squared y error]
+    guide_by_night: Dict[str, List[float]] = field(default_factory=dict)
+    # hour (timestamp // 3600) -> [sample count, sum of squared total error]
+    guide_by_hour: Dict[int, List[float]] = field(default_factory=dict)
+    # (timestamp, filter index, position, temperature, hfd) of each successful autofocus
+    focus_results: List[Tuple[float, int, float, float, float]] = field(default_factory=list)
+    oom_timestamps: List[float] = field(default_factory=list)
+    line_count: int = 0
+    file_count: int = 0
+
+    def merge(self, other: 'TrendSummary') -> None:
+        for key, (seconds, count) in other.integration.items():
+            value = self.integration.setdefault(key, [0.0, 0])
+            value[0] += seconds
+            value[1] += count
+        for filter_name, histogram in other.hfd_histograms.items():
+            if filter_name in self.hfd_histograms:
+                self.hfd_histograms[filter_name] = self.hfd_histograms[filter_name] + histogram
+            else:
+                self.hfd_histograms[filter_name] = histogram
+        for buckets, other_buckets in ((self.guide_by_night, other.guide_by_night),
+                                       (self.guide_by_hour, other.guide_by_hour)):
+            for key, sums in other_buckets.items():
+                if key in buckets:
+                    buckets[key] = [a + b for a, b in zip(buckets[key], sums)]
+                else:
+                    buckets[key] = list(sums)
+        self.focus_results.extend(other.focus_results)
+        self.oom_timestamps.extend(other.oom_timestamps)
+        self.line_count += other.line_count
+        self.file_count += other.file_count
+
+
+def night_of(timestamp: float, timezone) -> str:
+    # Nights are named by the date they start, anything before noon belongs to the previous night.
+    return (datetime.fromtimestamp(timestamp, tz=timezone) - timedelta(hours=12)).strftime('%Y-%m-%d')
+
+
+def summarize_log_file(log_filename: str, timezone_name: str = 'UTC') -> TrendSummary:
+    """
+    Stream one log file written by LogWriter, one raw voyager message per line.
+    Only the messages of interesting events are decoded, the rest is skipped after peeking at the event name.
+    """
+    timezone = pytz.timezone(timezone_name)
+    summary = TrendSummary(file_count=1)
+    hfd_values = defaultdict(list)  # type: Dict[str, List[float]]
+    last_guide_error = None
+    night_cache = dict()  # type: Dict[int, str]
+
+    with open(log_filename, 'r', encoding='utf-8', errors='replace') as log_file:
+        for line in log_file:
+            summary.line_count += 1
+            event_name = probe_event_name(line)
+            if event_name not in INTERESTING_EVENTS:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                # Lines can be truncated when the bot was killed
+                continue
+
+            if event_name == 'ControlData':
+                if not message.get('GUIDECONN') or message.get('GUIDESTAT') != GuideStatusEnum.RUNNING:
+                    last_guide_error = None
+                    continue
+                guide_error = (message['GUIDEX'], message['GUIDEY'])
+                # ControlData comes every second, a guide error is repeated until next guide step
+                if guide_error == last_guide_error:
+                    continue
+                last_guide_error = guide_error
+                timestamp = message['Timestamp']
+                hour = int(timestamp // 3600)
+                if hour not in night_cache:
+                    night_cache[hour] = night_of(timestamp, timezone)
+                x_squared = guide_error[0] ** 2
+                y_squared = guide_error[1] ** 2
+                night_sums = summary.guide_by_night.setdefault(night_cache[hour], [0, 0.0, 0.0])
+                night_sums[0] += 1
+                night_sums[1] += x_squared
+                night_sums[2] += y_squared
+                hour_sums = summary.guide_by_hour.setdefault(hour, [0, 0.0])
+                hour_sums[0] += 1
+                hour_sums[1] += x_squared + y_squared
+            elif event_name == 'NewJPGReady':
+                key = (message.get('SequenceTarget') or 'Unknown', message.get('Filter') or 'Unknown')
+                value = summary.integration.setdefault(key, [0.0, 0])
+                value[0] += message.get('Expo', 0)
+                value[1] += 1
+                if message.get('HFD'):
+                    hfd_values[key[1]].append(message['HFD'])
+            elif event_name == 'AutoFocusResult':
+                if message.get('IsEmpty') == 'true' or not message.get('Done'):
+                    continue
+                summary.focus_results.append((message['Timestamp'], message['FilterIndex'], message['Position'],
+                                              message['FocusTemp'], message['HFD']))
+            elif event_name == 'LogEvent':
+                text = message.get('Text', '').lower()
+                if any(oom_text in text for oom_text in OOM_TEXTS):
+                    summary.oom_timestamps.append(message['Timestamp'])
+
+    for filter_name, values in hfd_values.items():
+        summary.hfd_histograms[filter_name] = np.histogram(np.clip(values, HFD_BINS[0], HFD_BINS[-1]),
+                                                           bins=HFD_BINS)[0]
+    return summary
+
+
+def summarize_log_folder(log_folder: str, timezone_name: str = 'UTC', workers: Optional[int] = None) -> TrendSummary:
+    """
+    Summarize every log file under the folder, one log file per worker process.
+    :param workers: Number of worker processes, defaults to the number of CPUs.
+    """
+    log_filenames = glob.glob(os.path.join(log_folder, '**', LOG_FILE_PATTERN), recursive=True)
+    # Biggest files first, so a long night isn't the last one to start
+    log_filenames.sort(key=os.path.getsize, reverse=True)
+
+    summary = TrendSummary()
+    if not log_filenames:
+        return summary
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(summarize_log_file, log_filename, timezone_name): log_filename
+                   for log_filename in log_filenames}
+        for future in as_completed(futures):
+            try:
+                summary.merge(future.result())
+            except Exception as exception:
+                print(f'Failed to summarize {futures[future]}: {exception}')
+    return summary
+
+
+class TrendReportPlotter:
+    def __init__(self, timezone_name: str = 'UTC', max_targets: int = 12):
+        self.timezone = pytz.timezone(timezone_name)
+        self.max_targets = max_targets
+
+        plt.ioff()
+        plt.rcParams.update({'text.color': '#F5F5F5', 'font.size': 16, 'font.weight': 'bold',
+                             'axes.edgecolor': '#F5F5F5', 'axes.labelcolor': '#F5F5F5',
+                             'figure.facecolor': '#212121', 'axes.facecolor': '#212121',
+                             'xtick.color': '#F5F5F5', 'ytick.color': '#F5F5F5'})
+
+    def integration_plot(self, ax, summary: TrendSummary):
+        seconds_by_target = defaultdict(float)
+        for (target, _), (seconds, _) in summary.integration.items():
+            seconds_by_target[target] += seconds
+        targets = sorted(seconds_by_target, key=seconds_by_target.get, reverse=True)[:self.max_targets]
+        filters = sorted({filter_name for target, filter_name in summary.integration if target in targets})
+
+        bottom = np.zeros(len(targets))
+        for filter_name in filters:
+            hours = np.array([summary.integration.get((target, filter_name), [0.0, 0])[0] / 3600
+                              for target in targets])
+            ax.barh(targets, hours, left=bottom, label=filter_name)
+            bottom += hours
+        for i, total in enumerate(bottom):
+            ax.text(total, i, f' {total:.1f}h', va='center')
+        ax.invert_yaxis()
+        ax.set_xlabel('Integration (hours)')
+        ax.set_title('Integration by Target and Filter')
+        if filters:
+            ax.legend(loc='lower right')
+
+    @staticmethod
+    def hfd_plot(ax, summary: TrendSummary):
+        centers = (HFD_BINS[:-1] + HFD_BINS[1:]) / 2
+        for filter_name in sorted(summary.hfd_histograms):
+            histogram = summary.hfd_histograms[filter_name]
+            total = histogram.sum()
+            if not total:
+                continue
+            median = centers[np.searchsorted(np.cumsum(histogram), total / 2)]
+            ax.step(centers, histogram / total, where='mid', linewidth=2,
+                    label=f'{filter_name} (median {median:.2f}, n={total})')
+        ax.set_xlabel('HFD')
+        ax.set_ylabel('Fraction of Frames')
+        ax.set_title('HFD Distribution by Filter')
+        if summary.hfd_histograms:
+            ax.legend()
+
+    def guiding_plot(self, ax_nights, ax_distribution, summary: TrendSummary):
+        nights = sorted(summary.guide_by_night)
+        night_dates = [datetime.strptime(night, '%Y-%m-%d') for night in nights]
+        rms_x = [math.sqrt(summary.guide_by_night[night][1] / summary.guide_by_night[night][0]) for night in nights]
+        rms_y = [math.sqrt(summary.guide_by_night[night][2] / summary.guide_by_night[night][0]) for night in nights]
+        rms_total = [math.hypot(x, y) for x, y in zip(rms_x, rms_y)]
+        ax_nights.plot(night_dates, rms_x, color='#F44336', marker='o', label='RA')
+        ax_nights.plot(night_dates, rms_y, color='#2196F3', marker='o', label='DEC')
+        ax_nights.plot(night_dates, rms_total, color='#66BB6A', marker='o', linewidth=3, label='Total')
+        ax_nights.set_ylabel('RMS (px)')
+        ax_nights.set_title('Guiding RMS by Night')
+        ax_nights.legend()
+        ax_nights.tick_params(axis='x', labelrotation=30)
+
+        # Hours with only a few guide steps are usually a settle or a meridian flip
+        hourly_rms = [math.sqrt(sum_squared / count) for count, sum_squared in summary.guide_by_hour.values()
+                      if count >= 30]
+        if hourly_rms:
+            ax_distribution.hist(hourly_rms, bins=40, color='#26C6DA')
+            ax_distribution.axvline(float(np.median(hourly_rms)), color='#FF9800', linewidth=3)
+        ax_distribution.set_xlabel('Hourly Total RMS (px)')
+        ax_distribution.set_ylabel('Hours')
+        ax_distribution.set_title('Guiding RMS Distribution')
+
+    @staticmethod
+    def focus_drift_plot(ax, summary: TrendSummary):
+        focus_results = np.array(summary.focus_results, dtype=float).reshape(-1, 5)
+        for filter_index in np.unique(focus_results[:, 1]):
+            rows = focus_results[focus_results[:, 1] == filter_index]
+            temperatures = rows[:, 3]
+            positions = rows[:, 2]
+            label = f'Filter {int(filter_index)}'
+            if len(rows) >= 2 and np.ptp(temperatures) > 0:
+                slope, intercept = np.polyfit(temperatures, positions, 1)
+                line_x = np.array([temperatures.min(), temperatures.max()])
+                lines = ax.plot(line_x, slope * line_x + intercept, linewidth=2)
+                ax.scatter(temperatures, positions, color=lines[0].get_color(), s=30)
+                label += f' ({slope:.1f} steps/°C)'
+                lines[0].set_label(label)
+            else:
+                ax.scatter(temperatures, positions, s=30, label=label)
+        ax.set_xlabel('Focuser Temperature (°C)')
+        ax.set_ylabel('Focus Position')
+        ax.set_title('Autofocus Drift against Temperature')
+        if len(focus_results):
+            ax.legend()
+
+    def oom_plot(self, ax, summary: TrendSummary):
+        weeks = defaultdict(int)
+        for timestamp in summary.oom_timestamps:
+            local_time = datetime.fromtimestamp(timestamp, tz=self.timezone)
+            monday = (local_time - timedelta(days=local_time.weekday())).date()
+            weeks[monday] += 1
+        if summary.guide_by_night:
+            # Show weeks without any OOM too, as long as there are logs for them
+            first_night = datetime.strptime(min(summary.guide_by_night), '%Y-%m-%d').date()
+            last_night = datetime.strptime(max(summary.guide_by_night), '%Y-%m-%d').date()
+            monday = first_night - timedelta(days=first_night.weekday())
+            while monday <= last_night:
+                weeks.setdefault(monday, 0)
+                monday += timedelta(days=7)
+        mondays = sorted(weeks)
+        ax.bar([monday.strftime('%m/%d') for monday in mondays], [weeks[monday] for monday in mondays],
+               color='#FF6D00')
+        ax.set_ylabel('OOM Events')
+        ax.set_title(f'Out of Memory Events by Week (total {len(summary.oom_timestamps)})')
+        ax.tick_params(axis='x', labelrotation=45)
+
+    def plot(self, summary: TrendSummary, output_filename: str):
+        fig, axes_grid = plt.subplots(nrows=3, ncols=2, figsize=(24, 24), constrained_layout=True)
+        self.integration_plot(axes_grid[0][0], summary)
+        self.hfd_plot(axes_grid[0][1], summary)
+        self.guiding_plot(axes_grid[1][0], axes_grid[1][1], summary)
+        self.focus_drift_plot(axes_grid[2][0], summary)
+        self.oom_plot(axes_grid[2][1], summary)
+        fig.suptitle(f'Trend Report: {len(summary.guide_by_night)} nights, {summary.file_count} log files',
+                     fontsize=24)
+        fig.savefig(output_filename)
+        plt.close(fig)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a multi-night trend report from recorded voyager bot logs.')
+    parser.add_argument('log_folder', nargs='?', default='data/logs/', help='Folder of *_voyager_bot_log.txt files')
+    parser.add_argument('-o', '--output', default='trend_report.png', help='Report image filename')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('-t', '--timezone', default='UTC', help='Timezone used to split nights, like America/New_York')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = summarize_log_folder(log_folder=args.log_folder, timezone_name=args.timezone, workers=args.workers)
+    print(f'Summarized {summary.line_count} lines in {summary.file_count} files '
+          f'in {time.perf_counter() - start:.1f}s')
+    TrendReportPlotter(timezone_name=args.timezone).plot(summary=summary, output_filename=args.output)
+    print(f'Report written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
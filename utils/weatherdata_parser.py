@@ -1,16 +1,21 @@
 
 
+from utils.file_watcher import FileWatcher, shared_file_watcher
+
+
 class WeatherDataParser:
     def __init__(self, filename):
         self.filename = filename
         self.weather_data_dict = {}
+        self.watcher = shared_file_watcher(file_path=filename, parser=WeatherDataParser.parse_string,
+                                           default={})  # type: FileWatcher[dict]
 
     def update(self):
-            with open(self.filename, 'r') as f:
-                content = f.read()
-                self.weather_data_dict = self.parse_string(content)
-    
-    def parse_string(self, input_string):
+        # Only parsed again when the file changes, a partially written file keeps the last good data
+        self.weather_data_dict = self.watcher.snapshot()
+
+    @staticmethod
+    def parse_string(input_string):
         fields = input_string.split()
         parsed_dict = {
             'file_write_date': fields[0],
@@ -1,9 +1,10 @@
 #!/bin/env python3
-from collections import defaultdict
+from collections import defaultdict, Counter
 from typing import Dict
 
 from console import main_console
 from curse_manager import CursesManager
+from data_structure.log_message_info import LogMessageInfo
 from destination.console_manager import ConsoleManager
 from destination.html_reporter import HTMLReporter
 from destination.rich_console_manager import RichConsoleManager
@@ -14,15 +15,20 @@ from event_handlers.log_event_handler import LogEventHandler
 from event_handlers.misc_event_handler import MiscellaneousEventHandler
 from event_handlers.shot_running_event_handler import ShotRunningEventHandler
 from event_handlers.system_status_event_handler import SystemStatusEventHandler
+from event_handlers.telemetry_event_handler import TelemetryEventHandler
 from event_handlers.voyager_event_handler import VoyagerEventHandler
 from event_handlers.weather_safety_event_handler import WeatherSafetyHandler
 from event_handlers.remote_action_handler import RemoteActionHandler
+from event_emitter import ee
+from event_names import BotEvent
+from state_bus import state_bus
 from utils.localization import get_translated_text as _
 
 
 class VoyagerClient:
     def __init__(self, config=None):
         self.config = config
+        self.console_manager = None
 
         if self.config.html_report_enabled:
             self.html_reporter = HTMLReporter(config=config)
@@ -32,6 +38,7 @@ class VoyagerClient:
         if self.config.console_config.console_type == 'BASIC':
             curses_manager = CursesManager()
             self.console_manager = ConsoleManager(config=config, curses_manager=curses_manager)
+            self.console_manager.run()
         elif self.config.console_config.console_type == 'FULL':
             self.console_manager = RichConsoleManager(config=config)
             self.console_manager.run()
@@ -41,6 +48,12 @@ class VoyagerClient:
         # Event handlers for business logic:
         self.handler_dict = defaultdict(set)
         self.greedy_handler_set = set()
+        # Event names that at least one handler cares about; everything else is dropped right after probing.
+        self.active_event_names = frozenset()
+
+        # Cheap counters, they also track messages which are dropped without being parsed.
+        self.message_counter = 0
+        self.dropped_message_counter = Counter()
 
         self.register_event_handler(MiscellaneousEventHandler(config=config))
         self.register_event_handler(GiantEventHandler(config=config))
@@ -50,8 +63,47 @@ class VoyagerClient:
         self.register_event_handler(SystemStatusEventHandler(config=config))
         self.register_event_handler(ShotRunningEventHandler(config=config))
         self.register_event_handler(RemoteActionHandler(config=config))
+        if hasattr(config, 'telemetry_database') and config.telemetry_database:
+            self.register_event_handler(TelemetryEventHandler(config=config))
+
+        self.report_active_event_names()
+
+    def report_active_event_names(self):
+        if self.greedy_handler_set:
+            active_events_string = _('all events')
+        else:
+            active_events_string = ', '.join(sorted(self.active_event_names))
+        status_message = _('Listening to Voyager events: {}').format(active_events_string)
+        ee.emit(BotEvent.APPEND_LOG.name, log=LogMessageInfo(type='INFO', type_emoji='ℹ', message=status_message))
+        if not self.console_manager:
+            main_console.print(status_message)
+
+    def is_interested_in(self, event_name: str) -> bool:
+        """
+        :return: Whether any registered handler wants to process events with the given name.
+        """
+        return bool(self.greedy_handler_set) or event_name in self.active_event_names
+
+    def drop_message(self, event_name: str):
+        """Records a message that no handler is interested in, without parsing it."""
+        self.message_counter += 1
+        self.dropped_message_counter[event_name] += 1
+        state_bus.publish(BotEvent.UPDATE_MESSAGE_COUNTER.name, factory=self.message_counter_snapshot)
+
+    def dropped_message_count(self) -> int:
+        return sum(self.dropped_message_counter.values())
+
+    def message_counter_snapshot(self) -> Dict[str, int]:
+        return {'counter_number': self.message_counter, 'dropped_counter_number': self.dropped_message_count()}
 
     def parse_message(self, event_name: str, message: Dict):
+        if not self.is_interested_in(event_name):
+            self.drop_message(event_name)
+            return
+
+        self.message_counter += 1
+        state_bus.publish(BotEvent.UPDATE_MESSAGE_COUNTER.name, factory=self.message_counter_snapshot)
+
         if event_name in self.handler_dict:
             for handler in self.handler_dict[event_name]:
                 try:
@@ -77,3 +129,4 @@ class VoyagerClient:
                 self.handler_dict[v].add(event_handler)
         if event_handler.interested_in_all_events():
             self.greedy_handler_set.add(event_handler)
+        self.active_event_names = frozenset(self.handler_dict.keys())